@@ -0,0 +1,91 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+"""
+Times the in-process layout engines of pysage3.utils.layout against the graphviz
+fdp path on synthetic boards, and checks their output for overlaps.
+
+    python bench_layout.py
+    python bench_layout.py --sizes 100 1000 --graphviz-max 1000
+
+The graphviz runs need the fdp binary on the PATH and are skipped otherwise.
+"""
+
+import argparse
+import shutil
+import time
+
+import numpy as np
+
+from pysage3.utils.layout import Layout, extent, overlaps
+
+APP_TYPES = ["Stickie", "ImageViewer", "PDFViewer", "WebpageLink", "SageCell", "CSVViewer", "VideoViewer", "Chat"]
+
+VIEWPORT = ((0.0, 0.0), (3840.0, 2160.0))
+
+
+def synthetic_board(n, seed=0):
+    rng = np.random.default_rng(seed)
+    types = rng.choice(APP_TYPES, n)
+    # mostly small apps, a few large ones, plus the buffer reorganize_layout adds
+    dims = rng.lognormal(mean=6.2, sigma=0.4, size=(n, 2)).round() + 100
+    app_dims = {f"app-{i}": (float(w), float(h)) for i, (w, h) in enumerate(dims)}
+    app_to_type = {f"app-{i}": str(t) for i, t in enumerate(types)}
+    return app_dims, app_to_type
+
+
+def run(engine, app_dims, app_to_type, repeat):
+    best = None
+    for _ in range(repeat):
+        layout = Layout(app_dims, *VIEWPORT)
+        start = time.perf_counter()
+        layout.run(engine, app_to_type)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, layout
+
+
+def quality(layout):
+    ids = list(layout._layout_dict.keys())
+    offsets = np.array([layout._layout_dict[x] for x in ids])
+    dims = np.array([layout.app_dims[x] for x in ids])
+    width, height = extent(offsets, dims)
+    fill = (dims[:, 0] * dims[:, 1]).sum() / (width * height)
+    return overlaps(offsets, dims), fill
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--engines", nargs="+", default=["grouped", "shelf", "grid", "force"])
+    parser.add_argument("--graphviz-max", type=int, default=10000, help="largest board given to fdp")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    has_fdp = shutil.which("fdp") is not None
+    if not has_fdp:
+        print("fdp not installed, skipping the graphviz runs")
+
+    for n in args.sizes:
+        app_dims, app_to_type = synthetic_board(n)
+        print(f"\n{n} apps")
+        baseline = None
+        if has_fdp and n <= args.graphviz_max:
+            baseline, layout = run("graphviz", app_dims, app_to_type, 1)
+            hits, fill = quality(layout)
+            print(f"graphviz fdp  {baseline * 1000:10.1f} ms  overlaps {hits:6d}  fill {fill:.2f}")
+        for engine in args.engines:
+            repeat = 1 if engine == "force" and n > 1000 else args.repeat
+            elapsed, layout = run(engine, app_dims, app_to_type, repeat)
+            hits, fill = quality(layout)
+            speedup = f"  x{baseline / elapsed:.0f}" if baseline else ""
+            print(f"{engine:<13} {elapsed * 1000:10.1f} ms  overlaps {hits:6d}  fill {fill:.2f}{speedup}")
+
+
+if __name__ == "__main__":
+    main()
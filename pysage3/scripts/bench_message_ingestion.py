@@ -0,0 +1,133 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+"""
+Replays a stream of websocket batch-update messages through the previous ingestion loop
+(json.loads, one message copy and a linear updates scan per doc) and through
+pysage3.utils.messages (fast decoder, one id -> updates map per event).
+
+    python bench_message_ingestion.py                      # synthetic stream
+    python bench_message_ingestion.py --record stream.ndjson
+
+A recorded stream is one raw websocket message per line.
+"""
+
+import argparse
+import json
+import time
+import uuid
+
+from pysage3.utils import messages
+from pysage3.utils.messages import decode_message, iter_event_docs
+
+
+def synthetic_stream(n_messages, docs_per_message):
+    stream = []
+    for i in range(n_messages):
+        docs, updates = [], []
+        for j in range(docs_per_message):
+            app_id = str(uuid.uuid4())
+            docs.append(
+                {
+                    "_id": app_id,
+                    "_createdAt": 0,
+                    "_updatedAt": i,
+                    "_createdBy": "user",
+                    "_updatedBy": "user",
+                    "data": {
+                        "roomId": "room",
+                        "boardId": "board",
+                        "type": "Stickie",
+                        "position": {"x": i + j, "y": j, "z": 0},
+                        "size": {"width": 400, "height": 400, "depth": 0},
+                        "rotation": {"x": 0, "y": 0, "z": 0},
+                        "raised": False,
+                        "state": {"text": "x" * 200, "color": "yellow", "fontSize": 36},
+                    },
+                }
+            )
+            updates.append({"id": app_id, "updates": {"position.x": i + j}})
+        event = {"type": "UPDATE", "col": "APPS", "doc": docs, "updates": updates}
+        stream.append(json.dumps({"id": str(uuid.uuid4()), "event": event}))
+    return stream
+
+
+def legacy_ingest(msg, handle):
+    # the loop PySage3.__process_messages and SAGEProxy.process_messages used to run
+    message = json.loads(msg)
+    for doc in message["event"]["doc"]:
+        msg = message.copy()
+        msg["event"]["doc"] = doc
+        collection = msg["event"]["col"]
+        doc = msg["event"]["doc"]
+        app_id = doc["_id"]
+        msg_updates = {}
+        for u in msg["event"]["updates"]:
+            if u["id"] == app_id:
+                msg_updates = u["updates"]
+                break
+        handle(collection, doc, msg_updates)
+
+
+def fast_ingest(msg, handle):
+    event = decode_message(msg)["event"]
+    collection = event["col"]
+    for doc, updates in iter_event_docs(event):
+        handle(collection, doc, updates)
+
+
+def replay(ingest, stream, repeat):
+    seen = []
+
+    def handle(collection, doc, updates):
+        seen.append(len(updates))
+
+    best = None
+    for _ in range(repeat):
+        seen.clear()
+        start = time.perf_counter()
+        for msg in stream:
+            ingest(msg, handle)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(seen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--record", help="file with one raw websocket message per line")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--docs", type=int, default=500, help="docs per synthetic message")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.record:
+        with open(args.record) as f:
+            stream = [line for line in f if line.strip()]
+    else:
+        stream = synthetic_stream(args.messages, args.docs)
+
+    legacy, n_legacy = replay(legacy_ingest, stream, args.repeat)
+    print(f"{len(stream)} messages, {n_legacy} docs")
+    print(f"legacy   json.loads + copy + scan   {legacy * 1000:9.1f} ms")
+
+    messages.set_json_decoder(json.loads)
+    fast_json, _ = replay(fast_ingest, stream, args.repeat)
+    print(f"fast     json.loads + id map        {fast_json * 1000:9.1f} ms  x{legacy / fast_json:.1f}")
+
+    messages.set_json_decoder()
+    if messages._loads is not json.loads:
+        fast, n_fast = replay(fast_ingest, stream, args.repeat)
+        assert n_fast == n_legacy
+        print(f"fast     orjson + id map            {fast * 1000:9.1f} ms  x{legacy / fast:.1f}")
+    else:
+        print("orjson not installed, skipping the orjson run")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+"""
+Times the startup population of the pysage3 mirror against a synthetic server: the
+sequential listing with every SmartBit built up front, against the concurrent listing
+with the apps kept as documents until first use, and a restart from an on-disk snapshot
+that only fetches the documents changed since and reads the deletions from the server's
+tombstones.
+
+    python bench_startup.py
+    python bench_startup.py --apps 50000 --latency 0.2 --changes 10 1000
+
+The fake server answers each listing after `--latency` seconds plus the transfer of its
+JSON payload at `--bandwidth` MB/s; the payload is decoded on every call, like the REST
+client does.
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from pysage3.smartbits.smartbit import SmartBit
+from pysage3.statestore import StateStore, fetch_collections
+from pysage3.utils.snapshot import MirrorSnapshot
+
+
+def _app_state(app_type, rng):
+    if app_type == "Stickie":
+        return {"text": f"note {rng.random():.6f}", "color": rng.choice(["yellow", "blue", "green"])}
+    if app_type == "ImageViewer":
+        return {"assetid": str(uuid.uuid4()), "annotations": False, "boxes": []}
+    if app_type in ("PDFViewer", "CSVViewer"):
+        return {"assetid": str(uuid.uuid4())}
+    return {"url": "https://example.org", "meta": {"title": "", "description": "", "image": ""}}
+
+
+def synthetic_server(n_apps, n_rooms=4, boards_per_room=5, seed=0):
+    rng = random.Random(seed)
+    rooms, boards, apps = [], [], []
+    for r in range(n_rooms):
+        room_id = f"room-{r}"
+        rooms.append(
+            {
+                "_id": room_id,
+                "data": {
+                    "name": room_id,
+                    "description": "",
+                    "color": "red",
+                    "ownerId": "owner",
+                    "isPrivate": False,
+                    "isListed": True,
+                },
+            }
+        )
+        for b in range(boards_per_room):
+            boards.append(
+                {
+                    "_id": f"{room_id}-board-{b}",
+                    "data": {
+                        "name": f"board {b}",
+                        "description": "",
+                        "color": "blue",
+                        "ownerId": "owner",
+                        "roomId": room_id,
+                    },
+                }
+            )
+    types = ["Stickie", "ImageViewer", "PDFViewer", "CSVViewer", "WebpageLink"]
+    for i in range(n_apps):
+        board = boards[i % len(boards)]
+        app_type = types[i % len(types)]
+        apps.append(
+            {
+                "_id": str(uuid.uuid4()),
+                "_createdAt": 0,
+                # one update a second
+                "_updatedAt": 1000 * i,
+                "data": {
+                    "title": f"app {i}",
+                    "roomId": board["data"]["roomId"],
+                    "boardId": board["_id"],
+                    "position": {"x": rng.uniform(0, 3e6), "y": rng.uniform(0, 3e6), "z": 0},
+                    "size": {"width": rng.uniform(200, 800), "height": rng.uniform(200, 800), "depth": 0},
+                    "rotation": {"x": 0, "y": 0, "z": 0},
+                    "type": app_type,
+                    "state": _app_state(app_type, rng),
+                    "raised": False,
+                    "dragging": False,
+                },
+            }
+        )
+    return rooms, boards, apps
+
+
+class FakeServer:
+    """The listing methods of SageCommunication, each taking `latency` seconds"""
+
+    def __init__(self, rooms, boards, apps, latency, bandwidth):
+        self.latency = latency
+        self.bandwidth = bandwidth * 1e6
+        self.docs = {"rooms": rooms, "boards": boards, "apps": apps, "assets": []}
+        self.payloads = {k: json.dumps(v) for k, v in self.docs.items()}
+        # route -> [(deletion time, id)]
+        self.tombstones = {}
+        self.puts = 0
+
+    def touch(self, n, updated_at):
+        """Moves n apps, as done while a client is down"""
+        for doc in self.docs["apps"][:n]:
+            doc["data"]["position"]["x"] += 10
+            doc["_updatedAt"] = updated_at
+        self.payloads["apps"] = json.dumps(self.docs["apps"])
+
+    def delete(self, n, deleted_at):
+        """Deletes n apps, as done while a client is down"""
+        for doc in self.docs["apps"][-n:] if n else []:
+            self.tombstones.setdefault("get_apps", []).append((deleted_at, doc["_id"]))
+        self.docs["apps"] = self.docs["apps"][: len(self.docs["apps"]) - n]
+        self.payloads["apps"] = json.dumps(self.docs["apps"])
+
+    def get_deleted(self, route, deleted_since):
+        ids = [x for t, x in self.tombstones.get(route, []) if t > deleted_since]
+        time.sleep(self.latency + len(json.dumps(ids)) / self.bandwidth)
+        return ids, True
+
+    def _list(self, name, updated_since=None):
+        payload = self.payloads[name]
+        if updated_since is not None:
+            # the server filters, only the changes are sent
+            changed = [x for x in self.docs[name] if x.get("_updatedAt", 0) > updated_since]
+            payload = json.dumps(changed)
+        time.sleep(self.latency + len(payload) / self.bandwidth)
+        return json.loads(payload)
+
+    def get_rooms(self):
+        return self._list("rooms")
+
+    def get_boards(self, updated_since=None):
+        return self._list("boards", updated_since)
+
+    def get_apps(self, updated_since=None):
+        return self._list("apps", updated_since)
+
+    def get_assets(self, updated_since=None):
+        return self._list("assets", updated_since)
+
+    # SmartBit.send_updates, counted to catch PUTs at startup
+    def send_app_update(self, app_id, data):
+        self.puts += 1
+
+    def send_app_batch_update(self, data):
+        self.puts += 1
+
+
+def populate_sequential(server, store):
+    for collection, fetch in (
+        ("ROOMS", server.get_rooms),
+        ("BOARDS", server.get_boards),
+        ("APPS", server.get_apps),
+        ("ASSETS", server.get_assets),
+    ):
+        for doc in fetch():
+            store.handle_create(collection, doc)
+
+
+def populate_concurrent(server, store):
+    fetched = fetch_collections(server)
+    for collection in ("ROOMS", "BOARDS", "APPS", "ASSETS"):
+        for doc in fetched[collection].result():
+            store.handle_create(collection, doc)
+
+
+def restart_from_snapshot(server, path):
+    """What PySage3 does on restart with a snapshot, the pruning waited for"""
+    store = StateStore(lazy=True)
+    snapshot = MirrorSnapshot(path, flush_interval=None)
+    since = store.restore(snapshot)
+    fetched = fetch_collections(server, updated_since=since)
+    for collection in ("ROOMS", "BOARDS", "APPS", "ASSETS"):
+        for doc in fetched[collection].result():
+            store.upsert(collection, doc)
+    store.prune_deleted(server, since)
+    snapshot.close()
+    return store
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--apps", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per listing request")
+    parser.add_argument("--bandwidth", type=float, default=20, help="MB/s from the server")
+    parser.add_argument(
+        "--changes", type=int, nargs="+", default=[0, 100, 10000], help="apps changed before a restart"
+    )
+    parser.add_argument("--deletions", type=int, default=100, help="apps deleted before each restart")
+    args = parser.parse_args()
+
+    server = FakeServer(*synthetic_server(args.apps), args.latency, args.bandwidth)
+    SmartBit._s3_comm = server
+    print(f"{args.apps} apps, {args.latency * 1000:.0f} ms per listing, {args.bandwidth:g} MB/s")
+
+    for name, populate, lazy in (
+        ("eager, sequential", populate_sequential, False),
+        ("eager, concurrent", populate_concurrent, False),
+        ("lazy, concurrent", populate_concurrent, True),
+    ):
+        server.puts = 0
+        store = StateStore(lazy=lazy)
+        elapsed, _ = timed(populate, server, store)
+        print(f"{name:20} startup {elapsed * 1000:8.1f} ms  {server.puts} PUTs")
+
+    # the lazy store pays per app, when it is first used
+    app_ids = list(store.apps.keys())
+    elapsed, _ = timed(store.get_smartbit, app_ids[0])
+    print(f"{'first access':20} {elapsed * 1000:16.3f} ms")
+    doc = store.apps[app_ids[1]]
+    elapsed, _ = timed(store.handle_update, "APPS", doc, {"position.x": 10.0})
+    print(f"{'first update':20} {elapsed * 1000:16.3f} ms")
+    elapsed, _ = timed(store.get_smartbits_by_type, "Stickie")
+    print(f"{'all the Stickies':20} {elapsed * 1000:16.1f} ms")
+    elapsed, _ = timed(store.all_smartbits)
+    print(f"{'everything else':20} {elapsed * 1000:16.1f} ms")
+
+    # restarts: the snapshot is written by a first run, then the server changes
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "mirror.db")
+        snapshot = MirrorSnapshot(path, flush_interval=None)
+        store = StateStore(lazy=True)
+        store.snapshot = snapshot
+        populate_concurrent(server, store)
+        elapsed, _ = timed(snapshot.close)
+        print(f"{'snapshot write':20} {elapsed * 1000:16.1f} ms  {os.path.getsize(path) / 1e6:.1f} MB")
+        updated_at = 1000 * args.apps
+        for n in args.changes:
+            updated_at += 10**6
+            server.touch(n, updated_at)
+            server.delete(args.deletions, updated_at)
+            elapsed, store = timed(restart_from_snapshot, server, path)
+            assert len(store.ids("APPS")) == len(server.docs["apps"])
+            print(f"{f'restart, {n} changed':20} {elapsed * 1000:16.1f} ms  {args.deletions} deleted")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,14 +7,19 @@
 # -----------------------------------------------------------------------------
 
 from pysage3.client import PySage3
+from pysage3.async_client import AsyncPySage3
 from pysage3.proxy import SAGEProxy
 from pysage3.utils.sage_communication import SageCommunication, AsyncSageCommunication
 from pysage3.smartbits.smartbit import SmartBit
+from pysage3.utils.update_batcher import batch_updates, set_update_window
 
 __all__ = [
     "PySage3",
+    "AsyncPySage3",
     "SAGEProxy",
     "SageCommunication",
     "AsyncSageCommunication",
     "SmartBit",
+    "batch_updates",
+    "set_update_window",
 ]
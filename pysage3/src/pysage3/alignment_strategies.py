@@ -1,121 +1,251 @@
 from pysage3.smartbits.smartbit import SmartBit
+from pysage3.utils.layout import grid_pack
+from pysage3.utils.update_batcher import batch_updates
 from typing import List
+from functools import wraps
 
+import numpy as np
 
-def get_app_geometry(smartbits: List[SmartBit] = None):
-    """function to get the left_x, right_x, """
-    left_x = min([smartbit.data.position.x for smartbit in smartbits])
-    right_x = max([smartbit.data.position.x + smartbit.data.size.width for smartbit in smartbits])
-    top_y = min([smartbit.data.position.y for smartbit in smartbits])
-    bottom_y = max([smartbit.data.position.y + smartbit.data.size.height for smartbit in smartbits])
-    return left_x, right_x, top_y, bottom_y
-
-def align_to_left(smartbits: List[SmartBit]):
-    left_x, _, _, _ = get_app_geometry(smartbits)
-    for smartbit in smartbits:
-        smartbit.data.position.x = left_x
-        smartbit.send_updates()
-
-
-def align_to_right(smartbits: List[SmartBit]):
-    _, right_x, _, _ = get_app_geometry(smartbits)
-    for smartbit in smartbits:
-        smartbit.data.position.x = right_x - smartbit.data.size.width
-        smartbit.send_updates()
-
-
-def align_col_center(smartbits: List[SmartBit]):
-    # Find the widest app
-    left_x, right_x, _, _ = get_app_geometry(smartbits)
-    center = (right_x - left_x) / 2
-
-    # Center the apps in the column based on the widest app
-    for smartbit in smartbits:
-        smartbit.data.position.x -= (smartbit.data.position.x - center) + \
-                                    ((smartbit.data.size.width / 2) - smartbit.data.position.x)
-        smartbit.send_updates()
-
-
-def align_row_center(smartbits: List[SmartBit]):
-    _, _, top_y, bottom_y = get_app_geometry(smartbits)
-    center = (bottom_y - top_y) / 2
-    # Center the apps in the row based on the tallest app
-    for smartbit in smartbits:
-        smartbit.data.position.y -= (smartbit.data.position.y - center) + \
-                                    ((smartbit.data.size.height / 2) - smartbit.data.position.y)
-        smartbit.send_updates()
-
-def align_stack(smartbits: List[SmartBit], gap: int = 20):
-    left_x, _, top_y, _ = get_app_geometry(smartbits)
-    for i, smartbit in enumerate(smartbits):
-        smartbit.data.position.y = top_y + i * gap
-        smartbit.data.position.x = left_x + i * gap
-        smartbit.data.raised = True
-    for i, smartbit in enumerate(smartbits):
-        smartbit.data.raised = True
-        smartbit.send_updates()
-        smartbit.data.raised = False
-        smartbit.send_updates()
-
-
-def align_to_bottom(smartbits: List[SmartBit]):
-    _, _, _, bottom_y = get_app_geometry(smartbits)
-    for smartbit in smartbits:
-        smartbit.data.position.y = bottom_y - smartbit.data.size.height
-        smartbit.send_updates()
-
-
-def align_by_row(smartbits: List[SmartBit], num_rows: int = 1, gap: int = 20) -> None:
-    left_x, _, top_y, _ = get_app_geometry(smartbits)
-    for i, smartbit in enumerate(smartbits):
-        row = i % num_rows
-        col = i // num_rows
-        # The first app is aligned to the top left corner
-        if i == 0:
-            smartbit.data.position.y = top_y
-            smartbit.data.position.x = left_x
-        else:
-            smartbit.data.position.y = top_y + row * (smartbit.data.size.height + gap)
-            smartbit.data.position.x = left_x + col * (smartbit.data.size.width + gap)
-    for smartbit in smartbits:
-        smartbit.send_updates()
-
-def align_by_col(smartbits: List[SmartBit], num_cols: int = 1, gap: int = 20) -> None:
-    sorted_smartbits = sorted(smartbits, key=lambda sb: (sb.data.size.height), reverse=True)
-
-    # Calculate the width of each column
-    column_width = max(sb.data.size.width for sb in smartbits) + gap
-
-    # Starting position for the first column
-    x = smartbits[0].data.position.x + smartbits[0].data.size.width / 2
-    y = smartbits[0].data.position.y
-
-    # Iterate over the sorted smartbits
-    for smartbit in sorted_smartbits:
-        # Set the position of the current smartbit in the current column
-        smartbit.data.position.x = x
-        smartbit.data.position.y = y
-
-        # Update the starting position for the next column
-        x += column_width
-
-        # If the number of columns exceeds the number of smartbits, wrap to the next row
-        if x >= smartbits[0].data.position.x + num_cols * column_width:
-            x = smartbits[0].data.position.x
-            y += smartbit.data.size.height + gap
-
-    # Adjust the positions of the smartbits to align to the left within each column
-    print("Getting ready to adjust positions")
-    for smartbit in smartbits:
-        smartbit.data.position.x -= smartbit.data.size.width / 2
-        smartbit.send_updates()
-
-
-def align_to_top(smartbits: List[SmartBit]):
-    _, _, top_y, _ = get_app_geometry(smartbits)
-    for smartbit in smartbits:
-        smartbit.data.position.y = top_y
-        smartbit.send_updates()
 
+def batched(_func):
+    """Sends all the updates made by an alignment with one batch PUT"""
 
+    @wraps(_func)
+    def wrapper(*args, **kwargs):
+        with batch_updates():
+            return _func(*args, **kwargs)
 
+    return wrapper
+
+
+def get_geometry_arrays(smartbits: List[SmartBit]):
+    """(xy, wh): (n, 2) arrays of the positions and sizes of the apps, read in one pass"""
+    rects = np.array(
+        [
+            (d.position.x, d.position.y, d.size.width, d.size.height)
+            for d in (smartbit.data for smartbit in smartbits)
+        ],
+        dtype=float,
+    ).reshape(-1, 4)
+    return rects[:, :2], rects[:, 2:]
+
+
+def get_app_geometry(smartbits: List[SmartBit] = None, geometry=None):
+    """function to get the left_x, right_x, top_y, bottom_y of the apps"""
+    xy, wh = geometry if geometry is not None else get_geometry_arrays(smartbits)
+    left_x, top_y = xy.min(axis=0)
+    right_x, bottom_y = (xy + wh).max(axis=0)
+    return float(left_x), float(right_x), float(top_y), float(bottom_y)
+
+
+# The alignments as array operations: (xy, wh) -> new xy
+
+
+def left_positions(xy, wh):
+    out = xy.copy()
+    out[:, 0] = xy[:, 0].min()
+    return out
+
+
+def right_positions(xy, wh):
+    out = xy.copy()
+    out[:, 0] = (xy[:, 0] + wh[:, 0]).max() - wh[:, 0]
+    return out
+
+
+def top_positions(xy, wh):
+    out = xy.copy()
+    out[:, 1] = xy[:, 1].min()
+    return out
+
+
+def bottom_positions(xy, wh):
+    out = xy.copy()
+    out[:, 1] = (xy[:, 1] + wh[:, 1]).max() - wh[:, 1]
+    return out
+
+
+def col_center_positions(xy, wh):
+    out = xy.copy()
+    center = (xy[:, 0].min() + (xy[:, 0] + wh[:, 0]).max()) / 2
+    out[:, 0] = center - wh[:, 0] / 2
+    return out
+
+
+def row_center_positions(xy, wh):
+    out = xy.copy()
+    center = (xy[:, 1].min() + (xy[:, 1] + wh[:, 1]).max()) / 2
+    out[:, 1] = center - wh[:, 1] / 2
+    return out
+
+
+def row_positions(xy, wh, num_rows=1, gap=20):
+    """Apps on num_rows rows, filled column by column, from the top-left corner"""
+    # a column-major grid is the row-major grid of the transposed sizes
+    offsets = grid_pack(wh[:, ::-1], cols=num_rows, gap=gap)[:, ::-1]
+    return offsets + xy.min(axis=0)
+
+
+def col_positions(xy, wh, num_cols=1, gap=20):
+    """Apps by decreasing height on num_cols columns as wide as the widest app, centered in them"""
+    order = np.argsort(-wh[:, 1], kind="stable")
+    widest = wh[:, 0].max()
+    cells = np.column_stack((np.full(len(wh), widest), wh[order, 1]))
+    offsets = np.empty_like(xy)
+    offsets[order] = grid_pack(cells, cols=num_cols, gap=gap)
+    offsets[:, 0] += (widest - wh[:, 0]) / 2
+    return offsets + xy.min(axis=0)
+
+
+def grid_positions(xy, wh, num_cols=None, gap=20):
+    """Apps on a grid in the given order, num_cols defaulting to a square grid"""
+    return grid_pack(wh, cols=num_cols, gap=gap) + xy.min(axis=0)
+
+
+def stack_positions(xy, wh, gap=20):
+    steps = np.arange(len(xy), dtype=float)[:, None] * gap
+    return xy.min(axis=0) + steps
+
+
+def distribute_positions(xy, wh, axis=0):
+    """
+    Same space between consecutive apps along an axis (0: x, 1: y), the first and the
+    last apps staying in place
+    """
+    out = xy.copy()
+    if len(xy) < 3:
+        return out
+    order = np.argsort(xy[:, axis], kind="stable")
+    sizes = wh[order, axis]
+    start = xy[order[0], axis]
+    end = xy[order[-1], axis] + sizes[-1]
+    space = (end - start - sizes.sum()) / (len(xy) - 1)
+    out[order, axis] = start + np.concatenate(([0.0], np.cumsum(sizes + space)[:-1]))
+    return out
+
+
+def write_positions(smartbits: List[SmartBit], xy, old_xy=None, extra=None):
+    """
+    Sets the new positions on the smartbits and queues them in the current batch (one
+    batch PUT). Without `extra`, apps that don't move (old_xy) are left out.
+
+    :param extra: updates sent along with the position of every app, e.g. {"raised": True}
+    """
+    with batch_updates() as batch:
+        moved = None if old_xy is None or extra is not None else (xy != old_xy).any(axis=1)
+        for i, (smartbit, (x, y)) in enumerate(zip(smartbits, xy.tolist())):
+            if moved is not None and not moved[i]:
+                continue
+            position = smartbit.data.position
+            # the batch carries the update: don't mark the fields as touched
+            object.__setattr__(position, "x", x)
+            object.__setattr__(position, "y", y)
+            updates = {"position.x": x, "position.y": y}
+            if extra:
+                updates.update(extra)
+            batch.add(smartbit.app_id, updates, smartbit._get_comm)
+
+
+def _apply(smartbits, positions, geometry=None, **kwargs):
+    if not smartbits:
+        return np.zeros((0, 2))
+    xy, wh = geometry if geometry is not None else get_geometry_arrays(smartbits)
+    new_xy = positions(xy, wh, **kwargs)
+    write_positions(smartbits, new_xy, xy)
+    return new_xy
+
+
+# Each alignment moves the apps with one batch PUT and returns their new (n, 2) positions.
+# `geometry` is the (xy, wh) of the apps when the caller already has it (board columns).
+
+
+def align_to_left(smartbits: List[SmartBit], geometry=None):
+    return _apply(smartbits, left_positions, geometry)
+
+
+def align_to_right(smartbits: List[SmartBit], geometry=None):
+    return _apply(smartbits, right_positions, geometry)
+
+
+def align_col_center(smartbits: List[SmartBit], geometry=None):
+    return _apply(smartbits, col_center_positions, geometry)
+
+
+def align_row_center(smartbits: List[SmartBit], geometry=None):
+    return _apply(smartbits, row_center_positions, geometry)
+
+
+def align_stack(smartbits: List[SmartBit], gap: int = 20, geometry=None):
+    if not smartbits:
+        return np.zeros((0, 2))
+    xy, wh = geometry if geometry is not None else get_geometry_arrays(smartbits)
+    new_xy = stack_positions(xy, wh, gap=gap)
+    # two batches: raise every app in stacking order, then lower them
+    with batch_updates() as batch:
+        write_positions(smartbits, new_xy, extra={"raised": True})
+        batch.flush()
+        for smartbit in smartbits:
+            object.__setattr__(smartbit.data, "raised", False)
+            batch.add(smartbit.app_id, {"raised": False}, smartbit._get_comm)
+    return new_xy
+
+
+def align_to_bottom(smartbits: List[SmartBit], geometry=None):
+    return _apply(smartbits, bottom_positions, geometry)
+
+
+def align_by_row(smartbits: List[SmartBit], num_rows: int = 1, gap: int = 20, geometry=None):
+    return _apply(smartbits, row_positions, geometry, num_rows=num_rows, gap=gap)
+
+
+def align_by_col(smartbits: List[SmartBit], num_cols: int = 1, gap: int = 20, geometry=None):
+    return _apply(smartbits, col_positions, geometry, num_cols=num_cols, gap=gap)
+
+
+def align_to_top(smartbits: List[SmartBit], geometry=None):
+    return _apply(smartbits, top_positions, geometry)
+
+
+def align_grid(smartbits: List[SmartBit], num_cols: int = None, gap: int = 20, geometry=None):
+    return _apply(smartbits, grid_positions, geometry, num_cols=num_cols, gap=gap)
+
+
+def distribute_horizontally(smartbits: List[SmartBit], geometry=None):
+    return _apply(smartbits, distribute_positions, geometry, axis=0)
+
+
+def distribute_vertically(smartbits: List[SmartBit], geometry=None):
+    return _apply(smartbits, distribute_positions, geometry, axis=1)
+
+
+def align_apps(smartbits: List[SmartBit], align_type: str, by_dim=None, gap=20, geometry=None):
+    """
+    Aligns the apps according to align_type
+
+    :param align_type: left, right, top, bottom, column, row, stack, grid,
+        distribute-horizontal or distribute-vertical
+    :param by_dim: number of columns (column, grid) or rows (row), by default 1 for
+        column and row, a square grid for grid
+    :return: the new (n, 2) positions, None for an unknown align_type
+    """
+    if align_type == "left":
+        return align_to_left(smartbits, geometry)
+    elif align_type == "right":
+        return align_to_right(smartbits, geometry)
+    elif align_type == "top":
+        return align_to_top(smartbits, geometry)
+    elif align_type == "bottom":
+        return align_to_bottom(smartbits, geometry)
+    elif align_type == "stack":
+        return align_stack(smartbits, gap, geometry)
+    elif align_type == "grid":
+        return align_grid(smartbits, by_dim, gap, geometry)
+    elif align_type == "distribute-horizontal":
+        return distribute_horizontally(smartbits, geometry)
+    elif align_type == "distribute-vertical":
+        return distribute_vertically(smartbits, geometry)
+    elif "column" in align_type:
+        return align_by_col(smartbits, by_dim or 1, gap, geometry)
+    elif "row" in align_type:
+        return align_by_row(smartbits, by_dim or 1, gap, geometry)
+    return None
@@ -0,0 +1,490 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+import asyncio
+import copy
+import uuid
+from typing import List
+
+from pysage3.smartbitfactory import SmartBitFactory
+from pysage3.smartbits.smartbit import SmartBit
+from pysage3.statestore import StateStore
+from pysage3.utils.async_sage_websocket import AsyncSageWebsocket
+from pysage3.utils.messages import decode_message, iter_event_docs
+from pysage3.utils.sage_communication import AsyncSageCommunication
+from pysage3.utils.update_batcher import batch_updates
+from pysage3.json_templates.templates import create_app_template
+from pysage3.alignment_strategies import align_apps
+
+
+class AsyncPySage3:
+    """
+    asyncio version of PySage3, for event-loop based services (FastAPI, ...).
+
+    It keeps the same StateStore mirror as PySage3, fed by an asyncio websocket, and every
+    helper that talks to the server is a coroutine. Local lookups (get_smartbit,
+    get_smartbits_by_type, ...) stay synchronous since they never leave the process.
+
+    Usage:
+        async with AsyncPySage3(conf, prod_type) as ps3:
+            apps = await ps3.get_apps(room_id)
+    or:
+        ps3 = await AsyncPySage3.create(conf, prod_type)
+        ...
+        await ps3.clean_up()
+
+    SmartBits in the mirror should be written through `send_updates` (or the update_*
+    helpers) rather than SmartBit.send_updates, which is blocking.
+    """
+
+    def __init__(self, conf, prod_type, mirror_reads=True, lazy=False):
+        """
+        :param mirror_reads: when True, read helpers answer from the local mirror once it
+            is synchronized, and only fall back to the REST API before that.
+        :param lazy: when True, apps are kept as documents and their SmartBit is only built
+            on first access or first update.
+        """
+        self.done_init = False
+        self.conf = conf
+        self.prod_type = prod_type
+        self.mirror_reads = mirror_reads
+        self.__MSG_METHODS = {
+            "CREATE": self.__handle_create,
+            "UPDATE": self.__handle_update,
+            "DELETE": self.__handle_delete,
+        }
+
+        self.store = StateStore(lazy=lazy)
+        # events received while the initial state loads, replayed once it is in place
+        self._early_messages = []
+        self.rooms = self.store.rooms
+        self.assets = self.store.assets
+        self.s3_comm = AsyncSageCommunication(self.conf, self.prod_type)
+        self.socket = AsyncSageWebsocket(
+            self.conf, self.prod_type, on_message_fn=self.__process_messages
+        )
+        self.room = None
+        self.board = None
+
+    @classmethod
+    async def create(cls, conf, prod_type, mirror_reads=True, lazy=False):
+        ps3 = cls(conf, prod_type, mirror_reads, lazy)
+        await ps3.start()
+        return ps3
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.clean_up()
+
+    async def start(self):
+        """Connects the websocket, subscribes, then loads the existing state"""
+        print("Configuring async ps3 client ... ")
+        await self.socket.connect()
+        await self.socket.subscribe(
+            ["/api/apps", "/api/rooms", "/api/boards", "/api/assets", "/api/insight"]
+        )
+        await self.s3_comm.get_configuration()
+        await self.__populate_existing()
+        early, self._early_messages = self._early_messages, None
+        for msg in early:
+            self.__apply_message(msg)
+        self.store.synchronized = True
+        self.done_init = True
+        print("Completed configuring async Sage3 Client")
+
+    async def __populate_existing(self):
+        # the collections are fetched concurrently, then applied parents first
+        rooms, boards, apps, assets, tags = await asyncio.gather(
+            self.s3_comm.get_rooms(),
+            self.s3_comm.get_boards(),
+            self.s3_comm.get_apps(),
+            self.s3_comm.get_assets(),
+            self.s3_comm.get_alltags(),
+            return_exceptions=True,
+        )
+        for collection, docs in (
+            ("ROOMS", rooms),
+            ("BOARDS", boards),
+            ("APPS", apps),
+            ("ASSETS", assets),
+        ):
+            if isinstance(docs, Exception):
+                raise docs
+            for doc in docs:
+                self.__handle_create(collection, doc)
+        try:
+            if isinstance(tags, Exception):
+                raise tags
+            if tags.is_success:
+                for insight_info in tags.json()["data"]:
+                    self.__handle_create("INSIGHT", insight_info)
+        except Exception as e:
+            print(f"Error during loading of tags {e}")
+
+    # Handle Create Messages
+    def __handle_create(self, collection, doc):
+        self.store.handle_create(collection, doc)
+
+    # Handle Update Messages
+    def __handle_update(self, collection, doc, updates):
+        self.store.handle_update(collection, doc, updates)
+
+    # Handle Delete Messages
+    def __handle_delete(self, collection, doc):
+        self.store.handle_delete(collection, doc)
+
+    def __process_messages(self, ws, msg):
+        if self._early_messages is not None:
+            self._early_messages.append(msg)
+        else:
+            self.__apply_message(msg)
+
+    def __apply_message(self, msg):
+        event = decode_message(msg)["event"]
+        collection = event["col"]
+        msg_type = event["type"]
+        for doc, updates in iter_event_docs(event):
+            if msg_type == "UPDATE":
+                self.__handle_update(collection, doc, updates)
+            elif msg_type in self.__MSG_METHODS:
+                self.__MSG_METHODS[msg_type](collection, doc)
+
+    def mirror_synchronized(self):
+        """True when reads can be served from the local mirror"""
+        return (
+            self.mirror_reads and self.store.synchronized and self.socket.connected
+        )
+
+    async def create_app(self, room_id, board_id, app_type, state, app=None):
+        try:
+            obj = copy.deepcopy(create_app_template)
+            if app:
+                obj.update(app)
+            obj["type"] = app_type
+            obj["roomId"] = room_id
+            obj["boardId"] = board_id
+            obj["state"].update(state)
+            if app_type not in SmartBitFactory.class_names:
+                raise Exception("Smartbit not supported in interactive mode")
+
+            # just try to create to see if it's going to raise an error
+            _ = SmartBitFactory.create_smartbit(
+                {
+                    "_id": str(uuid.uuid4()),
+                    "data": obj,
+                    "state": obj["state"],
+                }
+            )
+            return await self.s3_comm.create_app(obj)
+        except Exception as e:
+            print(f"Error during creation of app {e}")
+            return None
+
+    async def upload_file(self, room_id, filename, filedata):
+        try:
+            payload = {"room": room_id}
+            files = {"files": (filename, filedata)}
+            return await self.s3_comm.upload_file(files, payload)
+        except Exception as e:
+            print(f"Error during upload of file {e}")
+            return None
+
+    async def delete_app(self, app_id):
+        try:
+            return await self.s3_comm.delete_app(app_id)
+        except Exception as e:
+            print(f"Error during delete of app {e}")
+            return None
+
+    async def get_tags(self, app_id):
+        if self.mirror_synchronized():
+            return self.store.get_tags(app_id)
+        try:
+            res = await self.s3_comm.get_tags(app_id)
+            info = res.json()
+            if info["success"]:
+                return info["data"][0]["data"]["labels"]
+            return []
+        except Exception as e:
+            print(f"Error during getting tags {e}")
+            return []
+
+    async def update_tags(self, app_id, tags):
+        try:
+            return await self.s3_comm.update_tags(app_id, {"labels": tags})
+        except Exception as e:
+            print(f"Error during updating tags {e}")
+            return None
+
+    async def get_alltags(self):
+        if self.mirror_synchronized():
+            return self.store.get_all_tags()
+        try:
+            res = await self.s3_comm.get_alltags()
+            info = res.json()
+            if info["success"]:
+                return {a["data"]["app_id"]: a["data"]["labels"] for a in info["data"]}
+            return {}
+        except Exception as e:
+            print(f"Error during getting tags {e}")
+            return {}
+
+    async def list_assets(self, room_id=None, board_id=None, asset_id=None):
+        # TODO: handle board_id
+        if self.mirror_synchronized():
+            if asset_id is not None:
+                asset = self.assets.get(asset_id)
+                assets = [asset] if asset is not None else []
+                if room_id is not None:
+                    assets = [x for x in assets if x["data"]["room"] == room_id]
+            elif room_id is not None:
+                assets = self.store.get_assets_by_room(room_id)
+            else:
+                assets = list(self.assets.values())
+        else:
+            assets = await self.s3_comm.get_assets(room_id=room_id, asset_id=asset_id)
+        return [
+            {
+                "_id": asset["_id"],
+                "filename": asset["data"]["originalfilename"],
+                "mimetype": asset["data"]["mimetype"],
+                "size": asset["data"]["size"],
+                "path": asset["data"]["path"],
+            }
+            for asset in assets
+        ]
+
+    async def get_asset(self, asset_id):
+        """Returns the asset document with the given id or None"""
+        if self.mirror_synchronized():
+            return self.assets.get(asset_id)
+        return await self.s3_comm.get_asset(asset_id)
+
+    async def get_asset_id(self, file_name):
+        if self.mirror_synchronized():
+            return self.store.get_asset_by_filename(file_name)
+        for asset in await self.list_assets():
+            if asset["filename"] == file_name:
+                return asset["_id"]
+        return None
+
+    def get_public_url(self, asset_id):
+        """Returns the public url for the asset with the given id"""
+        return self.s3_comm.format_public_url(asset_id)
+
+    async def get_url_by_filename(self, filename):
+        asset_id = await self.get_asset_id(filename)
+        if asset_id:
+            return self.get_public_url(asset_id)
+        return None
+
+    async def get_pdf_text(self, asset_id, pages: List = None):
+        """Returns the text of the pages of a PDF asset, or None"""
+        asset = await self.get_asset(asset_id)
+        if asset is None:
+            return None
+        return await self.s3_comm.get_pdf_text(asset["data"]["path"], pages)
+
+    async def get_app(self, app_id: str = None) -> dict:
+        if self.mirror_synchronized():
+            app = self.store.apps.get(app_id)
+            return dict(app) if app is not None else None
+        return await self.s3_comm.get_app(app_id)
+
+    async def get_apps(
+        self,
+        room_id: str = None,
+        board_id: str = None,
+        add_tags=False,
+        filter_tags=None,
+    ) -> dict:
+        if self.mirror_synchronized():
+            all_apps = [dict(x) for x in self.store.get_app_docs(room_id, board_id)]
+        else:
+            all_apps = await self.s3_comm.get_apps(room_id, board_id)
+        if add_tags:
+            all_tags = await self.get_alltags()
+            for app in all_apps:
+                app["tags"] = all_tags.get(app["_id"], [])
+
+        all_apps = {x["_id"]: x for x in all_apps}
+        if filter_tags:
+            all_apps = _remove_keys_from_dict(all_apps, filter_tags)
+        return all_apps
+
+    async def get_boards(self, room_id: str = None) -> List[dict]:
+        if self.mirror_synchronized():
+            return self.store.get_board_docs(room_id)
+        return await self.s3_comm.get_boards(room_id)
+
+    async def get_apps_by_room(self, room_id: str = None) -> dict:
+        if room_id is None:
+            print("Please provide a room id to filter by")
+        return await self.get_apps(room_id=room_id)
+
+    async def get_apps_by_board(self, board_id: str = None) -> dict:
+        if board_id is None:
+            print("Please provide a board id to filter by")
+        return await self.get_apps(board_id=board_id)
+
+    async def get_apps_text(self, apps: dict = None) -> str:
+        if apps is None:
+            apps = await self.get_apps()
+
+        text = ""
+        for app_id, app in apps.items():
+            app_type = app.get("data", {}).get("type", None)
+
+            if app_type is None:
+                return "AppType Not Valid"
+            elif app_type == "Stickie":
+                text += app.get("data", {}).get("state", {}).get("text", "") + "\n"
+            elif app_type == "PDFViewer":
+                asset_id = app.get("data", {}).get("state", {}).get("assetid")
+                pages = await self.get_pdf_text(asset_id)
+                if pages:
+                    text += "\n".join(str(p) for p in pages) + "\n"
+            else:
+                return f"Cannot yet summarize {app_type}"
+        return text
+
+    def get_smartbits(self, room_id: str = None, board_id: str = None):
+        if room_id is None or board_id is None:
+            print("Please provide a room id and a board id")
+            return
+        board = self.store.get_board(room_id, board_id)
+        return board.smartbits if board is not None else None
+
+    def get_smartbit(self, app_id: str) -> SmartBit:
+        """Returns the smartbit with the given id, wherever it lives, or None"""
+        return self.store.get_smartbit(app_id)
+
+    def get_smartbits_by_type(self, app_type: str, board_id: str = None) -> list:
+        return self.store.get_smartbits_by_type(app_type, board_id=board_id)
+
+    def get_smartbits_by_asset(self, asset_id: str) -> list:
+        return self.store.get_smartbits_by_asset(asset_id)
+
+    def get_smartbits_by_tag(self, tag: str) -> list:
+        return self.store.get_smartbits_by_tag(tag)
+
+    def get_types_count(self, board_id: str = None) -> dict:
+        return self.store.get_types_count(board_id=board_id)
+
+    async def send_updates(self, smartbits: List[SmartBit]):
+        """Sends the touched fields of the smartbits with one batch PUT"""
+        if isinstance(smartbits, SmartBit):
+            smartbits = [smartbits]
+        batch = [sb.get_updates_for_batch() for sb in smartbits]
+        batch = [x for x in batch if x["updates"]]
+        if not batch:
+            return None
+        return await self.s3_comm.send_app_batch_update({"batch": batch})
+
+    async def update_size(self, app, width=None, height=None, depth=None):
+        if not isinstance(app, SmartBit):
+            print(f"apps should be a smartbit. Found {type(app)}")
+            return
+        if width is None and height is None and depth is None:
+            print("At last one of the parameters is required")
+            return
+        if width is not None:
+            app.data.size.width = width
+        if height is not None:
+            app.data.size.height = height
+        if depth is not None:
+            app.data.size.depth = depth
+        return await self.send_updates(app)
+
+    async def update_position(self, app, x=None, y=None, z=None):
+        if not isinstance(app, SmartBit):
+            print(f"apps should be a smartbit. Found {type(app)}")
+            return
+        if x is None and y is None and z is None:
+            print("At last one of the parameters is required")
+            return
+        if x is not None:
+            app.data.position.x = x
+        if y is not None:
+            app.data.position.y = y
+        if z is not None:
+            app.data.position.z = z
+        return await self.send_updates(app)
+
+    async def update_rotation(self, app, x=None, y=None, z=None):
+        if not isinstance(app, SmartBit):
+            print(f"Apps should be a smartbit. Found {type(app)}")
+            return
+        if x is None and y is None and z is None:
+            print("At last one of the parameters is required")
+            return
+        if x is not None:
+            app.data.rotation.x = x
+        if y is not None:
+            app.data.rotation.y = y
+        if z is not None:
+            app.data.rotation.z = z
+        return await self.send_updates(app)
+
+    async def update_state_attrs(self, app, **kwargs):
+        """Updates the state attributes of the given app.
+        The attributes to be updated are passed as kwargs"""
+        if not isinstance(app, SmartBit):
+            print(f"Apps should be a smartbit. Found {type(app)}")
+            return
+        for k in kwargs.keys():
+            if not hasattr(app.state, k):
+                print(f"{k} is not a valid attribute of the {type(app)}'s state")
+                return
+        for k, v in kwargs.items():
+            setattr(app.state, k, v)
+        return await self.send_updates(app)
+
+    async def align_selected_apps(
+        self, smartbits: List[SmartBit] = None, align: str = "", gap=20, by_dim=None
+    ) -> None:
+        """
+        Aligns the apps in the list according to the given align type, see
+        PySage3.align_selected_apps. The alignment batches are sent with this client.
+        """
+        if smartbits is None:
+            return
+
+        batches = []
+        with batch_updates(sink=batches.append):
+            align_apps(smartbits, align, by_dim=by_dim, gap=gap)
+        # in order, align_stack relies on its first batch landing first
+        for batch in batches:
+            await self.s3_comm.send_app_batch_update({"batch": batch})
+
+    async def clean_up(self):
+        print("cleaning up async client resources")
+        await self.socket.clean_up()
+        await self.s3_comm.aclose()
+
+
+def _remove_keys_from_dict(app_dict, keys_to_remove):
+    """Deep copy of app_dict without the given keys, at any depth"""
+
+    def _remove(d):
+        if isinstance(d, dict):
+            for key in list(d.keys()):
+                if key in keys_to_remove:
+                    del d[key]
+                else:
+                    _remove(d[key])
+        elif isinstance(d, list):
+            for item in d:
+                _remove(item)
+
+    app_dict_copy = copy.deepcopy(app_dict)
+    _remove(app_dict_copy)
+    return app_dict_copy
@@ -6,7 +6,8 @@
 #  the file LICENSE, distributed as part of this software.
 # -----------------------------------------------------------------------------
 from pysage3.smartbitcollection import SmartBitsCollection
-from pysage3.utils.layout import Layout
+from pysage3.utils.layout import Layout, ENGINES
+from pysage3.utils.update_batcher import batch_updates
 from pysage3.alignment_strategies import *
 
 class Board:
@@ -23,6 +24,8 @@ class Board:
         self.layout = None
         self.whiteboard_lines = None
         self.smartbits = SmartBitsCollection()
+        # apps_in_rect, overlapping, nearest, nearest_free_slot
+        self.index = self.smartbits.index
         self.stored_app_dims = {}
 
     def reorganize_layout(
@@ -33,6 +36,7 @@ class Board:
         by="combined",
         mode="graphviz",
         selected_apps=None,
+        engine="grouped",
     ):
         if by not in ["app_type", "semantic"]:
             print(f"{by} not a valid by option to organize layout. Not executing")
@@ -40,6 +44,9 @@ class Board:
         if mode not in ["tiles", "stacks"]:
             print(f"{mode} not a valid mode to organize layout. Not executing")
             return
+        if engine not in ENGINES:
+            print(f"{engine} not a valid layout engine. Not executing")
+            return
         viewport_position = (
             float(viewport_position["x"]),
             float(viewport_position["y"]),
@@ -51,39 +58,45 @@ class Board:
         print(f"viewport size  is {viewport_size}")
         print(f"buffer size  is {buffer_size}")
 
+        if selected_apps == "viewport":
+            selected_apps = self.index.apps_in_rect(*viewport_position, *viewport_size, contained=True)
+        if selected_apps is None:
+            selected_apps = self.smartbits.ids()
+        else:
+            selected_apps = [x for x in selected_apps if x in self.smartbits]
+
+        # sizes from the board columns, types from the documents: nothing is built
+        # for the apps the layout doesn't move
+        _, wh = self.smartbits.geometry.take(selected_apps)
         app_dims = {
-            x.app_id: (
-                x.data.size.width + buffer_size,
-                x.data.size.height + buffer_size,
-            )
-            for x in self.smartbits.smartbits_collection.values()
+            app_id: (width + buffer_size, height + buffer_size)
+            for app_id, (width, height) in zip(selected_apps, wh.tolist())
         }
 
-        if selected_apps is not None:
-            app_dims = {x: app_dims[x] for x in selected_apps}
-
         self.stored_app_dims = app_dims
         # print(f"app_dims is {app_dims}")
 
-        app_to_type = {x: type(self.smartbits[x]).__name__ for x in app_dims.keys()}
+        app_to_type = {x: self.smartbits.app_type(x) for x in app_dims.keys()}
         # print(f"app_to_type is {app_to_type}")
 
         self.layout = Layout(app_dims, viewport_position, viewport_size)
-        self.layout.fdp_graphviz_layout(app_to_type)
-
-        for app_id, coords in self.layout._layout_dict.items():
-            sb = self.smartbits[app_id]
-            sb.data.position.x = coords[0]
-            sb.data.position.y = coords[1]
-            sb.send_updates()
+        self.layout.run(engine, app_to_type)
+
+        with batch_updates():
+            for app_id, coords in self.layout._layout_dict.items():
+                sb = self.smartbits[app_id]
+                sb.data.position.x = coords[0]
+                sb.data.position.y = coords[1]
+                sb.send_updates()
         print("Done executing organize_layout on the board")
 
     def restore_layout(self):
-        for app_id, coords in self.stored_app_dims.items():
-            sb = self.smartbits[app_id]
-            sb.data.size.width = coords[0]
-            sb.data.size.height = coords[1]
-            sb.send_updates()
+        with batch_updates():
+            for app_id, coords in self.stored_app_dims.items():
+                sb = self.smartbits[app_id]
+                sb.data.size.width = coords[0]
+                sb.data.size.height = coords[1]
+                sb.send_updates()
 
     def align_selected_apps(
         self, selected_apps: List[str], align_type: str = None
@@ -92,36 +105,24 @@ class Board:
         Aligns the apps in the list according to the given align_type
 
         :param apps: list of apps to be aligned
-        :param align_type: type of alignment. Possible values: left, right, top, bottom
-        :return: list of apps aligned
+        :param align_type: type of alignment. Possible values: left, right, top, bottom,
+            column, row, stack, grid, distribute-horizontal, distribute-vertical
         """
-        # sort smartbits by the word in parentheses in the state.text field
+        selected_apps = [x for x in selected_apps if x in self.smartbits]
         smartbits = [self.smartbits[app_id] for app_id in selected_apps]
-        # print(f"smartbits is {smartbits}")
 
-        if smartbits is None or len(smartbits) == 0 or align_type is None:
+        if len(smartbits) == 0 or align_type is None:
             return
 
-        by_dim = 1
-
-        if align_type == "left":
-            align_to_left(smartbits)
-        elif align_type == "right":
-            align_to_right(smartbits)
-        elif align_type == "top":
-            align_to_top(smartbits)
-        elif align_type == "bottom":
-            align_to_bottom(smartbits)
-        elif "column" in align_type:
-            align_by_col(smartbits, num_cols=by_dim)
-        elif "row" in align_type:
-            align_by_row(smartbits, num_rows=by_dim)
-        elif align_type == "stack":
-            align_stack(smartbits)
+        # positions and sizes straight from the board columns
+        geometry = self.smartbits.geometry.take(selected_apps)
+        xy = align_apps(smartbits, align_type, geometry=geometry)
+        if xy is not None:
+            self.smartbits.move(selected_apps, xy)
 
     def clean_up(self):
         print("cleaning up client resources")
         for room_id in self.rooms.keys():
             for board_id in self.rooms[room_id].boards.keys():
-                for app_info in self.rooms[room_id].boards[board_id].smartbits:
-                    app_info[1].clean_up()
+                for _, sb in self.rooms[room_id].boards[board_id].smartbits.materialized():
+                    sb.clean_up()
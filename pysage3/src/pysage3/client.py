@@ -15,15 +15,14 @@
 
 # TODO prevent apps updates on fields that were touched?
 import uuid
-import json
 import copy
 from typing import List
-from pysage3.board import Board
-from pysage3.room import Room
 from pysage3.smartbitfactory import SmartBitFactory
+from pysage3.statestore import StateStore
 from pysage3.utils.sage_communication import SageCommunication
-from pysage3.smartbits.genericsmartbit import GenericSmartBit
 from pysage3.utils.sage_websocket import SageWebsocket
+from pysage3.utils.snapshot import MirrorSnapshot
+from pysage3.utils.messages import decode_message, iter_event_docs
 from pysage3.json_templates.templates import create_app_template
 
 # TODO import functions explicitly below
@@ -31,48 +30,78 @@ from pysage3.alignment_strategies import *
 
 
 class PySage3:
-    def __init__(self, conf, prod_type):
+    def __init__(self, conf, prod_type, mirror_reads=True, lazy=False, snapshot_path=None):
+        """
+        :param mirror_reads: when True, read helpers (get_apps, list_assets, get_asset_id, ...)
+            answer from the websocket-maintained local mirror once it is synchronized, and only
+            fall back to the REST API before that.
+        :param lazy: when True, apps are kept as documents and their SmartBit is only built
+            on first access or first update, for a fast startup on large servers.
+        :param snapshot_path: file where the mirror is saved. On restart the saved documents
+            are loaded and only the ones changed since are fetched from the server, as after
+            a websocket reconnection.
+        """
         print("Configuring ps3 client ... ")
 
         self.done_init = False
         self.conf = conf
         self.prod_type = prod_type
+        self.mirror_reads = mirror_reads
         self.__MSG_METHODS = {
             "CREATE": self.__handle_create,
             "UPDATE": self.__handle_update,
             "DELETE": self.__handle_delete,
         }
 
-        self.rooms = {}
-        self.assets = {}
+        # rooms and assets are views on the indexed state store
+        self.store = StateStore(lazy=lazy)
+        self.rooms = self.store.rooms
+        self.assets = self.store.assets
         self.s3_comm = SageCommunication(self.conf, self.prod_type)
-        self.socket = SageWebsocket(on_message_fn=self.__process_messages)
+        self.snapshot = None
+        if snapshot_path is not None:
+            self.snapshot = MirrorSnapshot(
+                snapshot_path, server=self.conf[self.prod_type]["web_server"]
+            )
+        self.socket = SageWebsocket(
+            on_message_fn=self.__process_messages, on_reconnect_fn=self.__resync
+        )
 
-        self.socket.subscribe(["/api/apps", "/api/rooms", "/api/boards", "/api/assets"])
+        self.socket.subscribe(
+            ["/api/apps", "/api/rooms", "/api/boards", "/api/assets", "/api/insight"]
+        )
 
         # Grab and load info already on the board
         self.__populate_existing()
+        self.store.synchronized = True
         self.room = None
         self.board = None
         self.done_init = True
         print("Completed configuring Sage3 Client")
 
     def __populate_existing(self):
-        rooms_info = self.s3_comm.get_rooms()
-        for room_info in rooms_info:
-            self.__handle_create("ROOMS", room_info)
-        # Populate existing boards
-        boards_info = self.s3_comm.get_boards()
-        for board_info in boards_info:
-            self.__handle_create("BOARDS", board_info)
-        # Populate existing apps
-        apps_info = self.s3_comm.get_apps()
-        for app_info in apps_info:
-            self.__handle_create("APPS", app_info)
-        # Populate existing apps
-        assets_info = self.s3_comm.get_assets()
-        for asset_info in assets_info:
-            self.__handle_create("ASSETS", asset_info)
+        since = None
+        if self.snapshot is not None:
+            since = self.store.restore(self.snapshot)
+        self.__fetch_changes(since)
+
+    def __resync(self):
+        # called by the websocket after a reconnection, before the next events
+        if not self.store.synchronized:
+            return
+        self.__fetch_changes(self.store.resync_since())
+
+    def __fetch_changes(self, since=None):
+        # the collections and the tags are fetched concurrently, see StateStore.fetch_changes
+        fetched = self.store.fetch_changes(self.s3_comm, since, extra=("INSIGHT",))
+        # Populate existing tags
+        try:
+            res = fetched["INSIGHT"].result()
+            if res.is_success:
+                for insight_info in res.json()["data"]:
+                    self.__handle_create("INSIGHT", insight_info)
+        except Exception as e:
+            print(f"Error during loading of tags {e}")
 
     def create_app(self, room_id, board_id, app_type, state, app=None):
         try:
@@ -108,7 +137,15 @@ class PySage3:
             print(f"Error during creation of app {e}")
             return None
 
+    def mirror_synchronized(self):
+        """True when reads can be served from the local mirror"""
+        return (
+            self.mirror_reads and self.store.synchronized and self.socket.connected
+        )
+
     def get_tags(self, app_id):
+        if self.mirror_synchronized():
+            return self.store.get_tags(app_id)
         try:
             res = self.s3_comm.get_tags(app_id)
             info = res.json()
@@ -129,6 +166,8 @@ class PySage3:
             return None
 
     def get_alltags(self):
+        if self.mirror_synchronized():
+            return self.store.get_all_tags()
         try:
             res = self.s3_comm.get_alltags()
             info = res.json()
@@ -174,95 +213,26 @@ class PySage3:
 
     # Handle Create Messages
     def __handle_create(self, collection, doc):
-        # we need state to be at the same level as data
-        if collection == "ROOMS":
-            new_room = Room(doc)
-            self.rooms[new_room.id] = new_room
-        elif collection == "BOARDS":
-            new_board = Board(doc)
-            if new_board.roomId in self.rooms:
-                self.rooms[new_board.roomId].boards[new_board.id] = new_board
-        elif collection == "APPS":
-            doc["state"] = doc["data"]["state"]
-            del doc["data"]["state"]
-            smartbit = SmartBitFactory.create_smartbit(doc)
-            room_id = doc["data"]["roomId"]
-            board_id = doc["data"]["boardId"]
-            if room_id in self.rooms:
-                if board_id in self.rooms[room_id].boards and smartbit:
-                    self.rooms[room_id].boards[board_id].smartbits[
-                        smartbit.app_id
-                    ] = smartbit
-        elif collection == "ASSETS":
-            self.assets[doc["_id"]] = doc
+        self.store.handle_create(collection, doc)
 
     # Handle Update Messages
     def __handle_update(self, collection, doc, updates):
-        # TODO: prevent updates to fields that were touched
-        # TODO: this in a smarter way. For now, just overwrite the complete object
-
-        id = doc["_id"]
-        if collection == "ROOMS":
-            self.rooms[id].handleUpdate(doc)
-        elif collection == "BOARDS":
-            room_id = doc["data"]["roomId"]
-            # TODO: proceed to BOARD update with the updates field passed as param
-        elif collection == "APPS":
-            board_id = doc["data"]["boardId"]
-            room_id = doc["data"]["roomId"]
-            sb = self.rooms[room_id].boards[board_id].smartbits[id]
-
-            if sb is not None and type(sb) is not GenericSmartBit:
-                # Note that set_data_form_update clear touched field
-                sb.refresh_data_form_update(doc, updates)
+        self.store.handle_update(collection, doc, updates)
 
     # Handle Delete Messages
     def __handle_delete(self, collection, doc):
-        """Delete not yet supported through API"""
-        room_id = doc["data"]["roomId"]
-        board_id = doc["data"]["boardId"]
-        smartbit_id = doc["_id"]
-        del self.rooms[room_id].boards[board_id].smartbits[smartbit_id]
+        self.store.handle_delete(collection, doc)
 
     def __process_messages(self, ws, msg):
-        message = json.loads(msg)
-        # Duplicate messages for the time being to allow python to work
-        # event.doc is now an array of docs
-        for doc in message["event"]["doc"]:
-            msg = message.copy()
-            msg["event"]["doc"] = doc
-            # End of duplicating messages so old code can work
-            collection = msg["event"]["col"]
-            doc = msg["event"]["doc"]
-            msg_type = msg["event"]["type"]
-            app_id = doc["_id"]
-
-            # Its a create message
-            if msg_type == "CREATE":
-                self.__MSG_METHODS[msg_type](collection, doc)
-            # Its a delete message
-            elif msg_type == "DELETE":
+        event = decode_message(msg)["event"]
+        collection = event["col"]
+        msg_type = event["type"]
+        # event.doc is an array of docs, updates are matched to them by id
+        for doc, updates in iter_event_docs(event):
+            if msg_type == "UPDATE":
+                self.__MSG_METHODS[msg_type](collection, doc, updates)
+            elif msg_type in self.__MSG_METHODS:
                 self.__MSG_METHODS[msg_type](collection, doc)
-            # Its an update message
-            elif msg_type == "UPDATE":
-                # all updates for this message [{id: string, updates: {}}, {id:string, updates: {}}...]
-                all_updates = msg["event"]["updates"]
-                msg_updates = {}
-                # find the updates for this specific app
-                for u in all_updates:
-                    if u["id"] == app_id:
-                        msg_updates = u["updates"]
-                        break
-                msg["event"]["updates"] = msg_updates
-
-                if (
-                    "updates" in msg["event"]
-                    and "raised" in msg["event"]["updates"]
-                    and msg["event"]["updates"]["raised"]
-                ):
-                    pass
-
-                self.__MSG_METHODS[msg_type](collection, doc, msg_updates)
 
     def update_size(self, app, width=None, height=None, depth=None):
         if not isinstance(app, SmartBit):
@@ -317,16 +287,25 @@ class PySage3:
         app.send_updates()
 
     def list_assets(self, room_id=None, board_id=None, asset_id=None):
-        # TODO: clean this. Poorly written. Also handle baord_id
-        assets = self.s3_comm.get_assets()
-        if room_id is not None:
-            assets = [x for x in assets if x["data"]["room"] == room_id]
+        # TODO: handle board_id
+        if self.mirror_synchronized():
+            if asset_id is not None:
+                asset = self.assets.get(asset_id)
+                assets = [asset] if asset is not None else []
+                if room_id is not None:
+                    assets = [x for x in assets if x["data"]["room"] == room_id]
+            elif room_id is not None:
+                assets = self.store.get_assets_by_room(room_id)
+            else:
+                assets = list(self.assets.values())
+        else:
+            assets = self.s3_comm.get_assets()
+            if room_id is not None:
+                assets = [x for x in assets if x["data"]["room"] == room_id]
+            if asset_id is not None:
+                assets = [x for x in assets if x["_id"] == asset_id]
         assets_info = []
         for asset in assets:
-            if asset_id is not None:
-                if asset["_id"] != asset_id:
-                    continue
-
             assets_info.append(
                 {
                     "_id": asset["_id"],
@@ -338,7 +317,15 @@ class PySage3:
             )
         return assets_info
 
+    def get_asset(self, asset_id):
+        """Returns the asset document with the given id or None"""
+        if self.mirror_synchronized():
+            return self.assets.get(asset_id)
+        return self.s3_comm.get_asset(asset_id)
+
     def get_asset_id(self, file_name):
+        if self.mirror_synchronized():
+            return self.store.get_asset_by_filename(file_name)
         assets = self.list_assets()
         if assets is not None:
             for asset in assets:
@@ -374,6 +361,9 @@ class PySage3:
         app.send_updates()
 
     def get_app(self, app_id: str = None) -> dict:
+        if self.mirror_synchronized():
+            app = self.store.apps.get(app_id)
+            return dict(app) if app is not None else None
         return self.s3_comm.get_app(app_id)
 
     def get_apps(
@@ -383,7 +373,11 @@ class PySage3:
         add_tags=False,
         filter_tags=None,
     ) -> List[dict]:
-        all_apps = self.s3_comm.get_apps(room_id, board_id)
+        if self.mirror_synchronized():
+            # copies, so callers adding keys (e.g. tags) don't alter the mirror
+            all_apps = [dict(x) for x in self.store.get_app_docs(room_id, board_id)]
+        else:
+            all_apps = self.s3_comm.get_apps(room_id, board_id)
         if add_tags:
             all_tags = self.get_alltags()
             for app in all_apps:
@@ -398,6 +392,11 @@ class PySage3:
 
         return all_apps
 
+    def get_boards(self, room_id: str = None) -> List[dict]:
+        if self.mirror_synchronized():
+            return self.store.get_board_docs(room_id)
+        return self.s3_comm.get_boards(room_id)
+
     def get_apps_by_room(self, room_id: str = None) -> List[dict]:
         if room_id is None:
             print("Please provide a room id to filter by")
@@ -444,6 +443,10 @@ class PySage3:
 
         return smartbits
 
+    def get_smartbit(self, app_id: str) -> SmartBit:
+        """Returns the smartbit with the given id, wherever it lives, or None"""
+        return self.store.get_smartbit(app_id)
+
     def get_smartbits_by_type(
         self, app_type: str, room_id: str = None, board_id: str = None
     ) -> list:
@@ -452,18 +455,28 @@ class PySage3:
             return
         if app_type is None:
             print("Please provide an app type to filter by")
-        smartbits = self.get_smartbits(room_id, board_id)
-        return [v for k, v in list(smartbits) if v.data.type == app_type]
+        return self.store.get_smartbits_by_type(app_type, board_id=board_id)
+
+    def get_smartbits_by_asset(self, asset_id: str) -> list:
+        """Returns the smartbits whose state references the given asset"""
+        return self.store.get_smartbits_by_asset(asset_id)
 
-    def get_types_count(self, apps: list = None) -> dict:
+    def get_smartbits_by_tag(self, tag: str) -> list:
+        """Returns the smartbits labeled with the given tag"""
+        return self.store.get_smartbits_by_tag(tag)
+
+    def get_types_count(self, apps: list = None, board_id: str = None) -> dict:
         """
         Returns a dictionary with the number of apps of each type
 
-        :param apps: list of apps to be counted
+        :param apps: list of apps to be counted. If None, the counts come from the local
+            state, optionally restricted to board_id
         :return: dictionary with the number of apps of each type
         """
         if apps is None:
-            apps = self.get_apps()
+            return self.store.get_types_count(board_id=board_id)
+        if isinstance(apps, dict):
+            apps = apps.values()
         count = {}
         for app in apps:
             if app["data"]["type"] in count:
@@ -473,14 +486,15 @@ class PySage3:
         return count
 
     def align_selected_apps(
-        self, smartbits: List[SmartBit] = None, align: str = "", gap=20, by_dim=1
+        self, smartbits: List[SmartBit] = None, align: str = "", gap=20, by_dim=None
     ) -> None:
         """
         Aligns the apps in the list according to the given align_type
 
         :param apps: list of apps to be aligned
-        :param align_type: type of alignment. Possible values: left, right, top, bottom
-        :return: list of apps aligned
+        :param align_type: type of alignment. Possible values: left, right, top, bottom,
+            column, row, stack, grid, distribute-horizontal, distribute-vertical
+        :param by_dim: number of columns (column, grid) or rows (row)
         """
         # sort smartbits by the word in parentheses in the state.text field
         # smartbits = sorted(smartbits, key=lambda sb: (sb.state.text.split('(')[1].split(')')[0]))
@@ -490,24 +504,14 @@ class PySage3:
         if smartbits is None:
             return
 
-        if align == "left":
-            align_to_left(smartbits)
-        elif align == "right":
-            align_to_right(smartbits)
-        elif align == "top":
-            align_to_top(smartbits)
-        elif align == "bottom":
-            align_to_bottom(smartbits)
-        elif align == "column":
-            align_by_col(smartbits, num_cols=by_dim)
-        elif align == "row":
-            align_by_row(smartbits, num_rows=by_dim)
-        elif align == "stack":
-            align_stack(smartbits)
+        align_apps(smartbits, align, by_dim=by_dim, gap=gap)
 
     def clean_up(self):
         print("cleaning up client resources")
         for room_id in self.rooms.keys():
             for board_id in self.rooms[room_id].boards.keys():
-                for app_info in self.rooms[room_id].boards[board_id].smartbits:
-                    app_info[1].clean_up()
+                # apps never built have nothing to clean up
+                for _, sb in self.rooms[room_id].boards[board_id].smartbits.materialized():
+                    sb.clean_up()
+        if self.snapshot is not None:
+            self.snapshot.close()
@@ -10,7 +10,12 @@ import redis
 import uuid
 import datetime
 import requests
+import copy
 import json
+import os
+import threading
+import time
+from collections import deque
 from ws4py.client import WebSocketBaseClient
 from ws4py.manager import WebSocketManager
 from ws4py import format_addresses
@@ -46,11 +51,56 @@ class TestiongJupyterClient(WebSocketBaseClient):
         msg = json.loads(msg.data.decode("utf-8"))
         print(f"Testing: received msg {msg}")
 
+class _Execution:
+    """An execute request, from the time it is queued until its kernel goes idle"""
+
+    __slots__ = ("uuid", "msg_id", "kernel_id", "msg", "callback", "queued_at", "sent_at",
+                 "has_result", "streams", "last_flush", "timer", "lock", "done")
+
+    def __init__(self, exec_uuid, kernel_id, msg, callback):
+        self.uuid = exec_uuid
+        self.msg_id = msg["header"]["msg_id"]
+        self.kernel_id = kernel_id
+        self.msg = msg
+        self.callback = callback
+        self.queued_at = time.monotonic()
+        self.sent_at = None
+        self.has_result = False
+        # buffered stream output: [name, [texts]] per run of consecutive chunks of one stream
+        self.streams = []
+        self.last_flush = 0.0
+        self.timer = None
+        # serializes the results of this request (kernel messages and stream timer)
+        self.lock = threading.Lock()
+        self.done = False
+
+
 class JupyterKernelProxy:
+    """
+    Runs code on the Jupyter kernels on behalf of the SageCells.
+
+    Requests are queued per kernel (FIFO) and a kernel gets its next request once it reports
+    idle for the previous one, so at most one request per kernel and `max_in_flight` requests
+    overall are executing; kernels take turns when the cap is reached. A kernel queue holds at
+    most `max_queued` requests, further ones are rejected with an error result.
+
+    `stream` outputs (prints) are coalesced: chunks arriving within `stream_interval` seconds
+    of the last delivery are concatenated and delivered in one callback, so a cell printing
+    in a loop doesn't turn into one state update per line.
+
+    The gateway kernel list and their JUPYTER:KERNELS entries are cached for `kernels_ttl`
+    seconds, and refreshed early when a kernel connection closes or the number of entries
+    changes.
+
+    Configuration (environment): JUPYTER_MAX_IN_FLIGHT (default 16), JUPYTER_MAX_QUEUED
+    (default 64), JUPYTER_STREAM_INTERVAL (seconds, default 0.5), JUPYTER_KERNELS_TTL
+    (seconds, default 5).
+    """
+
     class JupyterClient(WebSocketBaseClient):
-        def __init__(self, address, headers, parent_proxy_instnace):
-            self.pending_reponses = {}
+        def __init__(self, address, headers, parent_proxy_instnace, kernel_id):
             self.parent_proxy_instance = parent_proxy_instnace
+            self.kernel_id = kernel_id
             super().__init__(address, headers=headers)
 
         def handshake_ok(self):
@@ -58,39 +108,12 @@ class JupyterKernelProxy:
             self.parent_proxy_instance.conn_manager.add(self)
 
         def received_message(self, msg):
-            # check if the message
-            # print(f"processing a message {msg}")
             msg = json.loads(msg.data.decode("utf-8"))
-            msg_id_uuid = str(uuid.UUID(msg["parent_header"]["msg_id"].split("_")[0]))
-            result = {}
-
-            # print(f"received {msg}")
-            if msg["channel"] != "iopub":
-                return
-
-            if msg_id_uuid in self.pending_reponses:
-                # I am done
-                if msg['header']['msg_type'] == 'status' and msg['content']['execution_state'] == 'idle':
-                    # ready to send the result back
-                    if self.pending_reponses[msg_id_uuid] is None:
-                        result = {'request_id': msg_id_uuid, 'execute_result': {}}
-                        self.parent_proxy_instance.callback_info[msg_id_uuid](result)
-
-                    del(self.pending_reponses[msg_id_uuid])
-                    result = {}
-
-                if msg['msg_type'] in ['execute_result', 'display_data', "error", "stream"]:
-                    result = {"request_id": msg["parent_header"]["msg_id"], msg['msg_type']: msg['content']}
-                elif msg['msg_type'] in ["execute_reply"]:
-                    if msg['content']["status"] == "error":
-                        result = {"request_id": msg["parent_header"]["msg_id"], "error": msg['content']['traceback']}
-                    else:
-                        result = {"request_id": msg["parent_header"]["msg_id"], msg['msg_type']: msg['content']}
+            self.parent_proxy_instance._on_kernel_message(msg)
 
-            if result:
-                logger.debug(f"jupyter kernel result is {result}")
-                self.pending_reponses[msg_id_uuid] = result
-                self.parent_proxy_instance.callback_info[msg_id_uuid](result)
+        def closed(self, code, reason=None):
+            logger.debug(f"Connection to kernel {self.kernel_id} closed ({code}, {reason})")
+            self.parent_proxy_instance._on_connection_closed(self.kernel_id, self)
 
 
     # Borg pattern: every instance shares the same state, so no matter how
@@ -114,8 +137,25 @@ class JupyterKernelProxy:
         self.headers = [('Authorization', f"Token {self.token}")]
         self.conn_manager = WebSocketManager()
         self.conn_manager.start()
-        self.callback_info = {}
-        self.results = {}
+
+        self.max_in_flight = int(os.getenv("JUPYTER_MAX_IN_FLIGHT", "16"))
+        self.max_queued = int(os.getenv("JUPYTER_MAX_QUEUED", "64"))
+        self.stream_interval = float(os.getenv("JUPYTER_STREAM_INTERVAL", "0.5"))
+        self._lock = threading.RLock()
+        # kernel_id -> deque of requests waiting for the kernel
+        self.queues = {}
+        # kernel_id -> the request the kernel is executing
+        self.running = {}
+        # uuid -> request, queued or running
+        self.requests = {}
+        self._closing = False
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0,
+                       "stream_chunks": 0, "stream_flushes": 0}
+
+        self.kernels_ttl = float(os.getenv("JUPYTER_KERNELS_TTL", "5"))
+        # (time, gateway kernels, JUPYTER:KERNELS entries) or None
+        self._kernels_cache = None
+        self._kernels_lock = threading.Lock()
 
     def add_client(self, kernel_id):
         # do we need the test below or are we testing for it aready in the execute and interrupt?
@@ -126,29 +166,183 @@ class JupyterKernelProxy:
 
             self.connections[kernel_id] = self.JupyterClient(socket_url,
                                                              headers=self.headers,
-                                                             parent_proxy_instnace=self)
+                                                             parent_proxy_instnace=self,
+                                                             kernel_id=kernel_id)
             self.connections[kernel_id].connect()
 
     def execute(self, command_info):
+        """
+        Queues the code behind the other requests of its kernel. Results are passed to
+        command_info["call_fn"] as they arrive.
+        :param command_info: dict with the uuid of the request, the code, the kernel and call_fn
+        """
         user_passed_uuid = command_info["uuid"]
-        msg = format_execute_request_msg(user_passed_uuid, command_info["code"])
         kernel_id = command_info['kernel']
         callback_fn = command_info["call_fn"]
+        request = _Execution(user_passed_uuid, kernel_id,
+                             format_execute_request_msg(user_passed_uuid, command_info["code"]),
+                             callback_fn)
 
-        if kernel_id not in self.connections or self.connections[kernel_id].stream is None:
-            self.add_client(kernel_id)
+        with self._lock:
+            if user_passed_uuid in self.requests:
+                logger.error(f"Request {user_passed_uuid} is already queued or running")
+                return
+            queue = self.queues.setdefault(kernel_id, deque())
+            if len(queue) >= self.max_queued:
+                self._stats["rejected"] += 1
+                queue = None
+            else:
+                self._stats["submitted"] += 1
+                self.requests[user_passed_uuid] = request
+                queue.append(request)
+
+        if queue is None:
+            logger.error(f"Kernel {kernel_id} has {self.max_queued} requests waiting, rejecting {user_passed_uuid}")
+            self._deliver(request, self._error_result(
+                request, "KernelBusy", f"{self.max_queued} executions are already waiting for this kernel"))
+            return
+        self._pump()
+
+    def metrics(self):
+        """Counters and queue depths of the execution engine"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queued"] = sum(len(q) for q in self.queues.values())
+            stats["running"] = len(self.running)
+        return stats
+
+    def _pump(self):
+        """Sends the next request of every idle kernel, up to max_in_flight"""
+        to_send = []
+        with self._lock:
+            for kernel_id in list(self.queues):
+                if len(self.running) >= self.max_in_flight:
+                    break
+                queue = self.queues[kernel_id]
+                if kernel_id in self.running or not queue:
+                    continue
+                request = queue.popleft()
+                self.running[kernel_id] = request
+                request.sent_at = time.monotonic()
+                to_send.append(request)
+                # moves the kernel to the back, so that kernels take turns under the cap
+                del self.queues[kernel_id]
+                if queue:
+                    self.queues[kernel_id] = queue
+
+        for request in to_send:
+            try:
+                kernel_id = request.kernel_id
+                if kernel_id not in self.connections or self.connections[kernel_id].stream is None:
+                    self.add_client(kernel_id)
+                self.connections[kernel_id].send(json.dumps(request.msg), binary=False)
+            except Exception as e:
+                # something happen, the code couldn't be run: report it to the user
+                logger.error(f"Error occurred duirng execution of command, {e}")
+                self._finish(request, self._error_result(request, type(e).__name__, str(e)))
+
+    def _on_kernel_message(self, msg):
+        if msg["channel"] != "iopub":
+            return
+        msg_id_uuid = str(uuid.UUID(msg["parent_header"]["msg_id"].split("_")[0]))
+        request = self.requests.get(msg_id_uuid)
+        if request is None:
+            return
 
+        msg_type = msg['header']['msg_type']
+        if msg_type == 'status' and msg['content']['execution_state'] == 'idle':
+            # I am done
+            self._finish(request)
+        elif msg_type == "stream":
+            self._on_stream(request, msg['content'])
+        elif msg_type in ['execute_result', 'display_data', "error"]:
+            result = {"request_id": request.msg_id, msg_type: msg['content']}
+            logger.debug(f"jupyter kernel result is {result}")
+            with request.lock:
+                if request.done:
+                    return
+                self._flush_streams(request)
+                request.has_result = True
+                self._deliver(request, result)
+
+    def _on_stream(self, request, content):
+        with request.lock:
+            if request.done:
+                return
+            self._stats["stream_chunks"] += 1
+            if request.streams and request.streams[-1][0] == content["name"]:
+                request.streams[-1][1].append(content["text"])
+            else:
+                request.streams.append([content["name"], [content["text"]]])
+            wait = request.last_flush + self.stream_interval - time.monotonic()
+            if wait <= 0:
+                self._flush_streams(request)
+            elif request.timer is None:
+                request.timer = threading.Timer(wait, self._on_stream_timer, (request,))
+                request.timer.daemon = True
+                request.timer.start()
+
+    def _on_stream_timer(self, request):
+        with request.lock:
+            request.timer = None
+            if not request.done:
+                self._flush_streams(request)
+
+    def _flush_streams(self, request):
+        """Delivers the buffered stream output of request, whose lock is held"""
+        if request.timer is not None:
+            request.timer.cancel()
+            request.timer = None
+        streams, request.streams = request.streams, []
+        for name, texts in streams:
+            self._stats["stream_flushes"] += 1
+            request.has_result = True
+            self._deliver(request, {"request_id": request.msg_id, "stream": {"name": name, "text": "".join(texts)}})
+        request.last_flush = time.monotonic()
+
+    def _finish(self, request, error=None):
+        """Delivers what is left of request, forgets it and hands its kernel to the next one"""
+        with request.lock:
+            if request.done:
+                return
+            self._flush_streams(request)
+            request.done = True
+            if error is not None:
+                self._deliver(request, error)
+            elif not request.has_result:
+                self._deliver(request, {'request_id': request.uuid, 'execute_result': {}})
+
+        with self._lock:
+            self._stats["failed" if error is not None else "completed"] += 1
+            self.requests.pop(request.uuid, None)
+            if self.running.get(request.kernel_id) is request:
+                del self.running[request.kernel_id]
+            queue = self.queues.pop(request.kernel_id, None)
+            if queue:
+                # back of the line, behind the kernels waiting for a slot
+                self.queues[request.kernel_id] = queue
+        self._pump()
+
+    def _on_connection_closed(self, kernel_id, client):
+        with self._lock:
+            if self._closing or self.connections.get(kernel_id) is not client:
+                return
+            request = self.running.get(kernel_id)
+        # the kernel may have been shut down or restarted
+        self.invalidate_kernels()
+        # the idle status of the running request will never come
+        if request is not None:
+            self._finish(request, self._error_result(request, "ConnectionClosed",
+                                                     "The connection to the kernel was closed"))
+
+    def _error_result(self, request, ename, evalue):
+        return {"request_id": request.msg_id, "error": {"ename": ename, "evalue": evalue, "traceback": []}}
+
+    def _deliver(self, request, result):
         try:
-            self.connections[kernel_id].pending_reponses[user_passed_uuid] = None
-            self.callback_info[user_passed_uuid] = callback_fn
-            self.connections[kernel_id].send(json.dumps(msg), binary=False)
+            request.callback(result)
         except Exception as e:
-            # something happen, do not track this results
-            logger.error(f"Error occurred duirng execution of command, {e}")
-            del self.results[user_passed_uuid]
-            # TODO something happened and code couldn't be run
-            #  send error back to the user
-            del self.callback_info[user_passed_uuid]
+            logger.error(f"Error in the result callback of request {request.uuid}, {e}")
 
 
     def interrupt(self, command_info):
@@ -165,35 +359,84 @@ class JupyterKernelProxy:
 
 
 
-    def remove_stale_tokens(self, gateway_kernels):
-        kernels_ids = [k["id"] for k in gateway_kernels]
-        redis_kernels = set(self.redis_server.json().get('JUPYTER:KERNELS').keys())
-        redis_kernels_to_remove = redis_kernels - set(kernels_ids)
-        for k in redis_kernels_to_remove:
-            self.redis_server.json().delete('JUPYTER:KERNELS', k)
-
-    def get_kernels(self):
+    def remove_stale_tokens(self, gateway_kernels, redis_kernels=None):
+        """
+        Deletes the Redis entries of kernels the gateway doesn't know anymore, in one
+        transaction.
+        :param redis_kernels: the JUPYTER:KERNELS document, if already read
+        :return: the document without the stale kernels
+        """
+        if redis_kernels is None:
+            redis_kernels = self.redis_server.json().get('JUPYTER:KERNELS') or {}
+        kernels_ids = {k["id"] for k in gateway_kernels}
+        redis_kernels_to_remove = [k for k in redis_kernels if k not in kernels_ids]
+        if redis_kernels_to_remove:
+            pipe = self.redis_server.json().pipeline(transaction=True)
+            for k in redis_kernels_to_remove:
+                pipe.delete('JUPYTER:KERNELS', k)
+            pipe.execute()
+        return {k: v for k, v in redis_kernels.items() if k in kernels_ids}
+
+    def _refresh_kernels(self):
         headers_dict = dict(self.headers)
         response = requests.get(conf[prod_type]["jupyter_server"] + "/api/kernels", headers=headers_dict)
+        response.raise_for_status()
         kernels = response.json()
-        self.remove_stale_tokens(kernels)
-        return kernels
+        metadata = self.remove_stale_tokens(kernels)
+        self._kernels_cache = (time.monotonic(), kernels, metadata)
+        return self._kernels_cache
+
+    def _cached_kernels(self, refresh=False):
+        # callers arriving during a refresh wait for it and share its result
+        with self._kernels_lock:
+            cache = self._kernels_cache
+            if refresh or cache is None or time.monotonic() - cache[0] > self.kernels_ttl:
+                cache = self._refresh_kernels()
+            return cache
+
+    def invalidate_kernels(self):
+        """Forgets the cached kernel list, the next call asks the gateway"""
+        self._kernels_cache = None
+
+    def get_kernels(self, refresh=False):
+        """
+        The kernels of the gateway, cached for kernels_ttl seconds (JUPYTER_KERNELS_TTL)
+        :param refresh: ignore the cache
+        """
+        return copy.deepcopy(self._cached_kernels(refresh)[1])
 
+    def get_kernels_metadata(self, refresh=False):
+        """
+        The JUPYTER:KERNELS entries (alias, name, owner...) of the kernels the gateway runs,
+        cached with the kernel list
+        :param refresh: ignore the cache
+        """
+        _, _, metadata = self._cached_kernels(refresh)
+        if not refresh and (self.redis_server.json().objlen('JUPYTER:KERNELS') or 0) != len(metadata):
+            # a kernel was created (or removed) since the list was cached
+            _, _, metadata = self._cached_kernels(refresh=True)
+        return copy.deepcopy(metadata)
 
     def get_room_kernel_id(self):
         """
         gets the default kernel associated with a room
         :return:
         """
-        headers_dict = dict(self.headers)
-        response = requests.get(conf[prod_type]["jupyter_server"] + "/api/kernels", headers=headers_dict)
         try:
-            board_kernel = json.loads(response.text)[0]["id"]
+            board_kernel = self._cached_kernels()[1][0]["id"]
             return board_kernel
         except:
             raise Exception("couldn't communicate with the Jupyter Kernel Gateway.")
 
     def clean_up(self):
+        with self._lock:
+            self._closing = True
+            for request in self.requests.values():
+                if request.timer is not None:
+                    request.timer.cancel()
+            self.requests.clear()
+            self.queues.clear()
+            self.running.clear()
         self.conn_manager.close_all()
         self.conn_manager.stop()
         self.conn_manager.join()
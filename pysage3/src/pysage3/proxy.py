@@ -19,14 +19,14 @@ import time
 import os
 from typing import Callable
 from pydantic import BaseModel
-import json
 import logging
-from pysage3.board import Board
-from pysage3.room import Room
-from pysage3.smartbitfactory import SmartBitFactory
 from pysage3.utils.sage_communication import SageCommunication
+from pysage3.statestore import StateStore
 from pysage3.smartbits.genericsmartbit import GenericSmartBit
 from pysage3.utils.sage_websocket import SageWebsocket
+from pysage3.utils.dispatcher import KeyedDispatcher
+from pysage3.utils.messages import decode_message, iter_event_docs
+from pysage3.utils.snapshot import MirrorSnapshot
 
 from pysage3.config import config as conf, prod_type
 
@@ -51,6 +51,9 @@ def setup_logger():
 
 logger = setup_logger()
 
+# collections mirrored by the proxy, parents first
+_COLLECTIONS = ("ROOMS", "BOARDS", "APPS")
+
 # TODO: Find another spot for this.
 
 
@@ -72,7 +75,29 @@ def update_dest_from_src(src_val, dest_app, dest_field):
 
 class SAGEProxy:
 
-    def __init__(self, conf, prod_type):
+    def __init__(
+        self,
+        conf,
+        prod_type,
+        max_workers=None,
+        exec_timeout=None,
+        exec_timeouts=None,
+        lazy=None,
+        snapshot_path=None,
+    ):
+        """
+        SmartBit functions (executeInfo) and linked-app callbacks run on a worker pool,
+        one at a time per app, so the websocket thread only ingests events.
+
+        :param max_workers: size of the worker pool (PROXY_WORKERS, default 8)
+        :param exec_timeout: seconds after which a running function is reported and the
+            next ones for the same app proceed (PROXY_EXEC_TIMEOUT, default no limit)
+        :param exec_timeouts: per function name timeouts, overriding exec_timeout
+        :param lazy: keep apps as documents and build their SmartBit on first access or
+            first update, e.g. the first executeInfo (PROXY_LAZY=1, default False)
+        :param snapshot_path: file where the rooms, boards and apps are saved, so a restart
+            only fetches what changed since (PROXY_SNAPSHOT, default none)
+        """
         self.done_init = False
         self.conf = conf
         self.prod_type = prod_type
@@ -86,9 +111,32 @@ class SAGEProxy:
         self.callbacks = {}  # for linked apps
         self.received_msg_log = {}
 
-        self.rooms = {}
+        if max_workers is None:
+            max_workers = int(os.getenv("PROXY_WORKERS", 8))
+        if exec_timeout is None and os.getenv("PROXY_EXEC_TIMEOUT"):
+            exec_timeout = float(os.getenv("PROXY_EXEC_TIMEOUT"))
+        self.exec_timeouts = exec_timeouts or {}
+        if lazy is None:
+            lazy = os.getenv("PROXY_LAZY", "0") == "1"
+        self.lazy = lazy
+        if snapshot_path is None:
+            snapshot_path = os.getenv("PROXY_SNAPSHOT")
+        self.snapshot = None
+        if snapshot_path:
+            self.snapshot = MirrorSnapshot(
+                snapshot_path, server=self.conf[self.prod_type]["web_server"]
+            )
+        self.dispatcher = KeyedDispatcher(
+            max_workers=max_workers, default_timeout=exec_timeout
+        )
+
+        # the rooms, boards and apps, with the snapshot and resync bookkeeping
+        self.store = StateStore(lazy=lazy)
+        self.rooms = self.store.rooms
         self.s3_comm = SageCommunication(self.conf, self.prod_type)
-        self.socket = SageWebsocket(on_message_fn=self.process_messages)
+        self.socket = SageWebsocket(
+            on_message_fn=self.process_messages, on_reconnect_fn=self.resync
+        )
         self.socket.subscribe(["/api/apps", "/api/rooms", "/api/boards"])
 
         # Grab and load info already on the board
@@ -97,210 +145,157 @@ class SAGEProxy:
         self.done_init = True
 
     def populate_existing(self):
-        # Populate existing rooms
-        rooms_info = self.s3_comm.get_rooms()
-        # print(rooms_info)
-        for room_info in rooms_info:
-            self.__handle_create("ROOMS", room_info)
-
-        # Populate existing boards
-        boards_info = self.s3_comm.get_boards()
-        # print(boards_info)
-        for board_info in boards_info:
-            self.__handle_create("BOARDS", board_info)
-        # Populate existing apps
-        apps_info = self.s3_comm.get_apps()
-        # print(apps_info)
-        for app_info in apps_info:
-            self.__handle_create("APPS", app_info)
+        since = None
+        if self.snapshot is not None:
+            since = self.store.restore(self.snapshot, _COLLECTIONS)
+        self.store.fetch_changes(self.s3_comm, since, _COLLECTIONS)
+
+    def resync(self):
+        """Applies what changed on the server while the websocket was disconnected"""
+        if not self.done_init:
+            return
+        # a fetched document isn't dispatched: its functions ran (or not) when it was live
+        self.store.fetch_changes(self.s3_comm, self.store.resync_since(), _COLLECTIONS)
 
     def process_messages(self, ws, msg):
         logger.debug("received and processing a new message")
-        message = json.loads(msg)
-        # Duplicate messages for the time being to allow python to work
-        # event.doc is now an array of docs
-        for doc in message["event"]["doc"]:
-            msg = message.copy()
-            msg["event"]["doc"] = doc
-            logger.debug(msg)
-            # End of duplicating messages so old code can work
-            collection = msg["event"]["col"]
-            doc = msg["event"]["doc"]
-            msg_type = msg["event"]["type"]
-            app_id = doc["_id"]
-
-            # Its a create message
-            if msg_type == "CREATE":
-                self.__MSG_METHODS[msg_type](collection, doc)
-            # Its a delete message
-            elif msg_type == "DELETE":
-                self.__MSG_METHODS[msg_type](collection, doc)
-            # Its an update message
-            elif msg_type == "UPDATE":
-                # all updates for this message [{id: string, updates: {}}, {id:string, updates: {}}...]
-                all_updates = msg["event"]["updates"]
-                msg_updates = {}
-                # find the updates for this specific app
-                for u in all_updates:
-                    if u["id"] == app_id:
-                        msg_updates = u["updates"]
-                        break
-                msg["event"]["updates"] = msg_updates
-
-                if (
-                    "updates" in msg["event"]
-                    and "raised" in msg["event"]["updates"]
-                    and msg["event"]["updates"]["raised"]
-                ):
-                    pass
-
+        event = decode_message(msg)["event"]
+        collection = event["col"]
+        msg_type = event["type"]
+        # event.doc is an array of docs, updates are matched to them by id
+        for doc, updates in iter_event_docs(event):
+            if msg_type == "UPDATE":
+                app_id = doc["_id"]
                 if app_id in self.callbacks:
-                    self.handle_linked_app(app_id, msg)
-                self.__MSG_METHODS[msg_type](collection, doc, msg_updates)
+                    self.handle_linked_app(app_id, updates)
+                self.__MSG_METHODS[msg_type](collection, doc, updates)
+            elif msg_type in self.__MSG_METHODS:
+                self.__MSG_METHODS[msg_type](collection, doc)
 
     def __handle_create(self, collection, doc):
-        # we need state to be at the same level as data
-        if collection == "ROOMS":
-            new_room = Room(doc)
-            self.rooms[new_room.id] = new_room
-        elif collection == "BOARDS":
-            new_board = Board(doc)
-            if new_board.roomId in self.rooms:
-                self.rooms[new_board.roomId].boards[new_board.id] = new_board
-        elif collection == "APPS":
-            doc["state"] = doc["data"]["state"]
-            del doc["data"]["state"]
-            smartbit = SmartBitFactory.create_smartbit(doc)
-            room_id = doc["data"]["roomId"]
-            board_id = doc["data"]["boardId"]
-            if room_id in self.rooms:
-                if board_id in self.rooms[room_id].boards:
-                    self.rooms[room_id].boards[board_id].smartbits[
-                        smartbit.app_id
-                    ] = smartbit
+        # with lazy, apps are built by their first update, see __handle_update
+        self.store.handle_create(collection, doc)
 
     # Handle Update Messages
     def __handle_update(self, collection, doc, updates):
         # TODO: prevent updates to fields that were touched
-        # TODO: this in a smarter way. For now, just overwrite the complete object
-
-        id = doc["_id"]
-        if collection == "ROOMS":
-            self.rooms[id].handleUpdate(doc)
-        elif collection == "BOARDS":
-            room_id = doc["data"]["roomId"]
-            # TODO: proceed to BOARD update with the updates field passed as param
-            # if "executeInfo" in updates and updates["executeInfo"]["executeFunc"]:
-            #     func_name = updates["executeInfo"]["executeFunc"]
-            #     logger.debug(f"executing function {func_name}")
-            #     try:
-            #         board = self.rooms[room_id].boards[id]
-            #         _func = getattr(board, func_name)
-            #         _params = updates["executeInfo"]["params"]
-
-            #         logger.debug(
-            #             f"About to execute board function --{func_name}-- with params --{_params}--")
-            #         _func(**_params)
-            #     except Exception as e:
-            #         logger.error(
-            #             f"Exception trying to execute board function {func_name}. \n\t{e}")
-
-        elif collection == "APPS":
-            board_id = doc["data"]["boardId"]
-            room_id = doc["data"]["roomId"]
-            sb = self.rooms[room_id].boards[board_id].smartbits[id]
-            if type(sb) is GenericSmartBit:
-
-                logger.debug("not handling generic smartbit update")
-                logger.debug(f"\t\tmessage was {doc}")
-                return
-            if sb is not None:
-                # Note that set_data_form_update clear touched field
-                sb.refresh_data_form_update(doc, updates)
-
-                exec_info = getattr(sb.state, "executeInfo", None)
-
-                if exec_info is not None:
-                    func_name = getattr(exec_info, "executeFunc")
-                    if func_name != "":
-                        try:
-                            _func = getattr(sb, func_name)
-                            _params = getattr(exec_info, "params")
-                            # TODO: validate the params are valid
-                            _func(**_params)
-                        except Exception as e:
-                            logger.error(
-                                f"Exception trying to execute function `{func_name}` on sb `{sb}`. \n{e}"
-                            )
-                else:
-                    logger.error("\n\n\nTried to update non existent smartbit\n\n\n")
+        sb = self.store.handle_update(collection, doc, updates)
+        # TODO: proceed to BOARD update with the updates field passed as param
+        # if collection == "BOARDS" and "executeInfo" in updates and updates["executeInfo"]["executeFunc"]:
+        #     func_name = updates["executeInfo"]["executeFunc"]
+        #     logger.debug(f"executing function {func_name}")
+        #     try:
+        #         board = self.rooms[room_id].boards[id]
+        #         _func = getattr(board, func_name)
+        #         _params = updates["executeInfo"]["params"]
+
+        #         logger.debug(
+        #             f"About to execute board function --{func_name}-- with params --{_params}--")
+        #         _func(**_params)
+        #     except Exception as e:
+        #         logger.error(
+        #             f"Exception trying to execute board function {func_name}. \n\t{e}")
+        if collection != "APPS":
+            return
+        if sb is None:
+            logger.error("\n\n\nTried to update non existent smartbit\n\n\n")
+            return
+        if type(sb) is GenericSmartBit:
+            logger.debug("not handling generic smartbit update")
+            logger.debug(f"\t\tmessage was {doc}")
+            return
+
+        # the store applied the updates, run the function they ask for
+        exec_info = getattr(sb.state, "executeInfo", None)
+        if isinstance(exec_info, BaseModel):
+            exec_info = exec_info.model_dump()
+        if exec_info is not None:
+            # a plain dict unless the state model declares executeInfo
+            func_name = exec_info.get("executeFunc", "")
+            if func_name != "":
+                try:
+                    _func = getattr(sb, func_name)
+                    # copy, later updates may change the params before this runs
+                    _params = dict(exec_info.get("params") or {})
+                    # TODO: validate the params are valid
+                    self.dispatcher.submit(
+                        doc["_id"],
+                        _func,
+                        name=func_name,
+                        timeout=self.exec_timeouts.get(func_name),
+                        **_params,
+                    )
+                except Exception as e:
+                    logger.error(
+                        f"Exception trying to execute function `{func_name}` on sb `{sb}`. \n{e}"
+                    )
 
     # Handle Delete Messages
     def __handle_delete(self, collection, doc):
-        _id = doc["_id"]
-        logger.debug(f"Delete Event {collection} {_id}")
-        if collection == "ROOMS":
-            try:
-                del self.rooms[_id]
-            except:
-                logger.debug(f"Couldn't delete room_id: {_id}")
-        elif collection == "BOARDS":
-            room_id = doc["data"]["roomId"]
-            try:
-                del self.rooms[room_id].boards[_id]
-            except:
-                logger.debug(f"Couldn't delete board_id: {id}")
-        elif collection == "APPS":
-            board_id = doc["data"]["boardId"]
-            room_id = doc["data"]["roomId"]
-            try:
-                # get the smartbit and clean up after itself before deleting
-
-                sb = self.rooms[room_id].boards[board_id].smartbits[_id]
-                sb.clean_up()
-                del self.rooms[room_id].boards[board_id].smartbits[_id]
-            except:
-                logger.error(f"Couldn't delete app_id: {_id}")
-
-    def handle_linked_app(self, app_id, msg):
+        logger.debug(f"Delete Event {collection} {doc['_id']}")
+        # the smartbit of a deleted app cleans up after itself, one never built has nothing to
+        sb = self.store.handle_delete(collection, doc)
+        if sb is not None:
+            sb.clean_up()
+
+    def handle_linked_app(self, app_id, updates):
+        """
+        :param updates: the {dotted_key: value} updates of the source app
+        """
         if app_id in self.callbacks:
             # handle callback
 
             for linked_info in self.callbacks[app_id].values():
-                if f"state.{linked_info.src_field}" in msg["event"]["updates"]:
+                if f"state.{linked_info.src_field}" in updates:
                     # print("Yes, the tracked fields was updated")
                     # TODO 4: make callback function optional. In which case, jsut update dest with src
-                    # TODO 1. We need to dispatch the function on a different thread, not run it
-                    #  on the same thread as proxy
-                    # TODO 2. Catch to avoid errors here so the thread does not crash
+                    # callbacks run on the dispatcher, serially per destination app
                     try:
                         board_id = linked_info.board_id
-                        src_val = msg["event"]["updates"][
-                            f"state.{linked_info.src_field}"
-                        ]
+                        src_val = updates[f"state.{linked_info.src_field}"]
                         dest_field = linked_info.dest_field
                         dest_id = linked_info.dest_app
-                        dest_app = self.room.boards[board_id].smartbits[dest_id]
-                        linked_info.callback(src_val, dest_app, dest_field)
+                        dest_app = self.__find_smartbit(board_id, dest_id)
+                        self.dispatcher.submit(
+                            dest_id,
+                            linked_info.callback,
+                            src_val,
+                            dest_app,
+                            dest_field,
+                            name=f"linked callback {app_id}->{dest_id}",
+                        )
                     except Exception as e:
                         logger.error(
                             f"Error happened during callback for linked app {app_id}.\n {e}"
                         )
 
+    def __find_smartbit(self, board_id, app_id):
+        for room in self.rooms.values():
+            if board_id in room.boards:
+                return room.boards[board_id].smartbits[app_id]
+        raise KeyError(f"board {board_id} not found")
+
     def handle_exec_function(self):
         pass
 
+    def metrics(self):
+        """Backpressure and timing counters of the worker pool"""
+        return self.dispatcher.metrics()
+
     def clean_up(self):
         # self.listening_process.clean_up()
 
-        # if not self.__message_queue.empty():
-        #     logger.warn("Messages queue was not empty while starting to clean proxy")
-        # self.__message_queue.close()
-
-        for room_id in sage_proxy.rooms.keys():
-            for board_id in sage_proxy.rooms[room_id].boards.keys():
-                for app_info in sage_proxy.rooms[room_id].boards[board_id].smartbits:
-                    app_info[1].clean_up()
+        # let the running functions finish, the queued ones are dropped
+        self.dispatcher.shutdown(wait=True)
+        logger.info(f"dispatcher metrics at shutdown: {self.dispatcher.metrics()}")
+        if self.snapshot is not None:
+            self.snapshot.close()
+
+        for room_id in self.rooms.keys():
+            for board_id in self.rooms[room_id].boards.keys():
+                # apps never built have nothing to clean up
+                for _, sb in self.rooms[room_id].boards[board_id].smartbits.materialized():
+                    sb.clean_up()
 
     def register_linked_app(
         self, board_id, src_app, dest_app, src_field, dest_field, callback
@@ -6,26 +6,117 @@
 #  the file LICENSE, distributed as part of this software.
 #-----------------------------------------------------------------------------
 
+import threading
+
+from pysage3.smartbitfactory import SmartBitFactory
+from pysage3.utils.geometry import BoardGeometry
+from pysage3.utils.spatial_index import SpatialIndex, doc_rect, smartbit_rect
+
+
 class SmartBitsCollection():
+    """
+    The apps of a board, by id.
+
+    Apps can be added as raw documents (add_doc): the SmartBit is only built the first
+    time it is looked up, which spares building thousands of pydantic models at startup
+    for apps nobody touches. Iterating or reading `smartbits_collection` builds them all.
+    """
+
     # TODO refactor this into properties
     def __init__(self):
         super().__init__()
-        self.smartbits_collection = {}
+        self._smartbits = {}
+        # app documents (state next to data) whose SmartBit isn't built yet
+        self._docs = {}
+        self._lock = threading.RLock()
+        # geometry of the apps, kept in sync by the create/update/delete handlers
+        self.index = SpatialIndex()
+        self.geometry = BoardGeometry()
+
+    @property
+    def smartbits_collection(self):
+        self.hydrate()
+        return self._smartbits
+
+    def add_doc(self, sb_id, doc):
+        """Adds an app from its document, the SmartBit is built on first access"""
+        with self._lock:
+            self._smartbits.pop(sb_id, None)
+            self._docs[sb_id] = doc
+        self.update_geometry(sb_id, *doc_rect(doc))
+
+    def _materialize(self, sb_id):
+        with self._lock:
+            sb = self._smartbits.get(sb_id)
+            if sb is not None:
+                return sb
+            doc = self._docs.pop(sb_id, None)
+            if doc is None:
+                return None
+            sb = SmartBitFactory.create_smartbit(doc)
+            if sb is not None:
+                self._smartbits[sb_id] = sb
+            return sb
+
+    def hydrate(self, sb_ids=None):
+        """Builds the SmartBits of the given apps (default: all) that aren't built yet"""
+        for sb_id in list(self._docs.keys() if sb_ids is None else sb_ids):
+            if sb_id in self._docs:
+                self._materialize(sb_id)
+
+    def is_materialized(self, sb_id):
+        return sb_id in self._smartbits
+
+    def materialized(self):
+        """The (id, SmartBit) pairs already built, without building the others"""
+        return list(self._smartbits.items())
+
+    def ids(self):
+        return list(self._smartbits.keys()) + list(self._docs.keys())
+
+    def app_type(self, sb_id):
+        """data.type of the app, without building its SmartBit"""
+        doc = self._docs.get(sb_id)
+        if doc is not None:
+            return doc["data"]["type"]
+        sb = self._smartbits.get(sb_id)
+        return sb.data.type if sb is not None else None
 
     def __len__(self):
-        return len(self.smartbits_collection)
+        return len(self._smartbits) + len(self._docs)
 
     def __getitem__(self, sb_id):
-        return self.smartbits_collection.get(sb_id, None)
+        sb = self._smartbits.get(sb_id)
+        if sb is None and sb_id in self._docs:
+            sb = self._materialize(sb_id)
+        return sb
 
     def __setitem__(self, sb_id, sb):
-        self.smartbits_collection[sb_id] = sb
+        with self._lock:
+            self._docs.pop(sb_id, None)
+            self._smartbits[sb_id] = sb
+        self.update_geometry(sb_id, *smartbit_rect(sb))
 
     def __delitem__(self, sb_id):
-        del self.smartbits_collection[sb_id]
+        with self._lock:
+            if self._docs.pop(sb_id, None) is None:
+                del self._smartbits[sb_id]
+        self.index.remove(sb_id)
+        self.geometry.remove(sb_id)
+
+    def update_geometry(self, sb_id, x, y, width, height):
+        """Moves the app in the spatial index and the geometry columns"""
+        self.index.update(sb_id, x, y, width, height)
+        self.geometry.update(sb_id, x, y, width, height)
+
+    def move(self, sb_ids, xy):
+        """Sets the positions of the apps, xy being an (n, 2) array"""
+        self.geometry.move(sb_ids, xy)
+        for sb_id, (x, y), (w, h) in zip(sb_ids, xy.tolist(), self.geometry.take(sb_ids)[1].tolist()):
+            self.index.update(sb_id, x, y, w, h)
 
     def __iter__(self):
         yield from self.smartbits_collection.items()
 
     def __contains__(self, value):
-        return value in self.smartbits_collection
+        return value in self._smartbits or value in self._docs
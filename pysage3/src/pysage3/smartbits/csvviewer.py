@@ -23,7 +23,6 @@ class CSVViewer(SmartBit):
     def __init__(self, **kwargs):
         # THIS ALWAYS NEEDS TO HAPPEN FIRST!!
         super(CSVViewer, self).__init__(**kwargs)
-        self.send_updates()
 
     def clean_up(self):
         pass
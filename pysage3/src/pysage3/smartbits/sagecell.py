@@ -61,12 +61,8 @@ class SageCell(SmartBit):
         """
         This function will get the kernels from the redis server
         """
-        # get all valid kernel ids from jupyter server
-        valid_kernel_list = [k["id"] for k in self._jupyter_client.get_kernels()]
-        # get all kernels from redis server
-        kernels = self._jupyter_client.redis_server.json().get(self._redis_space)
-        # remove kernels the list of available kernels that are not in jupyter server
-        [kernels.pop(k) for k in kernels if k not in valid_kernel_list]
+        # kernels known to redis and running on the jupyter server (cached by the proxy)
+        kernels = self._jupyter_client.get_kernels_metadata()
         available_kernels = []
         for kernel in kernels.keys():
             if (
@@ -6,17 +6,79 @@
 #  the file LICENSE, distributed as part of this software.
 # -----------------------------------------------------------------------------
 
-from typing import Optional, List
+from typing import Optional, List, Union, get_args, get_origin
 from pydantic import BaseModel, Field
 from typing import ClassVar
 from abc import abstractmethod
+import logging
 
 
 # from utils.generic_utils import create_dict
 from pysage3.utils.sage_communication import SageCommunication
+from pysage3.utils.update_batcher import current_batcher
 from operator import attrgetter
 from pysage3.config import config as conf, prod_type
 
+logger = logging.getLogger(__name__)
+
+
+def _model_type(annotation):
+    """The BaseModel subclass of a field annotation (unwrapping Optional), or None"""
+    if get_origin(annotation) is Union:
+        for arg in get_args(annotation):
+            if arg is not type(None):
+                return _model_type(arg)
+        return None
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    return None
+
+
+def _assign(obj, name, val):
+    """Sets obj.name (or obj[name]) without adding it to touched. A dict value sent for a
+    nested model is applied leaf by leaf, so the model instance is kept"""
+    if isinstance(obj, BaseModel):
+        current = getattr(obj, name, None)
+        if isinstance(current, BaseModel) and isinstance(val, dict):
+            for k, v in val.items():
+                _assign(current, k, v)
+        else:
+            # using object setattr to avoid adding field to touched
+            object.__setattr__(obj, name, val)
+    else:
+        obj[name] = val
+
+
+# (model class, update key) -> setter(obj, val)
+_SETTERS = {}
+
+
+def _compile_setter(cls, update_key):
+    """
+    Builds the setter applying the update `update_key` (e.g. "position.x" or "state.text")
+    to instances of cls. The path is split and resolved against the model fields once;
+    segments below a model field are dict keys.
+    """
+    path = update_key if update_key.split(".")[0] == "state" else "data." + update_key
+    steps = []
+    model = cls
+    for name in path.split("."):
+        steps.append((name, model is not None))
+        if model is not None:
+            field = model.model_fields.get(name)
+            model = _model_type(field.annotation) if field is not None else None
+    *parents, (leaf, _) = steps
+
+    def setter(obj, val):
+        for name, is_attr in parents:
+            if is_attr:
+                obj = getattr(obj, name)
+            else:
+                obj = obj.setdefault(name, {})
+        _assign(obj, leaf, val)
+
+    return setter
+
 
 class TrackedBaseModel(BaseModel):
     path: Optional[str] = None
@@ -57,43 +119,33 @@ class TrackedBaseModel(BaseModel):
             return False
 
     def refresh_data_form_update(self, update_data, updates):
-        # TODO replace this temp solution, which updates everything with a
-        #  solution that updates only necessary fields
-
-        update_data["state"] = update_data["data"]["state"]
-        del update_data["data"]["state"]
-        # we don't need to update the following keys:
+        """
+        Applies an UPDATE event: only the dotted keys of `updates` are set, through setters
+        compiled once per model class, so the cost is per changed field. Keys the model doesn't
+        declare (title, dragging, ...) are set as plain attributes, as refresh_data_from_doc
+        does. If a key can't be applied (its path goes through a missing attribute or a value
+        that isn't a dict), the whole document is applied instead.
+        """
+        cls = type(self)
+        try:
+            for updated_field_id, updated_field_val in updates.items():
+                setter = _SETTERS.get((cls, updated_field_id))
+                if setter is None:
+                    setter = _compile_setter(cls, updated_field_id)
+                    _SETTERS[(cls, updated_field_id)] = setter
+                setter(self, updated_field_val)
+        except Exception as e:
+            logger.debug(f"incremental update of {updates.keys()} failed ({e}), applying the document")
+            self.refresh_data_from_doc(update_data)
+
+    def refresh_data_from_doc(self, update_data):
+        """Sets every leaf of the app document on the model"""
+        # we need state to be at the same level as data and don't update the following keys
         do_not_modify = ["_id", "_createdAt", "_updatedAt", "_createdBy", "_updatedBy"]
-        _ = [update_data.pop(key) for key in do_not_modify]
-
-        def attrsetter(name):
-            def setter(obj, val):
-                fields = name.split(".")
-                is_dict = False
-                for field in fields[0:-1]:
-                    try:
-                        obj = getattr(obj, field)
-
-                    except:
-                        try:
-                            obj[field] = {}
-                            obj = obj[field]
-                        except:
-                            raise Exception("Not a dict?")
-
-                # using object setattr to avoid adding field to touched
-                error = True
-                try:
-                    object.__setattr__(obj, fields[-1], val)
-                    error = False
-                except:
-                    obj[fields[-1]] = val
-                    error = False
-                finally:
-                    if error:
-                        raise Exception(f"Error Happened updating {obj[fields[-1]]} ")
-
-            return setter
+        doc = {k: v for k, v in update_data.items() if k not in do_not_modify}
+        doc["data"] = dict(doc["data"])
+        if "state" in doc["data"]:
+            doc["state"] = doc["data"].pop("state")
 
         def recursive_iter(u_data, path=[]):
             if isinstance(u_data, dict) and len(u_data) > 0:
@@ -102,19 +154,16 @@ class TrackedBaseModel(BaseModel):
                     yield from recursive_iter(item, path)
                     path.pop(-1)
             else:
-                dotted_path = ".".join(path)
-                yield (dotted_path, u_data)
-
-        # what was updated?
-        for updated_field_id, updated_field_val in updates.items():
-            if len(updated_field_id.split(".")) > 1 and self.is_dotted_path_dict(
-                updated_field_id
-            ):
-                attrsetter(updated_field_id)(self, updated_field_val)
-            else:
-                for dotted_path, val in recursive_iter(update_data):
-                    # print(f"working on {dotted_path} and {val}")
-                    attrsetter(dotted_path)(self, val)
+                yield (list(path), u_data)
+
+        for fields, val in recursive_iter(doc):
+            obj = self
+            for field in fields[0:-1]:
+                if isinstance(obj, BaseModel):
+                    obj = getattr(obj, field)
+                else:
+                    obj = obj.setdefault(field, {})
+            _assign(obj, fields[-1], val)
 
     def copy_touched(self):
         touched = self.touched
@@ -225,7 +274,12 @@ class SmartBit(TrackedBaseModel):
     def send_updates(self):
         new_data = self.get_all_touched_fields_dict()
         self.touched.clear()
-        self._get_comm().send_app_update(self.app_id, new_data)
+        # inside a batch_updates() scope (or an update window), queue for one batch PUT
+        batcher = current_batcher()
+        if batcher is not None:
+            batcher.add(self.app_id, new_data, self._get_comm)
+        else:
+            self._get_comm().send_app_update(self.app_id, new_data)
 
     def get_updates_for_batch(self):
         new_data = self.get_all_touched_fields_dict()
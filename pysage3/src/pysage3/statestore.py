@@ -0,0 +1,544 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from pysage3.board import Board
+from pysage3.room import Room
+from pysage3.smartbitfactory import SmartBitFactory
+from pysage3.smartbits.genericsmartbit import GenericSmartBit
+from pysage3.utils.snapshot import RESYNC_OVERLAP
+from pysage3.utils.spatial_index import doc_rect, touches_geometry
+
+logger = logging.getLogger(__name__)
+
+# SageCommunication method listing each collection
+_FETCHERS = {
+    "ROOMS": "get_rooms",
+    "BOARDS": "get_boards",
+    "APPS": "get_apps",
+    "ASSETS": "get_assets",
+    "INSIGHT": "get_alltags",
+}
+
+
+# collections whose listing can be limited to the documents changed since a time
+_DELTA_COLLECTIONS = ("BOARDS", "APPS", "ASSETS")
+
+# collections a StateStore mirrors, parents first
+_MIRRORED = ("ROOMS", "BOARDS", "APPS", "ASSETS")
+
+
+def fetch_collections(s3_comm, collections=("ROOMS", "BOARDS", "APPS", "ASSETS"), updated_since=None):
+    """
+    Lists the collections concurrently, so startup waits for the slowest request instead
+    of their sum. The documents are to be applied parents first (rooms, boards, apps).
+
+    :param s3_comm: a SageCommunication
+    :param updated_since: only the boards, apps and assets updated after this time (ms);
+        rooms and tags are always listed whole
+    :return: collection -> future of its documents (a response for INSIGHT); result()
+        raises the error of the request
+    """
+    with ThreadPoolExecutor(max_workers=len(collections)) as pool:
+        futures = {}
+        for x in collections:
+            kwargs = {}
+            if updated_since is not None and x in _DELTA_COLLECTIONS:
+                kwargs["updated_since"] = updated_since
+            futures[x] = pool.submit(getattr(s3_comm, _FETCHERS[x]), **kwargs)
+        return futures
+
+
+def find_deleted(s3_comm, known, deleted_since):
+    """
+    The documents of a mirror deleted on the server since a time, e.g. while disconnected.
+    The server's tombstones are read first, so the cost follows the number of deletions;
+    a collection whose tombstones don't go back that far is compared with a full listing.
+
+    :param s3_comm: a SageCommunication
+    :param known: collection -> ids of its documents in the mirror, taken before the call so
+        the documents created meanwhile aren't taken for deleted
+    :param deleted_since: time (ms) of the deletions to start from
+    :return: collection -> deleted ids
+    """
+    # the listing methods are named after their routes
+    with ThreadPoolExecutor(max_workers=len(known)) as pool:
+        tombstones = {
+            x: pool.submit(s3_comm.get_deleted, _FETCHERS[x], deleted_since) for x in known
+        }
+    deleted, unknown = {}, []
+    for collection, future in tombstones.items():
+        ids, complete = future.result()
+        if complete:
+            deleted[collection] = known[collection] & set(ids)
+        else:
+            unknown.append(collection)
+    if unknown:
+        logger.info(f"no tombstones back to {deleted_since} for {unknown}, listing them")
+        fetched = fetch_collections(s3_comm, unknown)
+        for collection in unknown:
+            live = {doc["_id"] for doc in fetched[collection].result()}
+            # a failed listing is empty too, don't take it for a wipe
+            deleted[collection] = known[collection] - live if live else set()
+    return deleted
+
+
+class StateStore:
+    """
+    In-memory mirror of the rooms, boards, apps and assets of a SAGE3 server.
+
+    The room -> board -> smartbits tree is kept as-is (rooms[room_id].boards[board_id].smartbits)
+    so existing code keeps working. On top of it, the store maintains secondary indexes that are
+    updated incrementally from the websocket CREATE/UPDATE/DELETE stream:
+
+        app_id   -> (room_id, board_id)
+        board_id -> {app_id}       (raw app documents, as served by /api/apps)
+        board_id -> type -> {app_id}
+        asset_id -> {app_id}       (apps whose state.assetid points to the asset)
+        tag      -> {app_id}       (labels from the INSIGHT collection)
+        room_id  -> {asset_id}
+        filename -> asset_id
+
+    Each board also keeps a spatial index (board.smartbits.index) and columnar arrays
+    (board.smartbits.geometry) of its app rectangles, moved along with the position and
+    size updates.
+
+    All the query helpers answer from these indexes, in constant or output-linear time.
+    The raw documents are kept alongside the smartbits so the store can also serve the
+    REST-shaped reads (get_apps, list_assets, ...) once `synchronized` is set.
+
+    With `lazy`, created apps are kept as documents by their board and the SmartBit is
+    only built the first time it is looked up or an update arrives for it. The indexes
+    above are filled from the documents, so queries don't build anything but their result.
+
+    `watermark` is the highest `_updatedAt` applied, where a resync after a disconnection
+    starts from. When `snapshot` (a MirrorSnapshot) is set, every document applied or
+    deleted is also written to it.
+    """
+
+    def __init__(self, lazy=False):
+        self.lazy = lazy
+        # The websocket thread writes while user code reads
+        self._lock = threading.RLock()
+        # set once the initial REST population is complete
+        self.synchronized = False
+        self.watermark = None
+        self.snapshot = None
+
+        self.rooms = {}
+        self.boards = {}
+        self.apps = {}
+        self.assets = {}
+
+        self._apps_by_board = {}
+        self._app_location = {}
+        self._apps_by_board_type = {}
+        self._apps_by_asset = {}
+        self._asset_of_app = {}
+        self._apps_by_tag = {}
+        self._tags_of_app = {}
+        self._assets_by_room = {}
+        self._assets_by_filename = {}
+
+    def _record(self, collection, doc):
+        updated_at = doc.get("_updatedAt")
+        if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+            self.watermark = updated_at
+        if self.snapshot is not None:
+            self.snapshot.put(collection, doc)
+
+    def _forget(self, collection, doc_id):
+        if self.snapshot is not None:
+            self.snapshot.delete(collection, doc_id)
+
+    # Handle Create Messages
+    def handle_create(self, collection, doc):
+        with self._lock:
+            self._record(collection, doc)
+            if collection == "ROOMS":
+                new_room = Room(doc)
+                self.rooms[new_room.id] = new_room
+            elif collection == "BOARDS":
+                new_board = Board(doc)
+                self.boards[new_board.id] = doc
+                if new_board.roomId in self.rooms:
+                    self.rooms[new_board.roomId].boards[new_board.id] = new_board
+            elif collection == "APPS":
+                self._index_raw_app(doc)
+                # we need state to be at the same level as data
+                doc["state"] = doc["data"]["state"]
+                del doc["data"]["state"]
+                room_id = doc["data"]["roomId"]
+                board_id = doc["data"]["boardId"]
+                board = self.get_board(room_id, board_id)
+                if board is None:
+                    return None
+                if self.lazy:
+                    board.smartbits.add_doc(doc["_id"], doc)
+                    self._index_app(
+                        doc["_id"], doc["data"]["type"], doc["state"].get("assetid"), room_id, board_id
+                    )
+                    return None
+                smartbit = SmartBitFactory.create_smartbit(doc)
+                if smartbit:
+                    board.smartbits[smartbit.app_id] = smartbit
+                    self._index_app(
+                        smartbit.app_id,
+                        smartbit.data.type,
+                        getattr(smartbit.state, "assetid", None),
+                        room_id,
+                        board_id,
+                    )
+                return smartbit
+            elif collection == "ASSETS":
+                self._index_asset_doc(doc)
+            elif collection == "INSIGHT":
+                self._index_tags(doc["data"]["app_id"], doc["data"].get("labels", []))
+
+    # Handle Update Messages
+    def handle_update(self, collection, doc, updates):
+        # TODO: prevent updates to fields that were touched
+        _id = doc["_id"]
+        with self._lock:
+            self._record(collection, doc)
+            if collection == "ROOMS":
+                if _id in self.rooms:
+                    self.rooms[_id].handleUpdate(doc)
+            elif collection == "BOARDS":
+                # TODO: proceed to BOARD update with the updates field passed as param
+                self.boards[_id] = doc
+            elif collection == "APPS":
+                self._index_raw_app(doc)
+                # builds the smartbit of a lazily added app, the updates are applied below
+                sb = self.get_smartbit(_id)
+                if touches_geometry(updates):
+                    self._index_geometry(_id, doc)
+                if sb is not None and type(sb) is not GenericSmartBit:
+                    # Note that set_data_form_update clear touched field
+                    sb.refresh_data_form_update(doc, updates)
+                    if any(k.startswith("state.assetid") for k in updates):
+                        self._index_asset(_id, getattr(sb.state, "assetid", None))
+                return sb
+            elif collection == "ASSETS":
+                self._drop_asset_doc(_id)
+                self._index_asset_doc(doc)
+            elif collection == "INSIGHT":
+                self._index_tags(doc["data"]["app_id"], doc["data"].get("labels", []))
+
+    # Handle Delete Messages
+    def handle_delete(self, collection, doc):
+        _id = doc["_id"]
+        with self._lock:
+            self._forget(collection, _id)
+            if collection == "ROOMS":
+                room = self.rooms.pop(_id, None)
+                if room is not None:
+                    for board_id in list(room.boards.keys()):
+                        self._drop_board(room, board_id)
+            elif collection == "BOARDS":
+                self.boards.pop(_id, None)
+                room = self.rooms.get(doc["data"]["roomId"])
+                if room is not None and _id in room.boards:
+                    self._drop_board(room, _id)
+            elif collection == "APPS":
+                return self._drop_app(_id)
+            elif collection == "ASSETS":
+                self._drop_asset_doc(_id)
+            elif collection == "INSIGHT":
+                self._index_tags(doc["data"]["app_id"], [])
+
+    def _drop_board(self, room, board_id):
+        self._forget("BOARDS", board_id)
+        board = room.boards[board_id]
+        app_ids = set(board.smartbits.ids())
+        app_ids.update(self._apps_by_board.get(board_id, ()))
+        for app_id in app_ids:
+            self._drop_app(app_id)
+        del room.boards[board_id]
+        self._apps_by_board.pop(board_id, None)
+        self._apps_by_board_type.pop(board_id, None)
+
+    def _drop_app(self, app_id):
+        self._forget("APPS", app_id)
+        raw = self.apps.pop(app_id, None)
+        if raw is not None:
+            self._apps_by_board.get(raw["data"]["boardId"], set()).discard(app_id)
+        location = self._app_location.pop(app_id, None)
+        if location is None:
+            return None
+        room_id, board_id = location
+        board = self.get_board(room_id, board_id)
+        sb = None
+        if board is not None and app_id in board.smartbits:
+            # don't build the smartbit of a lazily added app just to drop it
+            if board.smartbits.is_materialized(app_id):
+                sb = board.smartbits[app_id]
+            by_type = self._apps_by_board_type.get(board_id, {})
+            by_type.get(board.smartbits.app_type(app_id), set()).discard(app_id)
+            del board.smartbits[app_id]
+        asset_id = self._asset_of_app.pop(app_id, None)
+        if asset_id is not None:
+            self._apps_by_asset.get(asset_id, set()).discard(app_id)
+        return sb
+
+    def _index_raw_app(self, doc):
+        # shallow copies, the smartbit code moves `state` out of `data` in place
+        raw = dict(doc)
+        raw["data"] = dict(doc["data"])
+        self.apps[raw["_id"]] = raw
+        self._apps_by_board.setdefault(raw["data"]["boardId"], set()).add(raw["_id"])
+
+    def _index_asset_doc(self, doc):
+        _id = doc["_id"]
+        self.assets[_id] = doc
+        self._assets_by_room.setdefault(doc["data"].get("room"), set()).add(_id)
+        filename = doc["data"].get("originalfilename")
+        if filename is not None:
+            self._assets_by_filename[filename] = _id
+
+    def _drop_asset_doc(self, asset_id):
+        old = self.assets.pop(asset_id, None)
+        if old is None:
+            return
+        self._assets_by_room.get(old["data"].get("room"), set()).discard(asset_id)
+        filename = old["data"].get("originalfilename")
+        if self._assets_by_filename.get(filename) == asset_id:
+            del self._assets_by_filename[filename]
+
+    def _index_app(self, app_id, app_type, asset_id, room_id, board_id):
+        self._app_location[app_id] = (room_id, board_id)
+        by_type = self._apps_by_board_type.setdefault(board_id, {})
+        by_type.setdefault(app_type, set()).add(app_id)
+        self._index_asset(app_id, asset_id)
+
+    def _index_geometry(self, app_id, doc):
+        location = self._app_location.get(app_id)
+        board = self.get_board(*location) if location is not None else None
+        if board is not None:
+            board.smartbits.update_geometry(app_id, *doc_rect(doc))
+
+    def _index_asset(self, app_id, asset_id):
+        old = self._asset_of_app.pop(app_id, None)
+        if old is not None:
+            self._apps_by_asset.get(old, set()).discard(app_id)
+        if asset_id:
+            asset_id = str(asset_id)
+            self._asset_of_app[app_id] = asset_id
+            self._apps_by_asset.setdefault(asset_id, set()).add(app_id)
+
+    def _index_tags(self, app_id, labels):
+        for tag in self._tags_of_app.pop(app_id, []):
+            self._apps_by_tag.get(tag, set()).discard(app_id)
+        if labels:
+            self._tags_of_app[app_id] = list(labels)
+            for tag in labels:
+                self._apps_by_tag.setdefault(tag, set()).add(app_id)
+
+    # Resync
+    def upsert(self, collection, doc):
+        """
+        Applies a document fetched from the server after a restart or a disconnection:
+        created when unknown, replaced otherwise. Built SmartBits are refreshed in place.
+        """
+        _id = doc["_id"]
+        with self._lock:
+            if collection == "ROOMS" and _id in self.rooms:
+                return self.handle_update(collection, doc, None)
+            elif collection in ("BOARDS", "ASSETS") and _id in self.ids(collection):
+                return self.handle_update(collection, doc, None)
+            elif collection == "APPS" and _id in self._app_location:
+                board = self.get_board(*self._app_location[_id])
+                if board is None or not board.smartbits.is_materialized(_id):
+                    self._drop_app(_id)
+                    return self.handle_create(collection, doc)
+                self._record(collection, doc)
+                self._index_raw_app(doc)
+                sb = board.smartbits[_id]
+                if type(sb) is not GenericSmartBit:
+                    sb.refresh_data_from_doc(doc)
+                self._index_asset(_id, getattr(sb.state, "assetid", None))
+                self._index_geometry(_id, doc)
+                return sb
+            return self.handle_create(collection, doc)
+
+    def ids(self, collection):
+        """The ids of the documents of a collection in the store"""
+        with self._lock:
+            if collection == "ROOMS":
+                return set(self.rooms.keys())
+            elif collection == "BOARDS":
+                return set(self.boards.keys())
+            elif collection == "APPS":
+                return set(self.apps.keys()) | set(self._app_location.keys())
+            elif collection == "ASSETS":
+                return set(self.assets.keys())
+            return set()
+
+    def prune(self, collection, doc_ids):
+        """Deletes documents, e.g. the ones deleted on the server while disconnected"""
+        with self._lock:
+            for _id in doc_ids:
+                doc = self.boards.get(_id) if collection == "BOARDS" else None
+                if collection == "BOARDS" and doc is None:
+                    continue
+                self.handle_delete(collection, doc or {"_id": _id})
+
+    def prune_deleted(self, s3_comm, deleted_since, collections=_MIRRORED):
+        """Deletes the documents deleted on the server since a time (ms), see find_deleted"""
+        try:
+            known = {x: self.ids(x) for x in collections}
+            for collection, deleted in find_deleted(s3_comm, known, deleted_since).items():
+                if deleted:
+                    logger.info(f"removing {len(deleted)} {collection.lower()} deleted while offline")
+                    self.prune(collection, deleted)
+        except Exception as e:
+            logger.error(f"error while looking for deleted documents {e}")
+
+    def restore(self, snapshot, collections=_MIRRORED):
+        """
+        Loads the documents of a MirrorSnapshot, then keeps it up to date with every
+        document applied or deleted.
+
+        :return: the updated_since to fetch the changes from, None without a saved mirror
+        """
+        since = None
+        if snapshot.watermark is not None:
+            since = snapshot.since()
+            saved = snapshot.load()
+            for collection in collections:
+                for doc in saved[collection]:
+                    self.handle_create(collection, doc)
+            logger.info(f"loaded {sum(len(saved[x]) for x in collections)} documents from {snapshot.path}")
+        self.snapshot = snapshot
+        return since
+
+    def resync_since(self):
+        """The updated_since to fetch the changes from after a disconnection, None for all"""
+        if self.watermark is None:
+            return None
+        return self.watermark - RESYNC_OVERLAP
+
+    def fetch_changes(self, s3_comm, since=None, collections=_MIRRORED, extra=()):
+        """
+        Applies the documents changed on the server since `since` (ms), everything when
+        None. A listing by date can't tell about deletions: those are read from the server's
+        tombstones, in the background, see prune_deleted.
+
+        :param collections: the collections mirrored, applied parents first
+        :param extra: collections listed along but left to the caller, e.g. INSIGHT
+        :return: collection -> future of its documents, see fetch_collections
+        """
+        fetched = fetch_collections(s3_comm, tuple(collections) + tuple(extra), since)
+        for collection in collections:
+            for doc in fetched[collection].result():
+                self.upsert(collection, doc)
+        if since is not None:
+            threading.Thread(
+                target=self.prune_deleted, args=(s3_comm, since, collections), daemon=True
+            ).start()
+        return fetched
+
+    # Queries
+    def get_board(self, room_id, board_id):
+        room = self.rooms.get(room_id)
+        if room is None:
+            return None
+        return room.boards.get(board_id)
+
+    def get_location(self, app_id):
+        """Returns the (room_id, board_id) of the app or None"""
+        return self._app_location.get(app_id)
+
+    def get_smartbit(self, app_id):
+        location = self._app_location.get(app_id)
+        if location is None:
+            return None
+        board = self.get_board(*location)
+        return board.smartbits[app_id] if board is not None else None
+
+    def _resolve(self, app_ids):
+        smartbits = []
+        for app_id in app_ids:
+            sb = self.get_smartbit(app_id)
+            if sb is not None:
+                smartbits.append(sb)
+        return smartbits
+
+    def get_smartbits_by_type(self, app_type, board_id=None):
+        with self._lock:
+            if board_id is not None:
+                app_ids = list(self._apps_by_board_type.get(board_id, {}).get(app_type, ()))
+            else:
+                app_ids = [
+                    app_id
+                    for by_type in self._apps_by_board_type.values()
+                    for app_id in by_type.get(app_type, ())
+                ]
+            return self._resolve(app_ids)
+
+    def get_smartbits_by_asset(self, asset_id):
+        with self._lock:
+            return self._resolve(list(self._apps_by_asset.get(str(asset_id), ())))
+
+    def get_smartbits_by_tag(self, tag):
+        with self._lock:
+            return self._resolve(list(self._apps_by_tag.get(tag, ())))
+
+    def get_tags(self, app_id):
+        return list(self._tags_of_app.get(app_id, []))
+
+    def get_all_tags(self):
+        with self._lock:
+            return {k: list(v) for k, v in self._tags_of_app.items()}
+
+    def get_types_count(self, board_id=None):
+        with self._lock:
+            if board_id is not None:
+                boards = [self._apps_by_board_type.get(board_id, {})]
+            else:
+                boards = list(self._apps_by_board_type.values())
+            count = {}
+            for by_type in boards:
+                for app_type, app_ids in by_type.items():
+                    if app_ids:
+                        count[app_type] = count.get(app_type, 0) + len(app_ids)
+            return count
+
+    def get_assets_by_room(self, room_id):
+        with self._lock:
+            return [self.assets[x] for x in self._assets_by_room.get(room_id, ()) if x in self.assets]
+
+    def get_asset_by_filename(self, filename):
+        return self._assets_by_filename.get(filename)
+
+    def get_app_docs(self, room_id=None, board_id=None):
+        """Raw app documents, filtered like the /api/apps route"""
+        with self._lock:
+            if board_id is not None:
+                docs = [self.apps[x] for x in self._apps_by_board.get(board_id, ()) if x in self.apps]
+            else:
+                docs = list(self.apps.values())
+            if room_id is not None:
+                docs = [x for x in docs if x["data"]["roomId"] == room_id]
+            return docs
+
+    def get_board_docs(self, room_id=None):
+        with self._lock:
+            if room_id is not None:
+                room = self.rooms.get(room_id)
+                if room is None:
+                    return []
+                return [self.boards[x] for x in room.boards.keys() if x in self.boards]
+            return list(self.boards.values())
+
+    def all_smartbits(self):
+        with self._lock:
+            return self._resolve(list(self._app_location.keys()))
@@ -0,0 +1,92 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+import asyncio
+import json
+import os
+import uuid
+from typing import Callable
+
+import websockets
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSageWebsocket:
+    """
+    asyncio counterpart of SageWebsocket. The connection and its reader task live on the
+    running event loop, so no thread is involved and on_message is called on the loop.
+
+    Usage:
+        socket = AsyncSageWebsocket(conf, prod_type, on_message_fn=handler)
+        await socket.connect()
+        await socket.subscribe(["/api/apps"])
+        ...
+        await socket.clean_up()
+    """
+
+    def __init__(self, conf, prod_type, on_message_fn: Callable = None):
+        self.conf = conf
+        self.prod_type = prod_type
+        self.connected = False
+        self.ws = None
+        self._reader = None
+        if on_message_fn is not None:
+            self.on_message = on_message_fn
+
+    def on_message(self, ws, message):
+        logger.warning(
+            f"received message in default func on_message {message}, WARNING---not doing anything"
+        )
+
+    async def connect(self):
+        url = self.conf[self.prod_type]["ws_server"] + "/api"
+        headers = {"Authorization": "Bearer " + os.getenv("TOKEN")}
+        try:
+            self.ws = await websockets.connect(url, additional_headers=headers)
+        except TypeError:
+            # websockets < 14 names the argument extra_headers
+            self.ws = await websockets.connect(url, extra_headers=headers)
+        self.connected = True
+        logger.debug("Websocket connected")
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for message in self.ws:
+                try:
+                    self.on_message(self.ws, message)
+                except Exception as e:
+                    logger.error(f"error handling websocket message {e}")
+        except websockets.ConnectionClosed as e:
+            logger.error(f"websocket connection closed {e}")
+        finally:
+            self.connected = False
+
+    # Subscribe to a route
+    async def subscribe(self, routes):
+        logger.debug(f"Subscribing to {routes}")
+        if not self.connected:
+            logger.error("Cannot subscribe, the websocket is not connected")
+            return
+        for route in routes:
+            subscription_id = str(uuid.uuid4())
+            msg_sub = {"route": route, "id": subscription_id, "method": "SUB"}
+            await self.ws.send(json.dumps(msg_sub))
+
+    async def clean_up(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self._reader is not None:
+            try:
+                await asyncio.wait_for(self._reader, timeout=1)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self._reader.cancel()
+        self.connected = False
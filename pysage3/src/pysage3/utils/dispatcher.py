@@ -0,0 +1,196 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Task:
+    __slots__ = ("fn", "args", "kwargs", "name", "timeout", "queued_at", "done", "timed_out")
+
+    def __init__(self, fn, args, kwargs, name, timeout):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.name = name
+        self.timeout = timeout
+        self.queued_at = time.monotonic()
+        # guards the hand-off between the worker and the timeout watchdog
+        self.done = False
+        self.timed_out = False
+
+
+class KeyedDispatcher:
+    """
+    Runs submitted functions on a bounded thread pool, serially per key (e.g. an app_id):
+    tasks with the same key run one at a time in submission order, tasks with different keys
+    run concurrently. `submit` never blocks, so the caller (the websocket thread) keeps
+    ingesting events whatever the submitted code does.
+
+    A task running longer than its timeout is reported and its key's queue moves on. The
+    thread itself can't be interrupted: it keeps its pool worker until the function returns,
+    and its result is then discarded.
+    """
+
+    def __init__(self, max_workers=8, default_timeout=None, warn_pending=1000):
+        """
+        :param max_workers: size of the thread pool
+        :param default_timeout: seconds before a task is reported as timed out, None for no limit
+        :param warn_pending: log a warning when this many tasks are waiting
+        """
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self.warn_pending = warn_pending
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="dispatcher"
+        )
+        self._lock = threading.Lock()
+        # key -> deque of waiting tasks. A key is present while it has a task running
+        self._lanes = {}
+        self._closed = False
+
+        self._pending = 0
+        self._running = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "timed_out": 0,
+            "rejected": 0,
+            "max_pending": 0,
+            "max_lane_depth": 0,
+            "wait_time_total": 0.0,
+            "run_time_total": 0.0,
+            "run_time_max": 0.0,
+        }
+
+    def submit(self, key, fn, *args, name=None, timeout=None, **kwargs):
+        """
+        Queues fn(*args, **kwargs) behind the other tasks of key.
+        :param name: label used in logs, defaults to the function name
+        :param timeout: overrides default_timeout for this task
+        :return: False if the dispatcher is shut down
+        """
+        task = _Task(
+            fn,
+            args,
+            kwargs,
+            name or getattr(fn, "__name__", repr(fn)),
+            self.default_timeout if timeout is None else timeout,
+        )
+        with self._lock:
+            if self._closed:
+                self._stats["rejected"] += 1
+                return False
+            self._stats["submitted"] += 1
+            self._pending += 1
+            if self._pending > self._stats["max_pending"]:
+                self._stats["max_pending"] = self._pending
+                if self._pending == self.warn_pending:
+                    logger.warning(
+                        f"{self._pending} tasks waiting for {self.max_workers} workers"
+                    )
+            lane = self._lanes.get(key)
+            if lane is not None:
+                lane.append(task)
+                self._stats["max_lane_depth"] = max(
+                    self._stats["max_lane_depth"], len(lane)
+                )
+                return True
+            self._lanes[key] = deque()
+        self._start(key, task)
+        return True
+
+    def _start(self, key, task):
+        try:
+            self._pool.submit(self._run, key, task)
+        except RuntimeError:
+            # the pool was shut down in the meantime, drop what is left for the key
+            with self._lock:
+                lane = self._lanes.pop(key, None) or ()
+                self._pending -= 1 + len(lane)
+                self._stats["rejected"] += 1 + len(lane)
+
+    def _run(self, key, task):
+        started = time.monotonic()
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+            self._stats["wait_time_total"] += started - task.queued_at
+
+        watchdog = None
+        if task.timeout is not None:
+            watchdog = threading.Timer(task.timeout, self._on_timeout, (key, task))
+            watchdog.daemon = True
+            watchdog.start()
+
+        failed = False
+        try:
+            task.fn(*task.args, **task.kwargs)
+        except Exception as e:
+            failed = True
+            logger.error(f"Exception in `{task.name}` for {key}.\n{e}")
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            run_time = time.monotonic() - started
+            with self._lock:
+                self._running -= 1
+                self._stats["run_time_total"] += run_time
+                self._stats["run_time_max"] = max(self._stats["run_time_max"], run_time)
+                self._stats["failed" if failed else "completed"] += 1
+                task.done = True
+                timed_out = task.timed_out
+            if timed_out:
+                logger.warning(f"`{task.name}` for {key} finished after {run_time:.1f}s")
+            else:
+                self._next(key)
+
+    def _on_timeout(self, key, task):
+        with self._lock:
+            if task.done:
+                return
+            task.timed_out = True
+            self._stats["timed_out"] += 1
+        logger.error(
+            f"`{task.name}` for {key} still running after {task.timeout}s, moving on"
+        )
+        self._next(key)
+
+    def _next(self, key):
+        with self._lock:
+            lane = self._lanes.get(key)
+            if not lane:
+                self._lanes.pop(key, None)
+                return
+            task = lane.popleft()
+        self._start(key, task)
+
+    def metrics(self):
+        """Counters, queue depths and timings (seconds) of the dispatcher"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = self._pending
+            stats["running"] = self._running
+            stats["busy_keys"] = len(self._lanes)
+        started = stats["completed"] + stats["failed"] + stats["running"]
+        finished = stats["completed"] + stats["failed"]
+        stats["wait_time_avg"] = stats["wait_time_total"] / started if started else 0.0
+        stats["run_time_avg"] = stats["run_time_total"] / finished if finished else 0.0
+        return stats
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._closed = True
+        self._pool.shutdown(wait=wait)
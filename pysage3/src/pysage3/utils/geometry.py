@@ -0,0 +1,74 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+import threading
+
+import numpy as np
+
+
+class BoardGeometry:
+    """
+    Positions and sizes of the apps of a board, in columnar arrays.
+
+    Each app owns a row of `xy` (x, y) and `wh` (width, height); rows freed by deleted
+    apps are reused. `take` gathers the rows of a selection in one indexing operation,
+    so array code (alignments, layouts) never walks the pydantic models.
+    """
+
+    def __init__(self, capacity=64):
+        self.xy = np.zeros((capacity, 2))
+        self.wh = np.zeros((capacity, 2))
+        self._rows = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, app_id):
+        return app_id in self._rows
+
+    def _grow(self):
+        capacity = len(self.xy)
+        self.xy = np.concatenate((self.xy, np.zeros((capacity, 2))))
+        self.wh = np.concatenate((self.wh, np.zeros((capacity, 2))))
+        self._free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def update(self, app_id, x, y, width, height):
+        with self._lock:
+            row = self._rows.get(app_id)
+            if row is None:
+                if not self._free:
+                    self._grow()
+                row = self._rows[app_id] = self._free.pop()
+            self.xy[row] = (x, y)
+            self.wh[row] = (width, height)
+
+    def move(self, app_ids, xy):
+        """Sets the positions of the apps, xy being an (n, 2) array"""
+        with self._lock:
+            self.xy[self.rows(app_ids)] = xy
+
+    def remove(self, app_id):
+        with self._lock:
+            row = self._rows.pop(app_id, None)
+            if row is not None:
+                self._free.append(row)
+
+    def rows(self, app_ids):
+        """Row of each app, KeyError for an unknown app"""
+        rows = self._rows
+        return np.fromiter((rows[x] for x in app_ids), dtype=np.intp, count=len(app_ids))
+
+    def take(self, app_ids):
+        """
+        :return: (xy, wh), copies of the (n, 2) positions and sizes of the apps, in order
+        """
+        with self._lock:
+            rows = self.rows(app_ids)
+            return self.xy[rows], self.wh[rows]
@@ -3,6 +3,331 @@ import rectpack.packer
 import networkx as nx
 import graphviz
 import json
+import math
+
+import numpy as np
+
+# In-process layout engines. They work on an (n, 2) array of app dimensions
+# (width, height) and return the (n, 2) array of top-left offsets of the apps,
+# relative to the top-left corner of the layout. None forks a subprocess.
+
+
+def _target_width(dims, aspect=1.0):
+    """Row width giving a layout of roughly the given width/height ratio."""
+    area = float((dims[:, 0] * dims[:, 1]).sum())
+    return max(math.sqrt(area * aspect), float(dims[:, 0].max()))
+
+
+def extent(offsets, dims):
+    """Width and height of the bounding box of a layout."""
+    if len(dims) == 0:
+        return 0.0, 0.0
+    far = (offsets + dims).max(axis=0) - offsets.min(axis=0)
+    return float(far[0]), float(far[1])
+
+
+def shelf_pack(dims, max_width=None, gap=0.0, aspect=1.0):
+    """
+    Shelf packing: apps sorted by decreasing height are laid left to right on
+    rows ("shelves") no wider than max_width.
+
+    :param dims: (n, 2) array of app widths and heights
+    :param max_width: width of a shelf, defaults to a layout of the given aspect
+    :param gap: space between apps
+    :param aspect: width/height ratio of the layout when max_width is None
+    :return: (n, 2) array of top-left offsets
+    """
+    dims = np.asarray(dims, dtype=float).reshape(-1, 2)
+    n = len(dims)
+    offsets = np.zeros((n, 2))
+    if n == 0:
+        return offsets
+    if max_width is None:
+        max_width = _target_width(dims + gap, aspect)
+
+    order = np.argsort(-dims[:, 1], kind="stable")
+    widths = dims[order, 0] + gap
+    heights = dims[order, 1] + gap
+    ends = np.cumsum(widths)
+    x = np.empty(n)
+    y = np.empty(n)
+    start, top = 0, 0.0
+    while start < n:
+        base = ends[start - 1] if start else 0.0
+        # all the apps whose right edge fits on this shelf, at least one
+        stop = max(int(np.searchsorted(ends, base + max_width, side="right")), start + 1)
+        x[start:stop] = ends[start:stop] - widths[start:stop] - base
+        y[start:stop] = top
+        # the first app of a shelf is its tallest
+        top += heights[start]
+        start = stop
+    offsets[order, 0] = x
+    offsets[order, 1] = y
+    return offsets
+
+
+def grid_pack(dims, cols=None, gap=0.0):
+    """
+    Grid layout in the given order: columns as wide as their widest app, rows
+    as tall as their tallest app.
+
+    :param dims: (n, 2) array of app widths and heights
+    :param cols: number of columns, defaults to a square grid
+    :param gap: space between apps
+    :return: (n, 2) array of top-left offsets
+    """
+    dims = np.asarray(dims, dtype=float).reshape(-1, 2)
+    n = len(dims)
+    if n == 0:
+        return np.zeros((0, 2))
+    cols = int(cols or math.ceil(math.sqrt(n)))
+    rows = math.ceil(n / cols)
+    cells = np.zeros((rows * cols, 2))
+    cells[:n] = dims + gap
+    cells = cells.reshape(rows, cols, 2)
+    col_x = np.concatenate(([0.0], np.cumsum(cells[:, :, 0].max(axis=0))[:-1]))
+    row_y = np.concatenate(([0.0], np.cumsum(cells[:, :, 1].max(axis=1))[:-1]))
+    index = np.arange(n)
+    return np.column_stack((col_x[index % cols], row_y[index // cols]))
+
+
+def grouped_pack(dims, groups, max_width=None, gap=0.0, group_gap=None, aspect=1.0):
+    """
+    Packs the apps of each group (e.g. app type) into a block, then packs the
+    blocks, the in-process take on graphviz clusters.
+
+    :param dims: (n, 2) array of app widths and heights
+    :param groups: length n sequence of group labels
+    :param max_width: width of the layout, defaults to a layout of the given aspect
+    :param gap: space between apps
+    :param group_gap: space between groups, defaults to the median app height
+    :param aspect: width/height ratio of the layout when max_width is None
+    :return: (n, 2) array of top-left offsets
+    """
+    dims = np.asarray(dims, dtype=float).reshape(-1, 2)
+    n = len(dims)
+    offsets = np.zeros((n, 2))
+    if n == 0:
+        return offsets
+    labels, group_of = np.unique(np.asarray(groups), return_inverse=True)
+    group_of = group_of.reshape(-1)
+    if group_gap is None:
+        group_gap = float(np.median(dims[:, 1]))
+
+    members = [np.nonzero(group_of == g)[0] for g in range(len(labels))]
+    blocks = np.empty((len(labels), 2))
+    for g, index in enumerate(members):
+        offsets[index] = shelf_pack(dims[index], gap=gap)
+        blocks[g] = extent(offsets[index], dims[index] + gap)
+
+    if max_width is None:
+        # few blocks: try every shelf width and keep the closest to the aspect
+        heights = np.argsort(-blocks[:, 1], kind="stable")
+        best = None
+        for width in np.unique(np.cumsum(blocks[heights, 0] + group_gap)):
+            trial = shelf_pack(blocks, width, gap=group_gap)
+            w, h = extent(trial, blocks)
+            score = abs(math.log(w / h / aspect))
+            if best is None or score < best[0]:
+                best = (score, trial)
+        block_offsets = best[1]
+    else:
+        block_offsets = shelf_pack(blocks, max_width, gap=group_gap)
+    for g, index in enumerate(members):
+        offsets[index] += block_offsets[g]
+    return offsets
+
+
+def _candidate_pairs(centers, dims):
+    """
+    Pairs of apps (i < j) close enough to overlap, found with a uniform grid
+    whose cells are as large as most apps. The few larger apps are checked
+    against all the others.
+    """
+    n = len(centers)
+    sizes = dims.max(axis=1)
+    cell = max(float(np.percentile(sizes, 99)), 1.0)
+    large = sizes > cell
+    small = np.nonzero(~large)[0]
+    pairs_i, pairs_j = [], []
+
+    if len(small) > 1:
+        coords = np.floor(centers[small] / cell).astype(np.int64)
+        coords -= coords.min(axis=0) - 1
+        stride = int(coords[:, 1].max()) + 2
+        keys = coords[:, 0] * stride + coords[:, 1]
+        order = np.argsort(keys, kind="stable")
+        cells, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                target = keys + dx * stride + dy
+                slot = np.minimum(np.searchsorted(cells, target), len(cells) - 1)
+                src = np.nonzero(cells[slot] == target)[0]
+                count = counts[slot[src]]
+                total = int(count.sum())
+                if total == 0:
+                    continue
+                first = np.repeat(np.cumsum(count) - count, count)
+                rank = np.arange(total) - first + np.repeat(starts[slot[src]], count)
+                i = small[np.repeat(src, count)]
+                j = small[order[rank]]
+                keep = i < j
+                pairs_i.append(i[keep])
+                pairs_j.append(j[keep])
+
+    everyone = np.arange(n)
+    for i in np.nonzero(large)[0]:
+        reach = (dims[i] + dims) / 2
+        near = (np.abs(centers - centers[i]) < reach).all(axis=1)
+        # pairs of large apps are found from the smaller index only
+        near &= ~large | (everyone > i)
+        near[i] = False
+        j = np.nonzero(near)[0]
+        pairs_i.append(np.minimum(i, j))
+        pairs_j.append(np.maximum(i, j))
+
+    if not pairs_i:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+
+def overlaps(offsets, dims, gap=0.0):
+    """Number of overlapping pairs of apps in a layout."""
+    dims = np.asarray(dims, dtype=float).reshape(-1, 2) + gap
+    if len(dims) < 2:
+        return 0
+    centers = np.asarray(offsets, dtype=float) + dims / 2
+    i, j = _candidate_pairs(centers, dims)
+    depth = (dims[i] + dims[j]) / 2 - np.abs(centers[j] - centers[i])
+    return int(((depth > 1e-6).all(axis=1)).sum())
+
+
+_GOLDEN_ANGLE = math.pi * (3 - math.sqrt(5))
+
+# area given to each app on the starting spiral, in mean app areas: less room
+# leaves overlaps the separation can't undo in a few iterations
+_ROOM = 3.0
+
+
+def _settle_groups(radius, iterations=200):
+    """
+    Force-directed placement of the groups, seen as disks: pulled towards the
+    origin, pushed apart when they overlap.
+    """
+    n = len(radius)
+    if n == 1:
+        return np.zeros((1, 2))
+    # largest groups in the middle of a spiral to start with
+    order = np.argsort(-radius, kind="stable")
+    start = np.empty((n, 2))
+    ring = np.sqrt(np.arange(n)) * radius.mean() * 2
+    angle = np.arange(n) * _GOLDEN_ANGLE
+    start[order] = np.column_stack((ring * np.cos(angle), ring * np.sin(angle)))
+    centers = start
+    reach = radius[:, None] + radius[None, :]
+    np.fill_diagonal(reach, 0)
+    for step in range(iterations):
+        delta = centers[None, :, :] - centers[:, None, :]
+        distance = np.maximum(np.linalg.norm(delta, axis=2), 1e-9)
+        depth = np.maximum(reach - distance, 0)
+        if step > iterations // 2 and not depth.any():
+            break
+        push = (depth / distance)[:, :, None] * delta / 2
+        centers = centers - push.sum(axis=1)
+        # a weak pull keeps the groups together
+        if step < iterations // 2:
+            centers = centers * 0.98
+    return centers
+
+
+def force_pack(dims, groups=None, iterations=100, gap=0.0):
+    """
+    Force-directed layout. The groups are placed first, as disks pulled
+    together and pushed apart when they overlap. The apps of a group start on a
+    sunflower spiral around its center, largest first, then overlapping apps
+    push each other apart. Overlaps left at the end are removed by spreading
+    the apps around their center, which keeps their relative placement.
+    Sparser and slower than the packers (seconds for 10,000 apps).
+
+    :param dims: (n, 2) array of app widths and heights
+    :param groups: length n sequence of group labels, None for a single group
+    :param iterations: maximum number of separation iterations
+    :param gap: space between apps
+    :return: (n, 2) array of top-left offsets
+    """
+    dims = np.asarray(dims, dtype=float).reshape(-1, 2)
+    n = len(dims)
+    if n == 0:
+        return np.zeros((0, 2))
+    boxes = dims + gap
+    if groups is None:
+        group_of = np.zeros(n, dtype=np.int64)
+    else:
+        group_of = np.unique(np.asarray(groups), return_inverse=True)[1].reshape(-1)
+    n_groups = int(group_of.max()) + 1
+    sizes = boxes[:, 0] * boxes[:, 1]
+
+    # rank of each app in its group, by decreasing size
+    order = np.lexsort((-sizes, group_of))
+    counts = np.bincount(group_of, minlength=n_groups)
+    first = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - first[group_of[order]]
+
+    # spiral step giving each app _ROOM times the mean app area
+    spacing = np.sqrt(_ROOM * np.bincount(group_of, weights=sizes, minlength=n_groups) / counts / math.pi)
+    radius = np.maximum(spacing * np.sqrt(counts), boxes.max(axis=1).max() / 2)
+    middles = _settle_groups(radius)
+    r = spacing[group_of] * np.sqrt(rank)
+    angle = rank * _GOLDEN_ANGLE
+    centers = middles[group_of] + np.column_stack((r * np.cos(angle), r * np.sin(angle)))
+
+    # pairs are looked up with slightly enlarged boxes and reused for a few iterations
+    margin = float(np.median(boxes)) / 4
+    refresh = 5
+    for step in range(iterations):
+        if step % refresh == 0:
+            near_i, near_j = _candidate_pairs(centers, boxes + margin)
+        delta = centers[near_j] - centers[near_i]
+        depth = (boxes[near_i] + boxes[near_j]) / 2 - np.abs(delta)
+        hit = (depth > 1e-6).all(axis=1)
+        if not hit.any():
+            if step % refresh == 0:
+                break
+            continue
+        i, j, delta, depth = near_i[hit], near_j[hit], delta[hit], depth[hit]
+        # separate along the axis of least penetration, half the way each
+        axis = np.argmin(depth, axis=1)
+        rows = np.arange(len(i))
+        side = np.sign(delta[rows, axis])
+        # coincident centers: break the tie by index
+        side[side == 0] = 1
+        push = side * depth[rows, axis] / 2
+        shift = np.zeros((n, 2))
+        for k in (0, 1):
+            along = axis == k
+            shift[:, k] = np.bincount(j[along], weights=push[along], minlength=n) - np.bincount(
+                i[along], weights=push[along], minlength=n
+            )
+        centers += shift
+
+    # scaling the distances up never creates an overlap: use the smallest
+    # factor separating every overlapping pair along one axis
+    i, j = _candidate_pairs(centers, boxes)
+    delta = np.abs(centers[j] - centers[i])
+    reach = (boxes[i] + boxes[j]) / 2
+    hit = (reach - delta > 1e-6).all(axis=1)
+    if hit.any():
+        with np.errstate(divide="ignore"):
+            factor = (reach[hit] / delta[hit]).min(axis=1).max()
+        middle = centers.mean(axis=0)
+        centers = middle + (centers - middle) * factor * (1 + 1e-9)
+
+    offsets = centers - boxes / 2
+    return offsets - offsets.min(axis=0)
+
+
+ENGINES = ("grouped", "force", "grid", "shelf", "graphviz")
 
 
 class Layout:
@@ -13,6 +338,70 @@ class Layout:
         self._layout = None
         self._layout_dict = {}
         self._layout_method = None
+        self.app_ids = list(app_dims.keys())
+        self.dims = np.array([app_dims[x] for x in self.app_ids], dtype=float).reshape(-1, 2)
+
+    def _place(self, offsets, method, top_gutter=None, left_gutter=None):
+        """Moves the offsets of an engine into the viewport, after the gutters."""
+        if top_gutter is None:
+            top_gutter = self.viewport_dim[1] / 8
+        if left_gutter is None:
+            left_gutter = self.viewport_dim[0] / 10
+        positions = offsets + (self.viewport_coords[0] + left_gutter, self.viewport_coords[1] + top_gutter)
+        self._layout = [
+            (0, x, y, w, h, app_id)
+            for app_id, (x, y), (w, h) in zip(self.app_ids, positions.tolist(), self.dims.tolist())
+        ]
+        self._layout_dict = {x[-1]: (x[1], x[2]) for x in self._layout}
+        self._layout_method = method
+
+    def _aspect(self):
+        return self.viewport_dim[0] / self.viewport_dim[1] if self.viewport_dim[1] else 1.0
+
+    def grouped_layout(self, app_to_type, top_gutter=None, left_gutter=None):
+        """Apps packed in one block per type, the blocks packed to the viewport shape."""
+        groups = [app_to_type[x] for x in self.app_ids]
+        offsets = grouped_pack(self.dims, groups, aspect=self._aspect())
+        self._place(offsets, "grouped", top_gutter, left_gutter)
+
+    def force_layout(self, app_to_type=None, iterations=100, top_gutter=None, left_gutter=None):
+        """Force-directed layout, apps of a type clustered together."""
+        groups = None if app_to_type is None else [app_to_type[x] for x in self.app_ids]
+        offsets = force_pack(self.dims, groups, iterations=iterations)
+        self._place(offsets, "force", top_gutter, left_gutter)
+
+    def grid_layout(self, cols=None, top_gutter=None, left_gutter=None):
+        """Apps on a grid, in the order of app_dims."""
+        if cols is None and len(self.dims):
+            cols = max(1, round(math.sqrt(len(self.dims) * self._aspect())))
+        self._place(grid_pack(self.dims, cols), "grid", top_gutter, left_gutter)
+
+    def shelf_layout(self, top_gutter=None, left_gutter=None):
+        """Apps on rows by decreasing height, rows as wide as the viewport shape allows."""
+        offsets = shelf_pack(self.dims, aspect=self._aspect())
+        self._place(offsets, "shelf", top_gutter, left_gutter)
+
+    def run(self, engine, app_to_type=None, top_gutter=None, left_gutter=None):
+        """
+        Computes the layout with one of ENGINES.
+
+        :param engine: grouped, force, grid, shelf or graphviz (needs the fdp binary)
+        :param app_to_type: {app_id: type}, used by grouped, force and graphviz
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"{engine} is not a layout engine, use one of {ENGINES}")
+        if app_to_type is None:
+            app_to_type = {x: "" for x in self.app_ids}
+        if engine == "grouped":
+            self.grouped_layout(app_to_type, top_gutter, left_gutter)
+        elif engine == "force":
+            self.force_layout(app_to_type, top_gutter=top_gutter, left_gutter=left_gutter)
+        elif engine == "grid":
+            self.grid_layout(top_gutter=top_gutter, left_gutter=left_gutter)
+        elif engine == "shelf":
+            self.shelf_layout(top_gutter, left_gutter)
+        else:
+            self.fdp_graphviz_layout(app_to_type, top_gutter, left_gutter)
 
     def graphviz_layout(self,  top_gutter=None, left_gutter=None,):
 
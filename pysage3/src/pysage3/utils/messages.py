@@ -0,0 +1,54 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+import json
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+
+def set_json_decoder(loads=None):
+    """
+    Replaces the function decoding websocket messages (str or bytes -> dict).
+    None restores the default, orjson when installed, json otherwise.
+    """
+    global _loads
+    if loads is None:
+        try:
+            import orjson
+
+            loads = orjson.loads
+        except ImportError:
+            loads = json.loads
+    _loads = loads
+
+
+def decode_message(msg):
+    return _loads(msg)
+
+
+def iter_event_docs(event):
+    """
+    Yields (doc, updates) for every document of a websocket event. For UPDATE events,
+    updates is the {dotted_key: value} dict of that document, found through an
+    id -> updates map built once per event; it is None for the other event types.
+    """
+    docs = event["doc"]
+    if event["type"] != "UPDATE":
+        for doc in docs:
+            yield doc, None
+        return
+    # all updates for this message [{id: string, updates: {}}, {id:string, updates: {}}...]
+    # reversed, so that the first entry of an id wins as it used to
+    updates_by_id = {u["id"]: u["updates"] for u in reversed(event.get("updates", ()))}
+    for doc in docs:
+        yield doc, updates_by_id.get(doc["_id"], {})
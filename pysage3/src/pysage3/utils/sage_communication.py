@@ -17,6 +17,42 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def _filter_docs(docs, filters, updated_since=None):
+    """Client-side version of the server filters, for servers without multi-field search"""
+    for field, value in filters.items():
+        docs = [doc for doc in docs if doc["data"].get(field) == value]
+    if updated_since is not None:
+        docs = [doc for doc in docs if doc["_updatedAt"] > updated_since]
+    return docs
+
+
+def _query_params(filters, updated_since=None, offset=None, limit=None):
+    params = {k: v for k, v in filters.items() if v is not None}
+    if updated_since is not None:
+        params["_since"] = updated_since
+        # a paging parameter makes servers without search reject the query instead
+        # of treating _since as a field name
+        if offset is None:
+            offset = 0
+    if offset is not None:
+        params["_offset"] = offset
+    if limit is not None:
+        params["_limit"] = limit
+    return params
+
+
+def _local_page(route, r, filters, updated_since, offset, limit):
+    """The page of a query, cut from the full listing `r` of the collection"""
+    if not r.is_success:
+        raise Exception(f"couldn't list {route}: {r.status_code} {r.text}")
+    data = _filter_docs(r.json()["data"], filters, updated_since)
+    offset = offset or 0
+    if limit is None:
+        return data[offset:], None
+    next_offset = offset + limit if offset + limit < len(data) else None
+    return data[offset : offset + limit], next_offset
+
+
 class Borg:
     _shared_state = {}
 
@@ -215,20 +251,78 @@ class SageCommunication(Borg):
                 return [res.json()["pages"][p] for p in pages]
         return None
 
-    def get_assets(self, room_id=None, board_id=None, asset_id=None):
-        url = self.conf[self.prod_type]["web_server"] + self.routes["get_assets"]
-        if asset_id:
-            url += asset_id
-        r = self.httpx_client.get(url, headers=self.__headers)
-        json_data = r.json()
-        data = json_data["data"]
+    def query(self, route, filters=None, updated_since=None, offset=None, limit=None):
+        """
+        GET a collection filtered and paged by the server.
+        :param route: name of the collection route, e.g. "get_apps"
+        :param filters: {field: value} exact matches on the indexed fields of the collection
+        :param updated_since: only documents with a larger _updatedAt
+        :param offset: index of the first document of the page
+        :param limit: size of the page
+        :return: (docs, next_offset) where next_offset is None after the last page
+        """
+        url = self.conf[self.prod_type]["web_server"] + self.routes[route]
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        params = _query_params(filters, updated_since, offset, limit)
+        r = self.httpx_client.get(url, headers=self.__headers, params=params)
         if r.is_success:
-            if room_id is not None:
-                data = [app for app in data if app["data"]["roomId"] == room_id]
-            if board_id is not None:
-                data = [app for app in data if app["data"]["boardId"] == board_id]
+            json_data = r.json()
+            return json_data["data"], json_data.get("next")
+
+        # older servers only support a single query field and no paging, and a failed
+        # search must not pass for an empty result: list everything, filter locally
+        logger.warning(f"server side query on {route} failed ({r.status_code}), filtering locally")
+        r = self.httpx_client.get(url, headers=self.__headers)
+        return _local_page(route, r, filters, updated_since, offset, limit)
+
+    def query_all(self, route, filters=None, updated_since=None):
+        """All the documents of a filtered collection, following the pages of the server"""
+        # an explicit page makes the server page a single-field query as well
+        offset = 0 if any(v is not None for v in (filters or {}).values()) else None
+        data, offset = self.query(route, filters, updated_since, offset)
+        while offset is not None:
+            docs, offset = self.query(route, filters, updated_since, offset)
+            data.extend(docs)
         return data
 
+    def iter_pages(self, route, filters=None, updated_since=None, page_size=500):
+        """Yields the documents of a filtered collection one page at a time"""
+        offset = 0
+        while offset is not None:
+            docs, offset = self.query(route, filters, updated_since, offset, page_size)
+            if docs:
+                yield docs
+
+    def get_deleted(self, route, deleted_since):
+        """
+        Ids of the documents of a collection deleted since a time, from the server's tombstones.
+        :param route: name of the collection route, e.g. "get_apps"
+        :param deleted_since: time (ms) of the deletions to start from
+        :return: (ids, complete), complete is False when the tombstones don't go back that
+            far or the server doesn't keep them: the deletions are then unknown
+        """
+        url = self.conf[self.prod_type]["web_server"] + self.routes[route]
+        r = self.httpx_client.get(
+            url, headers=self.__headers, params={"_deletedSince": deleted_since}
+        )
+        if not r.is_success:
+            return [], False
+        json_data = r.json()
+        return json_data["data"], json_data.get("complete") is True
+
+    def get_assets(self, room_id=None, board_id=None, asset_id=None, updated_since=None):
+        """
+        :param board_id: ignored, assets belong to rooms
+        """
+        if asset_id:
+            url = self.conf[self.prod_type]["web_server"] + self.routes["get_assets"]
+            r = self.httpx_client.get(url + asset_id, headers=self.__headers)
+            return r.json()["data"]
+        return self.query_all("get_assets", {"room": room_id}, updated_since)
+
+    def iter_assets(self, room_id=None, updated_since=None, page_size=500):
+        return self.iter_pages("get_assets", {"room": room_id}, updated_since, page_size)
+
     def get_app(self, app_id=None, room_id=None, board_id=None):
         apps = self.get_apps(room_id, board_id, app_id)
         if apps:
@@ -236,28 +330,38 @@ class SageCommunication(Borg):
         else:
             return None
 
-    def get_apps(self, room_id=None, board_id=None, app_id=None):
+    def get_apps(
+        self, room_id=None, board_id=None, app_id=None, app_type=None, updated_since=None
+    ):
         """
-        list all the rerouces belonging to room_id
+        list all the resources belonging to room_id
         :param room_id: the id of the room to list
-        :param room_id:
-        :param board_id:
-        :return: dict representing the
+        :param board_id: the id of the board to list
+        :param app_type: only apps of this type
+        :param updated_since: only apps updated after this timestamp (ms)
+        :return: list of app documents
         """
-        url = self.conf[self.prod_type]["web_server"] + self.routes["get_apps"]
         if app_id is not None:
-            url += app_id
-        r = self.httpx_client.get(url, headers=self.__headers)
-        json_data = r.json()
-        logger.debug(f"received apps info: {json_data}")
-        data = json_data["data"]
-        if r.is_success:
-            if room_id is not None:
-                data = [app for app in data if app["data"]["roomId"] == room_id]
-            if board_id is not None:
-                data = [app for app in data if app["data"]["boardId"] == board_id]
+            url = self.conf[self.prod_type]["web_server"] + self.routes["get_apps"]
+            r = self.httpx_client.get(url + app_id, headers=self.__headers)
+            json_data = r.json()
+            logger.debug(f"received apps info: {json_data}")
+            return json_data["data"]
+        return self.query_all(
+            "get_apps",
+            {"roomId": room_id, "boardId": board_id, "type": app_type},
+            updated_since,
+        )
 
-        return data
+    def iter_apps(
+        self, room_id=None, board_id=None, app_type=None, updated_since=None, page_size=500
+    ):
+        return self.iter_pages(
+            "get_apps",
+            {"roomId": room_id, "boardId": board_id, "type": app_type},
+            updated_since,
+            page_size,
+        )
 
     def get_rooms(self):
         r = self.httpx_client.get(
@@ -279,25 +383,17 @@ class SageCommunication(Borg):
         json_data = r.json()
         return json_data
 
-    def get_boards(self, room_id=None):
+    def get_boards(self, room_id=None, updated_since=None):
         """
-        list all the resources belonging to room_id
+        list all the boards belonging to room_id
         :param room_id: the id of the room to list
-        :param room_id:
-        :param board_id:
-        :return: dict representing the
+        :param updated_since: only boards updated after this timestamp (ms)
+        :return: list of board documents
         """
-        r = self.httpx_client.get(
-            self.conf[self.prod_type]["web_server"] + self.routes["get_boards"],
-            headers=self.__headers,
-        )
-        json_data = r.json()
-        data = json_data["data"]
-        if r.is_success:
-            if room_id is not None:
-                data = [app for app in data if app["data"]["roomId"] == room_id]
+        return self.query_all("get_boards", {"roomId": room_id}, updated_since)
 
-        return data
+    def iter_boards(self, room_id=None, updated_since=None, page_size=500):
+        return self.iter_pages("get_boards", {"roomId": room_id}, updated_since, page_size)
 
 
 class AsyncSageCommunication:
@@ -317,19 +413,28 @@ class AsyncSageCommunication:
             "get_rooms": "/api/rooms/",
             "get_apps": "/api/apps/",
             "get_boards": "/api/boards/",
+            "get_tags": "/api/insight/",
+            "get_tag": "/api/insight/{}",
             "send_update": "/api/apps/{}",
             "delete_app": "/api/apps/{}",
+            "send_batch_update": "/api/apps/",
             "create_app": "/api/apps/",
             "get_assets": "/api/assets/",
+            "get_static_content": "/api/assets/static/",
             "upload_file": "/api/assets/upload",
+            "get_time": "/api/time",
             "get_configuration": "/api/configuration",
         }
+        self.web_config = None
         self._client = httpx.AsyncClient(timeout=None)
 
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def aclose(self):
         await self._client.aclose()
 
     async def get_configuration(self):
@@ -337,8 +442,23 @@ class AsyncSageCommunication:
             self.conf[self.prod_type]["web_server"] + self.routes["get_configuration"],
             headers=self.__headers,
         )
+        self.web_config = r.json()
+        return self.web_config
+
+    async def get_time(self):
+        r = await self._client.get(
+            self.conf[self.prod_type]["web_server"] + self.routes["get_time"],
+            headers=self.__headers,
+        )
         return r.json()
 
+    def format_public_url(self, asset_id):
+        """Same as SageCommunication.format_public_url, needs get_configuration() first"""
+        web_server = self.conf[self.prod_type]["files_server"]
+        sage3_namespace = uuid.UUID(self.web_config["namespace"])
+        token = uuid.uuid5(sage3_namespace, asset_id)
+        return f"{web_server}/api/files/{asset_id}/{token}"
+
     async def get_rooms(self):
         r = await self._client.get(
             self.conf[self.prod_type]["web_server"] + self.routes["get_rooms"],
@@ -347,40 +467,131 @@ class AsyncSageCommunication:
         json_data = r.json()
         return json_data["data"] if r.is_success else []
 
-    async def get_boards(self, room_id=None):
-        r = await self._client.get(
-            self.conf[self.prod_type]["web_server"] + self.routes["get_boards"],
-            headers=self.__headers,
-        )
-        json_data = r.json()
-        data = json_data["data"] if r.is_success else []
-        if room_id is not None:
-            data = [b for b in data if b["data"]["roomId"] == room_id]
-        return data
+    async def query(self, route, filters=None, updated_since=None, offset=None, limit=None):
+        """Async version of SageCommunication.query, returns (docs, next_offset)"""
+        url = self.conf[self.prod_type]["web_server"] + self.routes[route]
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        params = _query_params(filters, updated_since, offset, limit)
+        r = await self._client.get(url, headers=self.__headers, params=params)
+        if r.is_success:
+            json_data = r.json()
+            return json_data["data"], json_data.get("next")
 
-    async def get_apps(self, room_id=None, board_id=None, app_id=None):
-        url = self.conf[self.prod_type]["web_server"] + self.routes["get_apps"]
-        if app_id is not None:
-            url += app_id
+        # older servers only support a single query field and no paging
+        logger.warning(f"server side query on {route} failed ({r.status_code}), filtering locally")
         r = await self._client.get(url, headers=self.__headers)
-        json_data = r.json()
-        data = json_data["data"] if r.is_success else []
-        if room_id is not None:
-            data = [a for a in data if a["data"]["roomId"] == room_id]
-        if board_id is not None:
-            data = [a for a in data if a["data"]["boardId"] == board_id]
+        return _local_page(route, r, filters, updated_since, offset, limit)
+
+    async def query_all(self, route, filters=None, updated_since=None):
+        """Async version of SageCommunication.query_all"""
+        # an explicit page makes the server page a single-field query as well
+        offset = 0 if any(v is not None for v in (filters or {}).values()) else None
+        data, offset = await self.query(route, filters, updated_since, offset)
+        while offset is not None:
+            docs, offset = await self.query(route, filters, updated_since, offset)
+            data.extend(docs)
         return data
 
-    async def get_assets(self, room_id=None, asset_id=None):
-        url = self.conf[self.prod_type]["web_server"] + self.routes["get_assets"]
+    async def iter_pages(self, route, filters=None, updated_since=None, page_size=500):
+        """Yields the documents of a filtered collection one page at a time"""
+        offset = 0
+        while offset is not None:
+            docs, offset = await self.query(route, filters, updated_since, offset, page_size)
+            if docs:
+                yield docs
+
+    async def get_boards(self, room_id=None, updated_since=None):
+        return await self.query_all("get_boards", {"roomId": room_id}, updated_since)
+
+    def iter_boards(self, room_id=None, updated_since=None, page_size=500):
+        return self.iter_pages("get_boards", {"roomId": room_id}, updated_since, page_size)
+
+    async def get_apps(
+        self, room_id=None, board_id=None, app_id=None, app_type=None, updated_since=None
+    ):
+        if app_id is not None:
+            url = self.conf[self.prod_type]["web_server"] + self.routes["get_apps"]
+            r = await self._client.get(url + app_id, headers=self.__headers)
+            return r.json()["data"] if r.is_success else []
+        return await self.query_all(
+            "get_apps",
+            {"roomId": room_id, "boardId": board_id, "type": app_type},
+            updated_since,
+        )
+
+    def iter_apps(
+        self, room_id=None, board_id=None, app_type=None, updated_since=None, page_size=500
+    ):
+        return self.iter_pages(
+            "get_apps",
+            {"roomId": room_id, "boardId": board_id, "type": app_type},
+            updated_since,
+            page_size,
+        )
+
+    async def get_assets(self, room_id=None, asset_id=None, updated_since=None):
         if asset_id:
-            url += asset_id
-        r = await self._client.get(url, headers=self.__headers)
-        json_data = r.json()
-        data = json_data["data"] if r.is_success else []
-        if room_id is not None:
-            data = [a for a in data if a["data"]["roomId"] == room_id]
-        return data
+            url = self.conf[self.prod_type]["web_server"] + self.routes["get_assets"]
+            r = await self._client.get(url + asset_id, headers=self.__headers)
+            return r.json()["data"] if r.is_success else []
+        return await self.query_all("get_assets", {"room": room_id}, updated_since)
+
+    def iter_assets(self, room_id=None, updated_since=None, page_size=500):
+        return self.iter_pages("get_assets", {"room": room_id}, updated_since, page_size)
+
+    async def get_asset(self, asset_id):
+        asset = await self.get_assets(asset_id=asset_id)
+        if asset:
+            return asset[0]
+
+    async def get_app(self, app_id):
+        apps = await self.get_apps(app_id=app_id)
+        if apps:
+            return apps[0]
+        return None
+
+    async def get_alltags(self):
+        r = await self._client.get(
+            self.conf[self.prod_type]["web_server"] + self.routes["get_tags"],
+            headers=self.__headers,
+        )
+        return r
+
+    async def get_tags(self, app_id):
+        r = await self._client.get(
+            self.conf[self.prod_type]["web_server"] + self.routes["get_tag"].format(app_id),
+            headers=self.__headers,
+        )
+        return r
+
+    async def update_tags(self, app_id, data):
+        r = await self._client.put(
+            self.conf[self.prod_type]["web_server"] + self.routes["get_tag"].format(app_id),
+            headers=self.__headers,
+            json=data,
+        )
+        return r
+
+    async def upload_file(self, files, payload):
+        r = await self._client.post(
+            self.conf[self.prod_type]["files_server"] + self.routes["upload_file"],
+            headers=self.__headers,
+            files=files,
+            data=payload,
+        )
+        return r
+
+    async def get_pdf_text(self, asset_url, pages: List = None):
+        """Async version of SageCommunication.get_pdf_text"""
+        file_name = asset_url.split("/")[-1].split(".")[0] + "-text.json"
+        url = self.conf[self.prod_type]["files_server"] + self.routes["get_static_content"]
+        res = await self._client.get(url + file_name, headers=self.__headers)
+        if res.is_success:
+            if pages is None:
+                return res.json()["pages"]
+            else:
+                return [res.json()["pages"][p] for p in pages]
+        return None
 
     async def create_app(self, data):
         r = await self._client.post(
@@ -398,6 +609,17 @@ class AsyncSageCommunication:
         )
         return r
 
+    async def send_app_batch_update(self, data):
+        """
+        :param data: {"batch": [{"id": app_id, "updates": {...}}, ...]}
+        """
+        r = await self._client.put(
+            self.conf[self.prod_type]["web_server"] + self.routes["send_batch_update"],
+            headers=self.__headers,
+            json=data,
+        )
+        return r
+
     async def delete_app(self, app_id):
         r = await self._client.delete(
             self.conf[self.prod_type]["web_server"] + self.routes["delete_app"].format(app_id),
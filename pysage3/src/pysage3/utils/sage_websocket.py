@@ -21,18 +21,43 @@ logger = logging.getLogger(__name__)
 
 
 class SageWebsocket:
-    def __init__(self, on_message_fn: Callable = None):
+    """
+    Websocket to the SAGE3 server, run on a daemon thread.
+
+    When the connection drops, it is opened again with an exponential backoff (up to
+    `max_backoff` seconds) and the routes are subscribed again. `on_reconnect_fn` is then
+    called, on the websocket thread before any new message is handled, so the owner can
+    fetch what changed while it was disconnected.
+    """
+
+    def __init__(
+        self,
+        on_message_fn: Callable = None,
+        on_reconnect_fn: Callable = None,
+        ping_interval=30,
+        max_backoff=30,
+    ):
         self.connected = False
         self.ws = websocket.WebSocketApp(
             conf[prod_type]["ws_server"] + "/api",
             header={"Authorization": "Bearer " + os.getenv("TOKEN")},
             on_message=lambda ws, msg: self.on_message(ws, msg),
             on_error=lambda ws, msg: self.on_error(ws, msg),
-            # on_close=lambda ws: self.on_close(ws),
+            on_close=lambda ws, status, reason: self.on_close(ws, status, reason),
             on_open=lambda ws: self.on_open(ws),
         )
 
         self.wst = None
+        self.on_reconnect_fn = on_reconnect_fn
+        self.ping_interval = ping_interval
+        self.max_backoff = max_backoff
+        # routes to subscribe to again after a reconnection
+        self.routes = []
+        self.nb_connections = 0
+        # guards routes against subscriptions made while the socket opens
+        self.__lock = threading.Lock()
+        self.__open = False
+        self.__closing = threading.Event()
 
         self.received_msg_log = {}
         self.queue_list = {}
@@ -42,8 +67,28 @@ class SageWebsocket:
 
     def on_open(self, ws):
         logger.debug("Websocket connected")
+        self.nb_connections += 1
+        # subscriptions made while disconnected, or all of them after a reconnection
+        with self.__lock:
+            for route in self.routes:
+                self.__send_subscription(route)
+            self.__open = True
+        if self.nb_connections > 1:
+            logger.info("Websocket reconnected")
+            if self.on_reconnect_fn is not None:
+                try:
+                    self.on_reconnect_fn()
+                except Exception as e:
+                    logger.error(f"error while resynchronizing after a reconnection {e}")
         self.connected = True
 
+    def on_close(self, ws, status, reason):
+        with self.__lock:
+            self.__open = False
+        self.connected = False
+        if not self.__closing.is_set():
+            logger.warning(f"Websocket closed ({status} {reason})")
+
     def on_message(self, ws, message):
         logger.warning(
             f"received message in default func on_message {message}, WRANIGN---not doing anything"
@@ -80,22 +125,48 @@ class SageWebsocket:
     # Subscribe to a route
     def subscribe(self, routes):
         logger.debug(f"Subscribing to {routes}")
-        if not self.check_connection():
-            return
-
+        self.check_connection()
         # WS Message
-        for route in routes:
-            # Generate id for subscription
-            subscription_id = str(uuid.uuid4())
-            msg_sub = {"route": route, "id": subscription_id, "method": "SUB"}
-            self.ws.send(json.dumps(msg_sub))
+        with self.__lock:
+            for route in routes:
+                self.routes.append(route)
+                # otherwise sent once connected, see on_open
+                if self.__open:
+                    self.__send_subscription(route)
+
+    def __send_subscription(self, route):
+        # Generate id for subscription
+        subscription_id = str(uuid.uuid4())
+        msg_sub = {"route": route, "id": subscription_id, "method": "SUB"}
+        self.ws.send(json.dumps(msg_sub))
+
+    def __run_forever(self):
+        backoff = 1
+        while not self.__closing.is_set():
+            started = time.monotonic()
+            try:
+                self.ws.run_forever(ping_interval=self.ping_interval)
+            except Exception as e:
+                logger.error(f"websocket loop failed {e}")
+            with self.__lock:
+                self.__open = False
+            self.connected = False
+            if self.__closing.is_set():
+                break
+            # a connection that lasted resets the backoff
+            if time.monotonic() - started > self.max_backoff:
+                backoff = 1
+            logger.info(f"Websocket disconnected, reconnecting in {backoff}s")
+            self.__closing.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
 
     def run(self):
-        self.wst = threading.Thread(target=self.ws.run_forever)
+        self.wst = threading.Thread(target=self.__run_forever)
         self.wst.daemon = True
         self.wst.start()
 
     def clean_up(self):
+        self.__closing.set()
         self.ws.close()
         # try to jon thread
         nb_tries = 3
@@ -0,0 +1,153 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+import json
+import sqlite3
+import threading
+
+import logging
+
+try:
+    import orjson
+
+    _dumps, _loads = orjson.dumps, orjson.loads
+except ImportError:
+    _dumps, _loads = json.dumps, json.loads
+
+logger = logging.getLogger(__name__)
+
+# bumped when the layout of the file changes, older files are then discarded
+SNAPSHOT_VERSION = "1"
+
+# documents updated this long (ms) before the watermark are fetched again on resync,
+# in case several were written within the same millisecond
+RESYNC_OVERLAP = 1000
+
+
+class MirrorSnapshot:
+    """
+    On-disk copy of the rooms, boards, apps and assets documents of a mirror, in SQLite,
+    with the highest `_updatedAt` seen (the watermark).
+
+    The websocket handlers `put` and `delete` documents as they arrive; the changes are
+    kept in memory and written in one transaction every `flush_interval` seconds (and on
+    `flush`/`close`), so the file costs one write per interval however busy the server is.
+    On restart, `load` returns the documents and only the ones changed since `since()`
+    need to be fetched from the server.
+    """
+
+    COLLECTIONS = ("ROOMS", "BOARDS", "APPS", "ASSETS")
+
+    def __init__(self, path, server=None, flush_interval=5.0):
+        """
+        :param path: file of the snapshot, created if needed
+        :param server: url of the server mirrored, a snapshot of another server is discarded
+        :param flush_interval: seconds between writes, None to only write on flush()
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS docs "
+            "(collection TEXT, id TEXT, doc BLOB, PRIMARY KEY (collection, id)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        if meta.get("version") != SNAPSHOT_VERSION or meta.get("server") != str(server):
+            if meta:
+                logger.info(f"discarding the snapshot {path}, written for another server or version")
+            meta = {}
+            self._db.execute("DELETE FROM docs")
+            self._db.execute("DELETE FROM meta")
+            self._db.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                [("version", SNAPSHOT_VERSION), ("server", str(server))],
+            )
+            self._db.commit()
+        self.watermark = int(meta["watermark"]) if meta.get("watermark") else None
+        # (collection, id) -> doc, None for a deleted document
+        self._pending = {}
+
+        self._closed = threading.Event()
+        self._flusher = None
+        if flush_interval:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, args=(flush_interval,), daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_loop(self, interval):
+        while not self._closed.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"couldn't write the snapshot {self.path}: {e}")
+
+    def since(self):
+        """The updated_since to resync from, None without a snapshot"""
+        if self.watermark is None:
+            return None
+        return self.watermark - RESYNC_OVERLAP
+
+    def put(self, collection, doc):
+        if collection not in self.COLLECTIONS:
+            return
+        # the handlers move state out of data in place, keep the document as served
+        doc = dict(doc)
+        doc["data"] = dict(doc["data"])
+        with self._lock:
+            self._pending[(collection, doc["_id"])] = doc
+            updated_at = doc.get("_updatedAt")
+            if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+                self.watermark = updated_at
+
+    def delete(self, collection, doc_id):
+        if collection not in self.COLLECTIONS:
+            return
+        with self._lock:
+            self._pending[(collection, doc_id)] = None
+
+    def flush(self):
+        """Writes the changes received since the last flush"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            watermark = self.watermark
+            if not pending:
+                return
+            # under the lock: the connection isn't shared between concurrent writers
+            with self._db:
+                self._db.executemany(
+                    "DELETE FROM docs WHERE collection = ? AND id = ?",
+                    [key for key, doc in pending.items() if doc is None],
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO docs VALUES (?, ?, ?)",
+                    [(*key, _dumps(doc)) for key, doc in pending.items() if doc is not None],
+                )
+                if watermark is not None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO meta VALUES ('watermark', ?)", (str(watermark),)
+                    )
+
+    def load(self):
+        """
+        :return: collection -> list of documents, for the collections of COLLECTIONS
+        """
+        self.flush()
+        docs = {x: [] for x in self.COLLECTIONS}
+        with self._lock:
+            for collection, doc in self._db.execute("SELECT collection, doc FROM docs"):
+                docs[collection].append(_loads(doc))
+        return docs
+
+    def close(self):
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        self._db.close()
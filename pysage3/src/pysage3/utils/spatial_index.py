@@ -0,0 +1,314 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+import heapq
+import math
+import threading
+
+
+def smartbit_rect(smartbit):
+    """(x, y, width, height) of a smartbit"""
+    data = smartbit.data
+    return data.position.x, data.position.y, data.size.width, data.size.height
+
+
+def doc_rect(doc):
+    """(x, y, width, height) of a raw app document"""
+    data = doc["data"]
+    return (
+        data["position"]["x"],
+        data["position"]["y"],
+        data["size"]["width"],
+        data["size"]["height"],
+    )
+
+
+def touches_geometry(updates):
+    """Whether the {dotted_key: value} updates of an app move or resize it"""
+    return any(k.startswith(("position", "size")) for k in updates)
+
+
+def _intersects(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def _contains(outer, inner):
+    return (
+        outer[0] <= inner[0]
+        and outer[1] <= inner[1]
+        and inner[0] + inner[2] <= outer[0] + outer[2]
+        and inner[1] + inner[3] <= outer[1] + outer[3]
+    )
+
+
+def _distance(x, y, rect):
+    """Distance from a point to a rectangle, 0 inside"""
+    dx = max(rect[0] - x, 0, x - rect[0] - rect[2])
+    dy = max(rect[1] - y, 0, y - rect[1] - rect[3])
+    return math.hypot(dx, dy)
+
+
+class SpatialIndex:
+    """
+    Uniform grid over the app rectangles of a board.
+
+    Every app is registered in the cells its rectangle covers, so rectangle, overlap and
+    neighbour queries only look at the apps of the cells they touch instead of every app
+    of the board. Apps covering more than `max_cells` cells (huge images, maps) are kept
+    aside and checked on every query. Updates are incremental: moving or resizing an app
+    only touches the cells it leaves and enters.
+
+    Rectangles are (x, y, width, height) in board coordinates, y going down.
+    """
+
+    def __init__(self, cell_size=1024.0, max_cells=256):
+        self.cell_size = float(cell_size)
+        self.max_cells = max_cells
+        self._rects = {}
+        self._cells = {}
+        self._large = set()
+        # the websocket thread writes while user code reads
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._rects)
+
+    def __contains__(self, app_id):
+        return app_id in self._rects
+
+    def _span(self, rect):
+        size = self.cell_size
+        x, y, w, h = rect
+        return (
+            math.floor(x / size),
+            math.floor(y / size),
+            math.floor((x + max(w, 0)) / size),
+            math.floor((y + max(h, 0)) / size),
+        )
+
+    @staticmethod
+    def _cell_count(span):
+        return (span[2] - span[0] + 1) * (span[3] - span[1] + 1)
+
+    def update(self, app_id, x, y, width, height):
+        """Adds the app, or moves it to its new rectangle"""
+        rect = (float(x), float(y), float(width), float(height))
+        with self._lock:
+            old = self._rects.get(app_id)
+            if old == rect:
+                return
+            old_span = self._span(old) if old is not None else None
+            span = self._span(rect)
+            self._rects[app_id] = rect
+            if span == old_span and app_id not in self._large:
+                return
+            if old is not None:
+                self._unregister(app_id, old_span)
+            if self._cell_count(span) > self.max_cells:
+                self._large.add(app_id)
+                return
+            for i in range(span[0], span[2] + 1):
+                for j in range(span[1], span[3] + 1):
+                    self._cells.setdefault((i, j), set()).add(app_id)
+
+    def update_smartbit(self, smartbit):
+        self.update(smartbit.app_id, *smartbit_rect(smartbit))
+
+    def remove(self, app_id):
+        with self._lock:
+            rect = self._rects.pop(app_id, None)
+            if rect is not None:
+                self._unregister(app_id, self._span(rect))
+
+    def _unregister(self, app_id, span):
+        if app_id in self._large:
+            self._large.discard(app_id)
+            return
+        for i in range(span[0], span[2] + 1):
+            for j in range(span[1], span[3] + 1):
+                cell = self._cells.get((i, j))
+                if cell is not None:
+                    cell.discard(app_id)
+                    if not cell:
+                        del self._cells[(i, j)]
+
+    def clear(self):
+        with self._lock:
+            self._rects.clear()
+            self._cells.clear()
+            self._large.clear()
+
+    def rect(self, app_id):
+        """(x, y, width, height) of the app, or None"""
+        return self._rects.get(app_id)
+
+    def bounds(self):
+        """(x, y, width, height) of the box around every app, or None if empty"""
+        with self._lock:
+            if not self._rects:
+                return None
+            left = min(r[0] for r in self._rects.values())
+            top = min(r[1] for r in self._rects.values())
+            right = max(r[0] + r[2] for r in self._rects.values())
+            bottom = max(r[1] + r[3] for r in self._rects.values())
+            return left, top, right - left, bottom - top
+
+    def _candidates(self, rect):
+        """Apps of the cells touched by rect, a superset of the apps intersecting it"""
+        span = self._span(rect)
+        found = set(self._large)
+        if self._cell_count(span) > len(self._cells):
+            # a rect larger than the occupied part of the board: walk the occupied cells
+            for (i, j), cell in self._cells.items():
+                if span[0] <= i <= span[2] and span[1] <= j <= span[3]:
+                    found.update(cell)
+            return found
+        for i in range(span[0], span[2] + 1):
+            for j in range(span[1], span[3] + 1):
+                cell = self._cells.get((i, j))
+                if cell:
+                    found.update(cell)
+        return found
+
+    def apps_in_rect(self, x, y, width, height, contained=False):
+        """
+        Apps intersecting the rectangle, e.g. the apps visible in a viewport
+
+        :param contained: only the apps entirely inside the rectangle
+        :return: list of app ids
+        """
+        query = (float(x), float(y), float(width), float(height))
+        test = _contains if contained else _intersects
+        with self._lock:
+            return [
+                app_id for app_id in self._candidates(query) if test(query, self._rects[app_id])
+            ]
+
+    def overlapping(self, app_id):
+        """Apps overlapping the given app, [] if it isn't indexed"""
+        with self._lock:
+            rect = self._rects.get(app_id)
+            if rect is None:
+                return []
+            return [
+                other
+                for other in self._candidates(rect)
+                if other != app_id and _intersects(rect, self._rects[other])
+            ]
+
+    def nearest(self, pos, k=1, exclude=()):
+        """
+        The k apps closest to a point, by distance from the point to their rectangle
+
+        :param pos: (x, y)
+        :param exclude: app ids to leave out
+        :return: list of (app_id, distance), closest first
+        """
+        x, y = float(pos[0]), float(pos[1])
+        size = self.cell_size
+        with self._lock:
+            if not self._rects or k <= 0:
+                return []
+            best = []
+            seen = set(exclude)
+            # apps seen once every indexed app and every excluded id has been
+            total = len(self._rects) + len(seen - self._rects.keys())
+
+            def consider(app_ids):
+                for app_id in app_ids:
+                    if app_id in seen:
+                        continue
+                    seen.add(app_id)
+                    entry = (-_distance(x, y, self._rects[app_id]), app_id)
+                    if len(best) < k:
+                        heapq.heappush(best, entry)
+                    elif entry > best[0]:
+                        heapq.heapreplace(best, entry)
+
+            consider(self._large)
+            ci, cj = math.floor(x / size), math.floor(y / size)
+            # rings of cells around the point, until no cell left can hold a closer app:
+            # the cells of ring r are at least (r - 1) cells away from the point
+            ring = 0
+            while len(seen) < total:
+                if len(best) == k and -best[0][0] <= (ring - 1) * size:
+                    break
+                if 8 * ring > len(self._cells):
+                    # sparse board, the ring is larger than the occupied cells: walk them
+                    for cell in self._cells.values():
+                        consider(cell)
+                    break
+                for i in range(ci - ring, ci + ring + 1):
+                    if ring and ci - ring < i < ci + ring:
+                        columns = (cj - ring, cj + ring)
+                    else:
+                        columns = range(cj - ring, cj + ring + 1)
+                    for j in columns:
+                        cell = self._cells.get((i, j))
+                        if cell:
+                            consider(cell)
+                ring += 1
+            return [(app_id, -d) for d, app_id in sorted(best, reverse=True)]
+
+    def is_free(self, x, y, width, height, gap=0.0):
+        """Whether the rectangle, grown by gap on every side, overlaps no app"""
+        query = (x - gap, y - gap, width + 2 * gap, height + 2 * gap)
+        with self._lock:
+            return not any(_intersects(query, self._rects[a]) for a in self._candidates(query))
+
+    def nearest_free_slot(self, size, near, gap=20.0):
+        """
+        The empty spot closest to `near` for a new app, e.g. where to put an answer
+        next to the app it comes from
+
+        :param size: (width, height) of the new app
+        :param near: (x, y) where the center of the new app should ideally be
+        :param gap: space to keep from the other apps
+        :return: (x, y) of the top-left corner of the new app
+        """
+        width, height = float(size[0]), float(size[1])
+        x0, y0 = near[0] - width / 2, near[1] - height / 2
+        with self._lock:
+            if self.is_free(x0, y0, width, height, gap):
+                return x0, y0
+            # look around the point in growing windows, trying the spots touching the
+            # edges of the apps found there
+            radius = max(width, height, self.cell_size)
+            while True:
+                window = (x0 - radius, y0 - radius, width + 2 * radius, height + 2 * radius)
+                obstacles = [self._rects[a] for a in self._candidates(window)]
+                inside = [r for r in obstacles if _contains(window, r)]
+                xs, ys = {x0}, {y0}
+                corners = set()
+                for ax, ay, aw, ah in obstacles:
+                    left, right = ax - width - gap, ax + aw + gap
+                    above, below = ay - height - gap, ay + ah + gap
+                    xs.update((left, right))
+                    ys.update((above, below))
+                    corners.update(((left, above), (left, below), (right, above), (right, below)))
+                if len(obstacles) <= 16:
+                    spots = {(x, y) for x in xs for y in ys}
+                else:
+                    # crowded window: the spots next to one app, or aligned with the target
+                    spots = corners
+                    spots.update((x, y0) for x in xs)
+                    spots.update((x0, y) for y in ys)
+                # farther spots wait for a larger window
+                ranked = []
+                for x, y in spots:
+                    d = (x - x0) ** 2 + (y - y0) ** 2
+                    if d <= radius * radius:
+                        ranked.append((d, x, y))
+                ranked.sort()
+                for _, x, y in ranked:
+                    if self.is_free(x, y, width, height, gap):
+                        return x, y
+                if len(inside) == len(self._rects):
+                    # every app is in the window: the right of the rightmost one is free
+                    return max(ax + aw for ax, _, aw, _ in inside) + gap, y0
+                radius *= 2
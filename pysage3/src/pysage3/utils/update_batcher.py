@@ -0,0 +1,137 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+import threading
+from contextlib import contextmanager
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def merge_updates(pending, updates):
+    """
+    Merges dotted-path updates into the pending ones, the latest value winning.
+    Setting a parent path (e.g. `position`) drops its pending children (`position.x`).
+    """
+    for key, val in updates.items():
+        prefix = key + "."
+        for child in [k for k in pending if k.startswith(prefix)]:
+            del pending[child]
+        pending[key] = val
+    return pending
+
+
+class UpdateBatcher:
+    """
+    Collects the app updates produced by SmartBit.send_updates and sends them with a
+    single batch PUT (/api/apps). Updates for the same app are merged field by field.
+
+    The batcher is flushed explicitly (or when leaving a `batch_updates` scope), or,
+    when `window` is given, automatically `window` seconds after the first pending update.
+    When `sink` is given, flushed batches are handed to it instead of being sent, which
+    lets async callers send them with their own client.
+    """
+
+    def __init__(self, window=None, sink=None):
+        self.window = window
+        self.sink = sink
+        self._pending = {}
+        self._get_comm = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, app_id, updates, get_comm):
+        """
+        :param get_comm: callable returning the SageCommunication used at flush time
+        """
+        if not updates:
+            return
+        with self._lock:
+            self._get_comm = get_comm
+            merge_updates(self._pending.setdefault(app_id, {}), updates)
+            if self.window is not None and self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, {}
+            get_comm = self._get_comm
+        if not pending:
+            return None
+        batch = [{"id": app_id, "updates": updates} for app_id, updates in pending.items()]
+        if self.sink is not None:
+            return self.sink(batch)
+        try:
+            return get_comm().send_app_batch_update({"batch": batch})
+        except Exception as e:
+            logger.error(f"Error sending batch update of {len(batch)} apps. {e}")
+            return None
+
+
+_scopes = threading.local()
+_window_batcher = None
+
+
+def current_batcher():
+    """The batcher SmartBit.send_updates should queue into, or None to send right away"""
+    stack = getattr(_scopes, "stack", None)
+    if stack:
+        return stack[-1]
+    return _window_batcher
+
+
+@contextmanager
+def batch_updates(sink=None):
+    """
+    Within the scope, SmartBit.send_updates calls made by this thread are merged and sent
+    as one batch PUT on exit::
+
+        with batch_updates() as batch:
+            for sb in smartbits:
+                sb.data.position.x = 0
+                sb.send_updates()
+            batch.flush()  # optional intermediate round trip
+
+    :param sink: callable receiving each flushed batch (a list of {"id", "updates"})
+        instead of sending it. Ignored by nested scopes.
+    """
+    if getattr(_scopes, "stack", None) is None:
+        _scopes.stack = []
+    if _scopes.stack:
+        # nested scopes join the outermost one, which does the final flush
+        yield _scopes.stack[-1]
+        return
+    batcher = UpdateBatcher(sink=sink)
+    _scopes.stack.append(batcher)
+    try:
+        yield batcher
+    finally:
+        _scopes.stack.pop()
+        batcher.flush()
+
+
+def set_update_window(seconds=None):
+    """
+    Coalesce every SmartBit.send_updates made outside a `batch_updates` scope over a
+    time window of `seconds`. None restores immediate, one PUT per call, updates.
+    """
+    global _window_batcher
+    previous, _window_batcher = _window_batcher, (
+        UpdateBatcher(window=seconds) if seconds else None
+    )
+    if previous is not None:
+        previous.flush()
@@ -10,7 +10,7 @@
 # PDFAgent
 #
 
-import json, os
+import asyncio, json, math, os
 from logging import Logger
 from typing import List
 
@@ -29,7 +29,7 @@ from fastapi import HTTPException
 
 # Typing for RPC
 from libs.localtypes import PDFQuery, PDFAnswer
-from libs.utils import getModelsInfo, getPDFFile, mdCachePath
+from libs.utils import getModelsInfo, getPDFFile
 from libs.llm_manager import LLMManager
 
 # ChromaDB AI vector DB
@@ -42,9 +42,11 @@ import pymupdf4llm
 import pymupdf
 from io import BytesIO
 
-from libs.pdf.rag import generate_answer, make_reranker, NimEmbeddings
+from libs.pdf.rag import generate_answer, summarize_document, NimEmbeddings, NimReranker
 from libs.pdf.ocr import olmocr_to_markdown
-from libs.utils import isValidPDFDocument, convertPDFToImages
+from libs.pdf.md_cache import get_md_cache, content_hash
+from libs.pdf.chunk_store import get_chunk_store
+from libs.utils import isValidPDFDocument, iterPDFPageImages
 
 
 # Minimum vector-store relevance score (0..1) for a chunk to be considered a
@@ -53,11 +55,21 @@ from libs.utils import isValidPDFDocument, convertPDFToImages
 # irrelevant passages (which the model would answer from as if relevant).
 RELEVANCE_THRESHOLD = 0.7
 
+
+def _relevance(distance: float) -> float:
+    """Relevance score (0..1) of a chunk from its Chroma distance to the query.
+    pdf_docs uses Chroma's default L2 space over normalized embeddings; this is
+    LangChain's euclidean conversion, set on the store so both agree."""
+    return 1.0 - distance / math.sqrt(2)
+
 # Fallback chat-model context window (tokens) when a model config omits
 # "context_window". Used to budget how much document text is stuffed for broad
 # summary questions; too small silently truncates long/multi-PDF summaries.
 DEFAULT_CONTEXT_WINDOW = 32768
 
+# Pages of a scanned PDF sent to the vision model at the same time
+OCR_CONCURRENCY = int(os.getenv("SEER_OCR_CONCURRENCY", "4"))
+
 
 class PDFAgent:
     def __init__(
@@ -84,7 +96,13 @@ class PDFAgent:
         embeddings = None
         emb = self.manager.embed_config()
         if emb:
-            embeddings = NimEmbeddings(emb["url"], emb["model"], emb.get("apiKey"))
+            embeddings = NimEmbeddings(
+                emb["url"],
+                emb["model"],
+                emb.get("apiKey"),
+                batch_size=emb.get("batchSize") or 64,
+                max_concurrency=emb.get("concurrency") or 4,
+            )
             self.logger.info("PDF embeddings: NIM " + emb["model"])
         else:
             for prov in [self.manager.default_provider()] + self.manager.list_providers():
@@ -94,6 +112,16 @@ class PDFAgent:
                     break
         if embeddings is None:
             self.logger.error("PDFAgent> no embeddings configured")
+        self.embeddings = embeddings
+
+        # Background summarizations of newly indexed documents, by asset id
+        self._summary_tasks = {}
+
+        # Reranker shared by all questions (connection pool, ranking cache)
+        rr = self.manager.rerank_config()
+        self.reranker = (
+            NimReranker(rr["url"], rr["model"], rr.get("apiKey")) if rr else None
+        )
 
         # Create the ChromaDB client
         chromaServer = "127.0.0.1"
@@ -124,15 +152,24 @@ class PDFAgent:
             client=self.chroma,
             collection_name="pdf_docs",
             embedding_function=embeddings,
+            relevance_score_fn=_relevance,
         )
 
         # Using Langchain's Chromadb
         # Heartbeat to check the connection
         self.chroma.heartbeat()
 
-    def getMDfromPDFWithImages(self, id, content, model):
+    def _converters(self, model):
+        """Cache names of the converters that can produce a document's Markdown,
+        in preference order."""
+        names = ["pymupdf4llm", f"vision:{model}"]
+        if self.ocr:
+            names.insert(0, f"olmocr:{self.ocr['model']}")
+        return names
+
+    async def getMDfromPDFWithImages(self, id, content, model):
         """
-        Converts a PDF content to Markdown format and caches the result in a temporary file.
+        Converts a PDF content to Markdown format and caches the result.
 
         Args:
           id (str): A unique identifier for the PDF content.
@@ -142,44 +179,86 @@ class PDFAgent:
         Returns:
           str: The Markdown representation of the PDF content.
 
-        If the Markdown file already exists in the temporary directory, it reads and returns the content from the file.
-        Otherwise, it converts the PDF content to Markdown, writes it to a temporary file, and returns the Markdown content.
+        Text PDFs are converted with pymupdf4llm, scanned ones page by page with a
+        vision model. The result is stored in the shared Markdown cache, keyed by the
+        content hash and the converter.
         """
-        file_path = mdCachePath(id)
-        if os.path.exists(file_path):
-            with open(file_path, "r") as file:
-                return file.read()
+        cache = get_md_cache()
+        digest = content_hash(content)
+        md = cache.get_any(digest, self._converters(model)[-2:])
+        if md is not None:
+            return md
+
+        document = pymupdf.open(stream=BytesIO(content), filetype="pdf")
+        if await asyncio.to_thread(isValidPDFDocument, document):
+            md = await asyncio.to_thread(
+                pymupdf4llm.to_markdown,
+                document,
+                write_images=False,
+                embed_images=False,
+                # speed up the process by skipping complex pages
+                graphics_limit=500,
+                show_progress=True,
+            )
+            cache.put(digest, "pymupdf4llm", md)
         else:
-            document = pymupdf.open(stream=BytesIO(content), filetype="pdf")
-            md = ""
-            if isValidPDFDocument(document):
-                md = pymupdf4llm.to_markdown(
-                    pymupdf.open(stream=BytesIO(content), filetype="pdf"),
-                    write_images=False,
-                    embed_images=False,
-                    # speed up the process by skipping complex pages
-                    graphics_limit=500,
-                    show_progress=True,
-                )
-                with open(file_path, "w") as file:
-                    file.write(md)
-            else:
-                print("\n\n Convert to images \n\n")
-                images = convertPDFToImages(document)
-                print("\n\n Images: ", len(images), "\n\n")
-                pages = []
-
-                for i, image in enumerate(images):
-                    pages.append(self.send_pdf_image_to_llm(image, i, model))
-
-                pages.sort(key=lambda x: x["index"])
-                md = "\n\n".join(page["content"] for page in pages)
-                with open(file_path, "w") as file:
-                    file.write(md)
+            md = await self._ocr_pages(id, document, digest, model)
+        return md
 
-            return md
+    async def _ocr_pages(self, id, document, digest, model):
+        """
+        Vision-OCR of a scanned PDF. Pages are rendered lazily and OCRed
+        OCR_CONCURRENCY at a time; each page is cached as soon as it is read, so a
+        failed run resumes with the missing pages only. Pages are reassembled in order.
+        """
+        llm = self.manager.build_chat_model(model, ["vision"])
+        if llm is None:
+            raise ValueError(
+                f"Provider '{model}' has no model capable of vision (PDF OCR)"
+            )
+        cache = get_md_cache()
+        converter = f"vision:{model}"
+        n_pages = len(document)
+        texts = [cache.get(digest, converter, part=f"page{i}") for i in range(n_pages)]
+        missing = [i for i, text in enumerate(texts) if text is None]
+        self.logger.info(
+            f"pdf {id}: OCR of {len(missing)} pages ({n_pages - len(missing)} cached)"
+        )
 
-    def send_pdf_image_to_llm(self, page_base64, page_num, model):
+        pages = iterPDFPageImages(document, missing)
+        render_lock = asyncio.Lock()
+        errors = []
+
+        async def worker():
+            while True:
+                # one page rendered at a time, off the event loop
+                async with render_lock:
+                    item = await asyncio.to_thread(next, pages, None)
+                if item is None:
+                    return
+                page_num, image = item
+                try:
+                    page = await self.asend_pdf_image_to_llm(image, page_num, llm)
+                except Exception as e:
+                    self.logger.error(f"pdf {id}: OCR of page {page_num} failed ({e})")
+                    errors.append(page_num)
+                    continue
+                texts[page_num] = page["content"]
+                cache.put(digest, converter, page["content"], part=f"page{page_num}")
+
+        await asyncio.gather(*(worker() for _ in range(min(OCR_CONCURRENCY, len(missing)))))
+        if errors:
+            raise RuntimeError(
+                f"OCR failed for pages {sorted(errors)}, the other pages are cached"
+            )
+
+        md = "\n\n".join(texts)
+        cache.put(digest, converter, md)
+        for i in range(n_pages):
+            cache.remove(digest, converter, part=f"page{i}")
+        return md
+
+    def _ocr_messages(self, page_base64):
         messages: List[BaseMessage] = []
         messages.append(
             SystemMessage(
@@ -202,22 +281,32 @@ class PDFAgent:
                 ]
             )
         )
+        return messages
 
+    def send_pdf_image_to_llm(self, page_base64, page_num, model):
         llm = self.manager.build_chat_model(model, ["vision"])
         if llm is None:
             raise ValueError(
                 f"Provider '{model}' has no model capable of vision (PDF OCR)"
             )
-        response = llm.invoke(messages)
+        response = llm.invoke(self._ocr_messages(page_base64))
+        return {"index": page_num, "content": str(response.content)}
+
+    async def asend_pdf_image_to_llm(self, page_base64, page_num, llm):
+        """Async OCR of one page with an already built vision model."""
+        response = await llm.ainvoke(self._ocr_messages(page_base64))
         return {"index": page_num, "content": str(response.content)}
 
     async def _get_markdown(self, id, content, model):
-        """PDF -> Markdown, cached in /tmp/{id}.md. Prefers olmOCR (models.pdf2md)
-        and falls back to pymupdf4llm (with vision-OCR) if it's unset or fails."""
-        file_path = mdCachePath(id)
-        if os.path.exists(file_path):
-            with open(file_path, "r") as f:
-                return f.read()
+        """PDF -> Markdown, through the content-addressed Markdown cache. Prefers
+        olmOCR (models.pdf2md) and falls back to pymupdf4llm (with vision-OCR) if
+        it's unset or fails."""
+        cache = get_md_cache()
+        digest = content_hash(content)
+        md = cache.get_any(digest, self._converters(model))
+        if md is not None:
+            self.logger.info(f"pdf {id}: markdown from cache {cache.stats()}")
+            return md
 
         if self.ocr:
             try:
@@ -225,15 +314,43 @@ class PDFAgent:
                     content, self.ocr["url"], self.ocr["model"], logger=self.logger
                 )
                 if md and md.strip():
-                    with open(file_path, "w") as f:
-                        f.write(md)
+                    cache.put(digest, f"olmocr:{self.ocr['model']}", md)
                     return md
                 self.logger.error("olmOCR returned empty output; falling back")
             except Exception as e:
                 self.logger.error(f"olmOCR failed ({e}); falling back to pymupdf4llm")
 
-        # Fallback path (also handles the /tmp cache + image OCR internally)
-        return self.getMDfromPDFWithImages(id, content, model)
+        # Fallback path (also caches its result, and handles image OCR)
+        return await self.getMDfromPDFWithImages(id, content, model)
+
+    def _backfill_chunks(self, chunks, assetid: str):
+        """Copy the chunks of a document indexed in Chroma to the chunk store."""
+        stored = self.vector_store.get(where={"sage_asset_id": assetid})
+        docs = stored.get("documents") or []
+        metas = stored.get("metadatas") or []
+        ordered = sorted(
+            zip(((meta or {}).get("chunk_index", 0) for meta in metas), docs),
+            key=lambda p: p[0],
+        )
+        chunks.put(assetid, [doc for _, doc in ordered])
+        self.logger.info(f"pdf {assetid}: copied {len(ordered)} chunks to the chunk store")
+
+    def _schedule_summary(self, chunks, assetid: str, text: str, llm, model: str, context_window: int):
+        """Summarize a document in the background (once), for broad questions."""
+        if assetid in self._summary_tasks:
+            return
+
+        async def run():
+            try:
+                summary, pieces = await summarize_document(llm, text, context_window)
+                chunks.put_summaries(assetid, summary, pieces, model)
+                self.logger.info(f"pdf {assetid}: summarized ({len(pieces)} pieces)")
+            except Exception as e:
+                self.logger.error(f"pdf {assetid}: summarization failed ({e})")
+            finally:
+                self._summary_tasks.pop(assetid, None)
+
+        self._summary_tasks[assetid] = asyncio.create_task(run())
 
     async def process(self, qq: PDFQuery):
         self.logger.info(
@@ -244,20 +361,52 @@ class PDFAgent:
 
         text = ""
         if qq.assetids:
+            llm = self.manager.build_chat_model(qq.model, ["chat"])
+            if llm is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Provider '{qq.model}' has no model capable of chat (PDF)",
+                )
+
+            # Chat model context window (used for summary stuffing)
+            info = self.manager.resolve_model(qq.model, ["chat"]) or {}
+            context_window = info.get("context_window")
+            if not context_window:
+                self.logger.warning(
+                    f"Model '{qq.model}' has no context_window in config; "
+                    f"falling back to {DEFAULT_CONTEXT_WINDOW}. Set it to avoid "
+                    "truncating long/multi-PDF summaries."
+                )
+                context_window = DEFAULT_CONTEXT_WINDOW
+
             # Index each document once. Already-indexed docs are skipped entirely
             # (no fetch, no conversion, no re-embed) so repeat questions in a
             # session only pay for retrieval + answering.
+            chunks = get_chunk_store()
             for assetid in qq.assetids:
                 already = (
                     len(
-                        self.vector_store.get(where={"sage_asset_id": assetid})[
-                            "documents"
-                        ]
+                        self.vector_store.get(
+                            where={"sage_asset_id": assetid}, limit=1, include=[]
+                        )["ids"]
                     )
                     > 0
                 )
                 if already:
                     self.logger.info(f"pdf {assetid}: already indexed, skipping")
+                    if not chunks.has(assetid):
+                        # Indexed before the chunk store existed: copy it once
+                        self._backfill_chunks(chunks, assetid)
+                    if not chunks.has_summaries(assetid):
+                        stored = chunks.get([assetid]).get(assetid, [])
+                        self._schedule_summary(
+                            chunks,
+                            assetid,
+                            "\n\n".join(c for _, c in stored),
+                            llm,
+                            qq.model,
+                            context_window,
+                        )
                     continue
 
                 # First time we see this doc: fetch -> markdown -> chunk -> embed
@@ -273,99 +422,90 @@ class PDFAgent:
                 for i, d in enumerate(splits):
                     d.metadata["chunk_index"] = i
                 res = await self.vector_store.aadd_documents(documents=splits)
+                chunks.put(assetid, [d.page_content for d in splits])
                 self.logger.info(f"pdf {assetid}: indexed {len(res)} chunks")
+                # Summaries for broad questions, computed once in the background
+                self._schedule_summary(chunks, assetid, md, llm, qq.model, context_window)
 
-            llm = self.manager.build_chat_model(qq.model, ["chat"])
-            if llm is None:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Provider '{qq.model}' has no model capable of chat (PDF)",
-                )
-
-            # Chat model context window (used for summary stuffing) + reranker
-            info = self.manager.resolve_model(qq.model, ["chat"]) or {}
-            context_window = info.get("context_window")
-            if not context_window:
-                self.logger.warning(
-                    f"Model '{qq.model}' has no context_window in config; "
-                    f"falling back to {DEFAULT_CONTEXT_WINDOW}. Set it to avoid "
-                    "truncating long/multi-PDF summaries."
-                )
-                context_window = DEFAULT_CONTEXT_WINDOW
-            rr = self.manager.rerank_config()
-            rerank = (
-                make_reranker(rr["url"], rr["model"], rr.get("apiKey")) if rr else None
-            )
+            rerank = self.reranker.arerank if self.reranker else None
 
             # Retrieve PER DOCUMENT so every selected PDF is represented — a
             # single global top-k can be dominated by one document, which is why
             # cross-document questions ("common topics in the 2 papers") failed.
-            # Each document's candidates are reranked independently, then merged.
+            # The query is embedded once and the per-document searches run
+            # concurrently; all candidates are reranked in one call, then each
+            # document keeps its best chunks.
             async def retrieve(query: str):
                 n = max(1, len(qq.assetids))
                 keep = 5 if n == 1 else max(2, 8 // n)
                 fetch = max(keep * 3, 12)
-                results = []
-                for aid in qq.assetids:
-                    scored = await self.vector_store.asimilarity_search_with_relevance_scores(
-                        query, k=fetch, filter={"sage_asset_id": aid}
+                vector = await self.embeddings.aembed_query(query)
+
+                def search(aid):
+                    return self.vector_store.similarity_search_by_vector_with_relevance_scores(
+                        vector, k=fetch, filter={"sage_asset_id": aid}
                     )
-                    # Keep only chunks that clear the relevance floor; below it we
-                    # treat retrieval as empty so generate_answer falls back to
-                    # full-text rather than answering from irrelevant passages.
-                    docs = [doc for doc, score in scored if score >= RELEVANCE_THRESHOLD]
-                    docs = rerank(query, docs, keep) if rerank else docs[:keep]
-                    results.extend(docs)
-                return results
-
-            # Reconstruct full document text from the indexed chunks, grouped and
-            # labeled per document. Used for broad questions and empty retrieval.
-            def get_full_text() -> str:
-                stored = self.vector_store.get(
-                    where={"sage_asset_id": {"$in": qq.assetids}}
+
+                per_doc = await asyncio.gather(
+                    *(asyncio.to_thread(search, aid) for aid in qq.assetids)
                 )
-                docs = stored.get("documents") or []
-                metas = stored.get("metadatas") or []
+                # Keep only chunks that clear the relevance floor; below it we
+                # treat retrieval as empty so generate_answer falls back to
+                # full-text rather than answering from irrelevant passages.
+                candidates = [
+                    doc
+                    for scored in per_doc
+                    for doc, distance in scored
+                    # Chroma returns distances for vector searches
+                    if _relevance(distance) >= RELEVANCE_THRESHOLD
+                ]
+                if rerank:
+                    candidates = await rerank(query, candidates, len(candidates))
                 by_doc: dict = {}
-                for meta, doc in zip(metas, docs):
-                    aid = (meta or {}).get("sage_asset_id", "")
-                    by_doc.setdefault(aid, []).append(
-                        ((meta or {}).get("chunk_index", 0), doc)
-                    )
-                sections = []
-                for i, aid in enumerate(qq.assetids):
-                    chunks = sorted(by_doc.get(aid, []), key=lambda p: p[0])
-                    if chunks:
-                        body = "\n\n".join(c for _, c in chunks)
-                        sections.append(f"# Document {i + 1}\n\n{body}")
-                return "\n\n".join(sections)
+                for doc in candidates:
+                    chunks = by_doc.setdefault(doc.metadata.get("sage_asset_id"), [])
+                    if len(chunks) < keep:
+                        chunks.append(doc)
+                return [doc for aid in qq.assetids for doc in by_doc.get(aid, [])]
+
+            # Reconstruct the full text of each document from the indexed chunks.
+            # Used for broad questions and empty retrieval.
+            def get_documents():
+                by_doc = chunks.get(qq.assetids)
+                return [
+                    (aid, "\n\n".join(c for _, c in by_doc[aid]))
+                    for aid in qq.assetids
+                    if aid in by_doc
+                ]
 
             # The head (first chunks) of each document — where title, authors and
             # abstract live — for structural/metadata questions.
             def get_head(n_per_doc: int = 2):
-                stored = self.vector_store.get(
-                    where={"sage_asset_id": {"$in": qq.assetids}}
-                )
-                docs = stored.get("documents") or []
-                metas = stored.get("metadatas") or []
-                by_doc: dict = {}
-                for meta, doc in zip(metas, docs):
-                    aid = (meta or {}).get("sage_asset_id", "")
-                    by_doc.setdefault(aid, []).append(
-                        ((meta or {}).get("chunk_index", 0), doc, meta or {})
-                    )
+                by_doc = chunks.get(qq.assetids, limit=n_per_doc)
                 head = []
                 for aid in qq.assetids:
-                    first = sorted(by_doc.get(aid, []), key=lambda p: p[0])[:n_per_doc]
-                    for _, doc, meta in first:
+                    for index, doc in by_doc.get(aid, []):
+                        meta = {"sage_asset_id": aid, "chunk_index": index}
                         head.append(Document(page_content=doc, metadata=meta))
                 return head
 
+            # Summaries stored at indexing, waiting for those still running
+            async def get_summaries():
+                pending = [
+                    self._summary_tasks[aid]
+                    for aid in qq.assetids
+                    if aid in self._summary_tasks
+                ]
+                if pending:
+                    await asyncio.gather(*pending, return_exceptions=True)
+                return chunks.get_summaries(qq.assetids)
+
             answer = await generate_answer(
                 qq=qq,
                 llm=llm,
                 retrieve=retrieve,
-                get_full_text=get_full_text,
+                get_documents=get_documents,
+                get_summaries=get_summaries,
                 get_head=get_head,
                 context_window=context_window,
             )
@@ -10,7 +10,7 @@
 # WebAgent
 #
 
-import json, time, random
+import json, os, time
 from datetime import datetime
 from logging import Logger
 import urllib.request
@@ -31,6 +31,8 @@ from libs.localtypes import Context, WebQuery, WebAnswer
 from libs.split_image import split_image_into_tiles
 from libs.utils import getModelsInfo
 from libs.llm_manager import LLMManager
+from libs.page_pool import PagePool
+from libs.page_cache import PageCache, PageContent
 
 # Playwright
 from playwright.async_api import async_playwright
@@ -71,7 +73,13 @@ class WebAgent:
         logger.info("Initializing WebAgent")
         self.logger = logger
         self.ps3 = ps3
+        self.playwright = None
         self.browser = None
+        self.pool = None
+        # Extracted content of the pages, by URL
+        self.page_cache = PageCache.from_env()
+        # Skip images, fonts and media when only the text of a page is used
+        self.block_resources = os.getenv("SEER_WEB_BLOCK_RESOURCES", "1") != "0"
         # Capability-driven model registry (providers/tasks/settings)
         self.manager = LLMManager(getModelsInfo(ps3), logger)
         self.logger.info("Web providers: " + ", ".join(self.manager.list_providers()))
@@ -115,14 +123,23 @@ class WebAgent:
         return (self.prompt | llm | self.output_parser) if llm else None
 
     async def init(self):
-        playwright = await async_playwright().start()
-        self.browser = await playwright.chromium.launch(headless=True)
-        self.logger.info("WebAgent initialized")
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=True)
+        # Warm pages shared by the requests
+        self.pool = PagePool.from_env(
+            self.browser, self.logger, viewport={"width": ww, "height": hh}
+        )
+        await self.pool.start()
+        self.logger.info(f"WebAgent initialized ({self.pool.size} pages)")
 
     async def shutdown(self):
         self.logger.info("Deleting WebAgent")
+        if self.pool:
+            await self.pool.close()
         if self.browser:
             await self.browser.close()
+        if self.playwright:
+            await self.playwright.stop()
 
     async def process(self, qq: WebQuery):
         self.logger.info("Got web> from " + qq.user + " url: " + qq.url)
@@ -133,59 +150,47 @@ class WebAgent:
         if self.browser is None:
             return WebAnswer(r="Browser not initialized", success=False, actions=[])
 
-        # An array of user agent strings for different versions of Chrome on Windows and Mac
-        userAgentStrings = [
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36",
-        ]
-
-        context = await self.browser.new_context(
-            user_agent=userAgentStrings[random.randint(0, len(userAgentStrings) - 1)],
-            viewport={"width": ww, "height": hh},
-            device_scale_factor=1,
-            is_mobile=True,
-        )
-        page = await context.new_page()
-
         # URL to visit
         site = qq.url
-        await page.goto(url=site, timeout=5 * 1000)  # wait_until="networkidle")
 
-        # Get the title of the webpage
-        title = await page.title()
-        self.logger.info("web page title> " + title)
+        async def load_page():
+            async with self.pool.page(block_resources=self.block_resources) as page:
+                response = await self.pool.goto(page, site, timeout=5 * 1000)  # wait_until="networkidle")
+
+                # Get the title of the webpage
+                title = await page.title()
+                self.logger.info("web page title> " + title)
+
+                # Get the whole text of the webpage, and its links
+                page_text, links = await extractPage(page, title, site)
+                # Done with the page: it goes back to the pool
+            headers = response.headers if response else {}
+            return PageContent(
+                title=title,
+                markdown=page_text,
+                links=sort_and_remove_duplicate_strings(links),
+                etag=headers.get("etag"),
+                last_modified=headers.get("last-modified"),
+            )
 
-        # Get the whole text of the webpage
-        page_text = await getMarkdownFromPage(page, title, site)
+        # Follow-up questions on the same page skip the browser
+        content = await self.page_cache.get_or_fetch(site, load_page)
+        page_text = content.markdown
 
         # extras: Optional[str]  # extra request data: 'links' | 'text' | 'images' | 'pdfs'
         links = None
         pdfs = None
         if qq.extras == "links":
-            # Extract all the links (href attributes) from the page
-            links = await page.eval_on_selector_all(
-                "a", "elements => elements.map(el => el.href)"
-            )
-            links = sort_and_remove_duplicate_strings(links)
+            # All the links (href attributes) of the page
+            links = content.links
             self.logger.info("Getting links: " + str(len(links)))
         elif qq.extras == "images":
             self.logger.info("Getting images")
         elif qq.extras == "pdfs":
-            # Extract all the links (href attributes) from the page
-            pdfs = await page.eval_on_selector_all(
-                "a", "elements => elements.map(el => el.href)"
-            )
-            pdfs = sort_and_remove_duplicate_strings(pdfs)
-            pdfs = filter_strings(pdfs, "pdf")
+            pdfs = filter_strings(content.links, "pdf")
             if len(pdfs) > 0:
                 self.logger.info("Getting pdf:" + " ".join(pdfs))
 
-        # Done with the page
-        await page.close()
-        await context.close()
-
         # Save the ai name for the logs
         ai_handler.setAI(qq.model)
 
@@ -299,27 +304,30 @@ class WebAgent:
         if self.browser is None:
             return WebAnswer(r="Browser not initialized", success=False, actions=[])
 
-        page = await self.browser.new_page(
-            viewport={"width": ww, "height": hh}, device_scale_factor=1, is_mobile=True
-        )
-        site = qq.url
-        await page.goto(url=site, timeout=10 * 1000, wait_until="networkidle")
-        title = await page.title()
-        self.logger.info("web page title> " + title)
-        text = title
-
-        scroll_height = await page.evaluate("document.documentElement.scrollHeight")
-        page_height = min(1920 * 10, scroll_height)
-        aspect_ratio = ww / page_height
-        filename = "screenshot.jpg"
-        await page.screenshot(
-            path=filename,
-            type="jpeg",
-            full_page=True,
-            quality=70,
-            clip={"x": 0, "y": 0, "width": ww, "height": page_height},
-        )
-        await page.close()
+        # Screenshots need every resource: no blocking
+        async with self.pool.page() as page:
+            site = qq.url
+            await self.pool.goto(page, site, timeout=10 * 1000, wait_until="load")
+            try:
+                # Give late content a moment, without failing on chatty pages
+                await page.wait_for_load_state("networkidle", timeout=3 * 1000)
+            except Exception:
+                pass
+            title = await page.title()
+            self.logger.info("web page title> " + title)
+            text = title
+
+            scroll_height = await page.evaluate("document.documentElement.scrollHeight")
+            page_height = min(1920 * 10, scroll_height)
+            aspect_ratio = ww / page_height
+            filename = "screenshot.jpg"
+            await page.screenshot(
+                path=filename,
+                type="jpeg",
+                full_page=True,
+                quality=70,
+                clip={"x": 0, "y": 0, "width": ww, "height": page_height},
+            )
 
         # Upload the file to the room
         action1 = None
@@ -405,9 +413,45 @@ def filter_strings(arr, keyword):
     return filtered_arr
 
 
-async def getMarkdownFromPage(page, title, site):
+# Unwanted elements (ads, navigation, scripts, etc.)
+REMOVE_SELECTORS = [
+    ".advertisement",
+    ".sidebar",
+    ".navigation",
+    ".comments",
+    "script",
+    "style",
+]
+
+# Common selectors of the main content, in preference order
+CONTENT_SELECTORS = [
+    "main",
+    "article",
+    '[role="main"]',
+    ".content",
+    ".post-content",
+    ".entry-content",
+    "body",
+]
+
+EXTRACT_SCRIPT = """
+([remove, content]) => {
+  for (const selector of remove) {
+    document.querySelectorAll(selector).forEach(el => el.remove());
+  }
+  const links = Array.from(document.querySelectorAll("a"), el => el.href);
+  for (const selector of content) {
+    const element = document.querySelector(selector);
+    if (element) return { html: element.innerHTML, links };
+  }
+  return { html: null, links };
+}
+"""
+
+
+async def extractPage(page, title, site):
     """
-    Extracts the main content from a web page, removes unwanted elements, and converts it to Markdown.
+    Extracts the main content and the links of a web page, removes unwanted elements, and converts the content to Markdown.
 
     Args:
       page: The Playwright page object.
@@ -415,43 +459,12 @@ async def getMarkdownFromPage(page, title, site):
       site (str): The base URL of the page.
 
     Returns:
-      str: The cleaned Markdown representation of the page's main content.
+      tuple: The cleaned Markdown representation of the page's main content, and the href of every link.
     """
-    # Remove unwanted elements (ads, navigation, scripts, etc.)
-    remove_selectors = [
-        ".advertisement",
-        ".sidebar",
-        ".navigation",
-        ".comments",
-        "script",
-        "style",
-    ]
-    for selector in remove_selectors:
-        await page.evaluate(
-            f"""
-      document.querySelectorAll('{selector}').forEach(el => el.remove())
-    """
-        )
-
-    # Try to extract the main content using common selectors
-    content_selectors = [
-        "main",
-        "article",
-        '[role="main"]',
-        ".content",
-        ".post-content",
-        ".entry-content",
-        "body",
-    ]
-    html_content = None
-    for selector in content_selectors:
-        try:
-            element = await page.query_selector(selector)
-            if element:
-                html_content = await element.inner_html()
-                break
-        except:
-            continue
+    # Remove unwanted elements (ads, navigation, scripts, etc.), then extract the
+    # main content using common selectors and the links, in one round trip
+    extracted = await page.evaluate(EXTRACT_SCRIPT, [REMOVE_SELECTORS, CONTENT_SELECTORS])
+    html_content = extracted["html"]
 
     # Fallback: get the full page content if no main content found
     if not html_content:
@@ -459,6 +472,22 @@ async def getMarkdownFromPage(page, title, site):
 
     # Convert HTML to Markdown
     page_text = html_to_markdown(html_content, site, title)
+    return page_text, extracted["links"]
+
+
+async def getMarkdownFromPage(page, title, site):
+    """
+    Extracts the main content from a web page, removes unwanted elements, and converts it to Markdown.
+
+    Args:
+      page: The Playwright page object.
+      title (str): The title of the page.
+      site (str): The base URL of the page.
+
+    Returns:
+      str: The cleaned Markdown representation of the page's main content.
+    """
+    page_text, _ = await extractPage(page, title, site)
     return page_text
 
 
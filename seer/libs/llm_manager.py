@@ -194,13 +194,21 @@ class LLMManager:
 
         Read from the optional `embed` block of the models config:
             "embed": { "url": "http://host:8000", "model": "<model_id>" }
-        Takes precedence over provider-based embeddings for retrieval.
+        Takes precedence over provider-based embeddings for retrieval. Optional
+        `batchSize` (texts per request) and `concurrency` (parallel requests)
+        tune document indexing.
         """
         e = self.config.get("embed") or {}
         url = e.get("url")
         model = e.get("model")
         if url and model:
-            return {"url": url.rstrip("/"), "model": model, "apiKey": e.get("apiKey")}
+            return {
+                "url": url.rstrip("/"),
+                "model": model,
+                "apiKey": e.get("apiKey"),
+                "batchSize": e.get("batchSize"),
+                "concurrency": e.get("concurrency"),
+            }
         return None
 
     def ocr_config(self) -> Optional[dict]:
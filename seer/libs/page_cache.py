@@ -0,0 +1,179 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+#
+# Cache of the content extracted from web pages
+#
+# Entries hold the Markdown, title and links of a page, keyed by its normalized
+# URL. They are served as is for `ttl` seconds. After that, a page that sent an
+# ETag or a Last-Modified header is revalidated with a HEAD request and served
+# again if unchanged; otherwise it is loaded again. The least recently used
+# entries are evicted past max_bytes. Concurrent requests for the same URL
+# share one load.
+#
+# Configuration (environment):
+#   SEER_WEB_CACHE_TTL     seconds an entry is used without revalidation (default 300)
+#   SEER_WEB_CACHE_MAX_MB  size bound in MB (default 64)
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+
+# Entries older than this are loaded again, validators or not
+MAX_STALE = 24 * 3600
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Cache key of a URL: lowercase scheme and host, no default port, no
+    fragment, sorted query parameters."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+@dataclass
+class PageContent:
+    title: str
+    markdown: str
+    links: List[str]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float = field(default_factory=time.time)
+
+    @property
+    def size(self) -> int:
+        return len(self.markdown) + len(self.title) + sum(len(link) for link in self.links)
+
+
+class PageCache:
+    def __init__(self, ttl: float = 300, max_bytes: int = 64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, PageContent]" = OrderedDict()
+        self._size = 0
+        self._inflight = {}
+        self.metrics = {"hits": 0, "revalidated": 0, "shared": 0, "misses": 0, "evictions": 0}
+
+    @classmethod
+    def from_env(cls):
+        ttl = float(os.getenv("SEER_WEB_CACHE_TTL", "300"))
+        max_mb = float(os.getenv("SEER_WEB_CACHE_MAX_MB", "64"))
+        return cls(ttl, int(max_mb * 1024 * 1024))
+
+    async def get_or_fetch(
+        self, url: str, fetch: Callable[[], Awaitable[PageContent]]
+    ) -> PageContent:
+        """
+        The content of a page, from the cache when it is still valid.
+
+        Args:
+          url (str): the page URL.
+          fetch: coroutine function loading the page when needed.
+
+        Returns:
+          PageContent: the title, Markdown and links of the page.
+        """
+        key = normalize_url(url)
+        entry = await self._valid(key, url)
+        if entry is not None:
+            return entry
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.metrics["shared"] += 1
+            return await asyncio.shield(pending)
+
+        self.metrics["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            entry = await fetch()
+            self._store(key, entry)
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            # nobody may be waiting: don't log it as never retrieved
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _valid(self, key: str, url: str) -> Optional[PageContent]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        age = time.time() - entry.fetched_at
+        if age <= self.ttl:
+            self._entries.move_to_end(key)
+            self.metrics["hits"] += 1
+            return entry
+        if age <= MAX_STALE and await self._unchanged(url, entry):
+            entry.fetched_at = time.time()
+            self._entries.move_to_end(key)
+            self.metrics["revalidated"] += 1
+            return entry
+        self._drop(key)
+        return None
+
+    @staticmethod
+    async def _unchanged(url: str, entry: PageContent) -> bool:
+        """Whether the server reports the page unchanged, False when unsure."""
+        if not entry.etag and not entry.last_modified:
+            return False
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        try:
+            async with httpx.AsyncClient(timeout=3, follow_redirects=True) as client:
+                resp = await client.head(url, headers=headers)
+        except Exception:
+            return False
+        if resp.status_code == 304:
+            return True
+        if resp.status_code != 200:
+            return False
+        if entry.etag:
+            return resp.headers.get("etag") == entry.etag
+        return resp.headers.get("last-modified") == entry.last_modified
+
+    def _store(self, key: str, entry: PageContent):
+        self._drop(key)
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._size += entry.size
+        while self._size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.metrics["evictions"] += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def stats(self) -> dict:
+        stats = dict(self.metrics)
+        stats["entries"] = len(self._entries)
+        stats["bytes"] = self._size
+        return stats
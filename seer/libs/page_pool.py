@@ -0,0 +1,173 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+#
+# Pool of warm Playwright pages
+#
+# Creating a browser context and a page costs more than loading many pages, so
+# requests borrow an already open page instead. A page goes back to the pool
+# reset (about:blank, cookies cleared) and its context is recreated after
+# max_uses requests or when something went wrong with it. The pool is bounded:
+# requests wait for a free page, and a semaphore caps concurrent navigations.
+#
+# Text-only requests can block images, fonts and media, which the Markdown
+# extraction never looks at.
+#
+# Configuration (environment):
+#   SEER_WEB_POOL_SIZE        number of pages (default 4)
+#   SEER_WEB_NAVIGATIONS      concurrent navigations (default: pool size)
+#   SEER_WEB_MAX_USES         requests served by a context before it is recreated (default 50)
+
+import asyncio
+import os
+import random
+from contextlib import asynccontextmanager
+from logging import Logger
+from typing import Optional
+
+# Resource types skipped in text mode
+BLOCKED_RESOURCES = {"image", "font", "media"}
+
+# An array of user agent strings for different versions of Chrome on Windows and Mac
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36",
+]
+
+
+class _Slot:
+    """A context and its page, plus what the route handler needs to know."""
+
+    def __init__(self):
+        self.context = None
+        self.page = None
+        self.uses = 0
+        self.block_resources = False
+
+
+class PagePool:
+    def __init__(
+        self,
+        browser,
+        logger: Logger,
+        size: int = 4,
+        max_navigations: Optional[int] = None,
+        max_uses: int = 50,
+        viewport: Optional[dict] = None,
+    ):
+        self.browser = browser
+        self.logger = logger
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.viewport = viewport or {"width": 1080, "height": 1920}
+        self._idle: asyncio.Queue = asyncio.Queue()
+        for _ in range(self.size):
+            self._idle.put_nowait(_Slot())
+        self._navigations = asyncio.Semaphore(max_navigations or self.size)
+        self._slots = []
+        self.stats = {"requests": 0, "contexts_created": 0, "recycled": 0, "failures": 0}
+
+    @classmethod
+    def from_env(cls, browser, logger: Logger, viewport: Optional[dict] = None):
+        size = int(os.getenv("SEER_WEB_POOL_SIZE", "4"))
+        navigations = os.getenv("SEER_WEB_NAVIGATIONS")
+        return cls(
+            browser,
+            logger,
+            size=size,
+            max_navigations=int(navigations) if navigations else None,
+            max_uses=int(os.getenv("SEER_WEB_MAX_USES", "50")),
+            viewport=viewport,
+        )
+
+    async def start(self, warm: Optional[int] = None):
+        """Opens `warm` pages (default: all) ahead of the first requests."""
+        slots = [self._idle.get_nowait() for _ in range(min(warm or self.size, self.size))]
+        try:
+            await asyncio.gather(*(self._open(slot) for slot in slots))
+        finally:
+            for slot in slots:
+                self._idle.put_nowait(slot)
+
+    async def _open(self, slot: _Slot):
+        slot.context = await self.browser.new_context(
+            user_agent=random.choice(USER_AGENTS),
+            viewport=self.viewport,
+            device_scale_factor=1,
+            is_mobile=True,
+        )
+
+        async def route(r):
+            if slot.block_resources and r.request.resource_type in BLOCKED_RESOURCES:
+                await r.abort()
+            else:
+                await r.continue_()
+
+        await slot.context.route("**/*", route)
+        slot.page = await slot.context.new_page()
+        slot.uses = 0
+        self.stats["contexts_created"] += 1
+        if slot not in self._slots:
+            self._slots.append(slot)
+
+    async def _close(self, slot: _Slot):
+        if slot.context is not None:
+            try:
+                await slot.context.close()
+            except Exception:
+                pass
+        slot.context = None
+        slot.page = None
+
+    async def _reset(self, slot: _Slot) -> bool:
+        """Makes the page ready for the next request, False if it can't be reused."""
+        if slot.uses >= self.max_uses or slot.page is None or slot.page.is_closed():
+            return False
+        try:
+            await slot.page.goto("about:blank")
+            await slot.context.clear_cookies()
+            return True
+        except Exception:
+            return False
+
+    @asynccontextmanager
+    async def page(self, block_resources: bool = False):
+        """
+        Borrows a page, waiting for one to be free.
+
+        Args:
+          block_resources (bool): skip images, fonts and media.
+        """
+        slot = await self._idle.get()
+        ok = False
+        try:
+            if slot.page is None:
+                await self._open(slot)
+            slot.block_resources = block_resources
+            slot.uses += 1
+            self.stats["requests"] += 1
+            yield slot.page
+            ok = True
+        finally:
+            if not ok:
+                self.stats["failures"] += 1
+            if not (ok and await self._reset(slot)):
+                self.stats["recycled"] += 1
+                await self._close(slot)
+            slot.block_resources = False
+            self._idle.put_nowait(slot)
+
+    async def goto(self, page, url: str, **kwargs):
+        """page.goto, within the limit of concurrent navigations."""
+        async with self._navigations:
+            return await page.goto(url=url, **kwargs)
+
+    async def close(self):
+        await asyncio.gather(*(self._close(slot) for slot in self._slots))
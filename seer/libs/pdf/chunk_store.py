@@ -0,0 +1,189 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+#
+# Local store of the indexed PDF chunks
+#
+# The chunks sent to Chroma are also written here, keyed by (asset id, chunk
+# index), in a SQLite file next to Seer. Reading the head or the full text of a
+# document is then a range read on the primary key instead of a Chroma get()
+# pulling every chunk and its metadata over HTTP. Chroma is only used for
+# similarity search.
+#
+# The summaries of each document, computed once after indexing, are stored in
+# the same file: part -1 is the document summary, parts 0..n summarize
+# consecutive pieces of the text.
+#
+# Configuration (environment):
+#   SEER_CHUNK_STORE  path of the SQLite file (mount a volume to survive restarts)
+
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    asset_id TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (asset_id, chunk_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS summaries (
+    asset_id TEXT NOT NULL,
+    part INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    model TEXT,
+    PRIMARY KEY (asset_id, part)
+) WITHOUT ROWID;
+"""
+
+
+class ChunkStore:
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv(
+            "SEER_CHUNK_STORE",
+            os.path.join(os.path.expanduser("~"), ".cache", "seer", "chunks.sqlite"),
+        )
+        return cls(path)
+
+    def put(self, asset_id: str, texts: Iterable[str]):
+        """
+        Replaces the chunks of a document, in one transaction.
+
+        Args:
+          asset_id (str): the asset the chunks come from.
+          texts (Iterable[str]): the chunks, in document order.
+        """
+        rows = [(asset_id, i, text) for i, text in enumerate(texts)]
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM chunks WHERE asset_id = ?", (asset_id,))
+            # summaries of the previous chunks are stale
+            self._db.execute("DELETE FROM summaries WHERE asset_id = ?", (asset_id,))
+            self._db.executemany(
+                "INSERT INTO chunks (asset_id, chunk_index, text) VALUES (?, ?, ?)", rows
+            )
+
+    def has(self, asset_id: str) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM chunks WHERE asset_id = ? LIMIT 1", (asset_id,)
+            ).fetchone()
+        return row is not None
+
+    def get(
+        self, asset_ids: List[str], limit: Optional[int] = None
+    ) -> Dict[str, List[Tuple[int, str]]]:
+        """
+        Chunks of each document, in order.
+
+        Args:
+          asset_ids (List[str]): the documents to read.
+          limit (int): optional number of leading chunks per document.
+
+        Returns:
+          Dict[str, List[Tuple[int, str]]]: asset id -> [(chunk index, text)],
+          documents without chunks are left out.
+        """
+        query = "SELECT chunk_index, text FROM chunks WHERE asset_id = ?"
+        if limit is not None:
+            query += " AND chunk_index < ?"
+        query += " ORDER BY chunk_index"
+        result = {}
+        with self._lock:
+            for aid in asset_ids:
+                params = (aid,) if limit is None else (aid, limit)
+                rows = self._db.execute(query, params).fetchall()
+                if rows:
+                    result[aid] = rows
+        return result
+
+    def put_summaries(
+        self,
+        asset_id: str,
+        summary: str,
+        pieces: List[str],
+        model: Optional[str] = None,
+    ):
+        """
+        Replaces the summaries of a document, in one transaction.
+
+        Args:
+          asset_id (str): the summarized asset.
+          summary (str): summary of the whole document, "" if it needs none.
+          pieces (List[str]): summaries of consecutive pieces of the document.
+          model (str): the model that wrote them.
+        """
+        rows = [(asset_id, -1, summary, model)]
+        rows += [(asset_id, i, text, model) for i, text in enumerate(pieces)]
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM summaries WHERE asset_id = ?", (asset_id,))
+            self._db.executemany(
+                "INSERT INTO summaries (asset_id, part, text, model) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def has_summaries(self, asset_id: str) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM summaries WHERE asset_id = ? AND part = -1", (asset_id,)
+            ).fetchone()
+        return row is not None
+
+    def get_summaries(self, asset_ids: List[str]) -> Dict[str, Tuple[str, List[str]]]:
+        """
+        Stored summaries of each document.
+
+        Returns:
+          Dict[str, Tuple[str, List[str]]]: asset id -> (document summary,
+          piece summaries), documents not summarized yet are left out.
+        """
+        result = {}
+        with self._lock:
+            for aid in asset_ids:
+                rows = self._db.execute(
+                    "SELECT part, text FROM summaries WHERE asset_id = ? ORDER BY part",
+                    (aid,),
+                ).fetchall()
+                if rows and rows[0][0] == -1:
+                    result[aid] = (rows[0][1], [text for _, text in rows[1:]])
+        return result
+
+    def remove(self, asset_id: str):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM chunks WHERE asset_id = ?", (asset_id,))
+            self._db.execute("DELETE FROM summaries WHERE asset_id = ?", (asset_id,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_chunk_store() -> ChunkStore:
+    """The process-wide store, configured from the environment on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChunkStore.from_env()
+        return _store
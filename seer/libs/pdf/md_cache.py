@@ -0,0 +1,196 @@
+# -----------------------------------------------------------------------------
+#  Copyright (c) SAGE3 Development Team 2026. All Rights Reserved
+#  University of Hawaii, University of Illinois Chicago, Virginia Tech
+#
+#  Distributed under the terms of the SAGE3 License.  The full license is in
+#  the file LICENSE, distributed as part of this software.
+# -----------------------------------------------------------------------------
+
+#
+# On-disk cache of PDF -> Markdown conversions
+#
+# Entries are keyed by the SHA-256 of the PDF bytes and the converter that
+# produced them (e.g. "olmocr:<model>", "pymupdf4llm"), so the same file
+# uploaded in two rooms is converted once, and switching converters never
+# serves stale output. Each file starts with a header holding the hash of the
+# Markdown, checked on read. Writes go to a temporary file renamed into place.
+# The least recently used entries are evicted past max_bytes.
+#
+# Configuration (environment):
+#   SEER_MD_CACHE_DIR     cache directory (mount a volume to survive restarts)
+#   SEER_MD_CACHE_MAX_MB  size bound in MB (default 1024)
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from typing import Iterable, Optional
+
+_HEADER = "<!-- seer-md-cache sha256="
+_SAFE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def content_hash(content: bytes) -> str:
+    """SHA-256 hex digest of the PDF bytes, the content part of a cache key."""
+    return hashlib.sha256(content).hexdigest()
+
+
+class MarkdownCache:
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024):
+        self.directory = os.path.realpath(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = sum(size for _, size, _ in self._entries())
+        self.metrics = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "corrupt": 0}
+
+    @classmethod
+    def from_env(cls):
+        directory = os.getenv(
+            "SEER_MD_CACHE_DIR",
+            os.path.join(os.path.expanduser("~"), ".cache", "seer", "markdown"),
+        )
+        max_mb = float(os.getenv("SEER_MD_CACHE_MAX_MB", "1024"))
+        return cls(directory, int(max_mb * 1024 * 1024))
+
+    def _path(self, digest: str, converter: str, part: Optional[str] = None) -> str:
+        if not re.fullmatch(r"[0-9a-f]{64}", digest):
+            raise ValueError(f"Invalid content hash: {digest!r}")
+        name = digest + "." + _SAFE.sub("_", converter)
+        if part is not None:
+            name += "." + _SAFE.sub("_", part)
+        return os.path.join(self.directory, name + ".md")
+
+    def get(self, digest: str, converter: str, part: Optional[str] = None) -> Optional[str]:
+        """
+        Cached Markdown of a document (or of one part of it, e.g. a page), or None.
+
+        Args:
+          digest (str): content_hash() of the PDF.
+          converter (str): name of the converter that produced the Markdown.
+          part (str): optional sub-key, for partial results.
+        """
+        md = self._read(self._path(digest, converter, part))
+        self._count("hits" if md is not None else "misses")
+        return md
+
+    def get_any(self, digest: str, converters: Iterable[str]) -> Optional[str]:
+        """The first cached conversion among converters, in preference order."""
+        for converter in converters:
+            md = self._read(self._path(digest, converter))
+            if md is not None:
+                self._count("hits")
+                return md
+        self._count("misses")
+        return None
+
+    def _read(self, path: str) -> Optional[str]:
+        try:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                header = f.readline()
+                md = f.read()
+        except FileNotFoundError:
+            return None
+        if not header.startswith(_HEADER) or header[len(_HEADER) : -5] != _md_hash(md):
+            # truncated or altered entry: drop it
+            size = os.path.getsize(path)
+            self._remove(path)
+            with self._lock:
+                self.metrics["corrupt"] += 1
+                self._size = max(0, self._size - size)
+            return None
+        try:
+            # mtime is the LRU clock
+            os.utime(path)
+        except OSError:
+            pass
+        return md
+
+    def put(self, digest: str, converter: str, md: str, part: Optional[str] = None):
+        """Atomically stores the Markdown, then evicts past the size bound."""
+        path = self._path(digest, converter, part)
+        data = (_HEADER + _md_hash(md) + " -->\n" + md).encode("utf-8")
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            old = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp, path)
+        except BaseException:
+            self._remove(tmp)
+            raise
+        with self._lock:
+            self.metrics["writes"] += 1
+            self._size += len(data) - old
+            over = self._size > self.max_bytes
+        if over:
+            self._evict(keep=path)
+
+    def remove(self, digest: str, converter: str, part: Optional[str] = None):
+        path = self._path(digest, converter, part)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        self._remove(path)
+        with self._lock:
+            self._size = max(0, self._size - size)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["bytes"] = self._size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def _entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".md"):
+                st = entry.stat()
+                yield entry.path, st.st_size, st.st_mtime
+
+    def _evict(self, keep: str):
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            size = sum(e[1] for e in entries)
+            for path, entry_size, _ in entries:
+                if size <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                self._remove(path)
+                size -= entry_size
+                self.metrics["evictions"] += 1
+            self._size = size
+
+    def _count(self, name: str):
+        with self._lock:
+            self.metrics[name] += 1
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _md_hash(md: str) -> str:
+    return hashlib.sha256(md.encode("utf-8")).hexdigest()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_md_cache() -> MarkdownCache:
+    """The process-wide cache, configured from the environment on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MarkdownCache.from_env()
+        return _cache
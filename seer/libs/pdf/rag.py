@@ -3,6 +3,12 @@
 # import/def time.
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Awaitable, Callable, List, Optional
 
 import httpx
@@ -23,29 +29,109 @@ class NimEmbeddings(Embeddings):
       - 'passage' when embedding documents (indexing)
       - 'query'   when embedding the search query
     Using the wrong one badly degrades retrieval, so we set it explicitly.
+
+    Documents are sent in batches of at most `batch_size` texts, up to
+    `max_concurrency` batches at a time over pooled connections, and vectors
+    are memoized (LRU of `cache_size` entries) by a hash of the text, so a
+    repeated question or a re-indexed chunk isn't embedded again.
     """
 
-    def __init__(self, url: str, model: str, api_key: Optional[str] = None, truncate: str = "END"):
+    def __init__(
+        self,
+        url: str,
+        model: str,
+        api_key: Optional[str] = None,
+        truncate: str = "END",
+        batch_size: int = 64,
+        max_concurrency: int = 4,
+        cache_size: int = 10000,
+        timeout: float = 60,
+    ):
         self.url = url.rstrip("/")
         self.model = model
         self.truncate = truncate
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
         self.headers = {"Content-Type": "application/json", "accept": "application/json"}
         if api_key:
             self.headers["Authorization"] = f"Bearer {api_key}"
-
-    def _embed(self, texts: List[str], input_type: str) -> List[List[float]]:
-        endpoint = f"{self.url}/v1/embeddings"
-        resp = httpx.post(
-            endpoint,
-            json={
-                "input": texts,
-                "model": self.model,
-                "input_type": input_type,
-                "truncate": self.truncate,
-            },
-            headers=self.headers,
-            timeout=60,
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        limits = httpx.Limits(max_connections=self.max_concurrency)
+        self._client = httpx.Client(timeout=timeout, limits=limits)
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="embed"
         )
+        # The async client is bound to the event loop it was created in
+        self._aclient: Optional[httpx.AsyncClient] = None
+        self._aclient_loop = None
+
+    #
+    # Memoization
+    #
+
+    def _key(self, text: str, input_type: str) -> str:
+        h = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{input_type}:{h}"
+
+    def _lookup(self, keys: List[str]) -> List[Optional[List[float]]]:
+        with self._cache_lock:
+            found = []
+            for key in keys:
+                vec = self._cache.get(key)
+                if vec is not None:
+                    self._cache.move_to_end(key)
+                found.append(vec)
+            return found
+
+    def _store(self, keys: List[str], vectors: List[List[float]]):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            for key, vec in zip(keys, vectors):
+                self._cache[key] = vec
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _plan(self, texts: List[str], input_type: str):
+        """Cached vectors (None where missing) and the batches of distinct
+        texts to embed."""
+        keys = [self._key(t, input_type) for t in texts]
+        vectors = self._lookup(keys)
+        missing = {}
+        for key, text, vec in zip(keys, texts, vectors):
+            if vec is None and key not in missing:
+                missing[key] = text
+        items = list(missing.items())
+        batches = [
+            items[i : i + self.batch_size] for i in range(0, len(items), self.batch_size)
+        ]
+        return keys, vectors, batches
+
+    def _merge(self, keys, vectors, batches, results) -> List[List[float]]:
+        embedded = {}
+        for batch, batch_vectors in zip(batches, results):
+            batch_keys = [key for key, _ in batch]
+            self._store(batch_keys, batch_vectors)
+            embedded.update(zip(batch_keys, batch_vectors))
+        return [vec if vec is not None else embedded[key] for key, vec in zip(keys, vectors)]
+
+    #
+    # HTTP
+    #
+
+    def _body(self, texts: List[str], input_type: str) -> dict:
+        return {
+            "input": texts,
+            "model": self.model,
+            "input_type": input_type,
+            "truncate": self.truncate,
+        }
+
+    def _parse(self, endpoint: str, resp: httpx.Response) -> List[List[float]]:
         if resp.status_code != 200:
             raise RuntimeError(
                 f"embeddings POST {endpoint} -> HTTP {resp.status_code}: {resp.text[:300]}"
@@ -66,15 +152,69 @@ class NimEmbeddings(Embeddings):
         data = sorted(data, key=lambda d: d["index"])
         return [d["embedding"] for d in data]
 
+    def _embed_batch(self, texts: List[str], input_type: str) -> List[List[float]]:
+        endpoint = f"{self.url}/v1/embeddings"
+        resp = self._client.post(
+            endpoint, json=self._body(texts, input_type), headers=self.headers
+        )
+        return self._parse(endpoint, resp)
+
+    def _get_aclient(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._aclient is None or self._aclient_loop is not loop:
+            limits = httpx.Limits(max_connections=self.max_concurrency)
+            self._aclient = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+            self._aclient_loop = loop
+        return self._aclient
+
+    async def _aembed_batch(self, texts: List[str], input_type: str) -> List[List[float]]:
+        endpoint = f"{self.url}/v1/embeddings"
+        resp = await self._get_aclient().post(
+            endpoint, json=self._body(texts, input_type), headers=self.headers
+        )
+        return self._parse(endpoint, resp)
+
+    #
+    # Embeddings interface
+    #
+
+    def _embed(self, texts: List[str], input_type: str) -> List[List[float]]:
+        keys, vectors, batches = self._plan(texts, input_type)
+        if len(batches) == 1:
+            results = [self._embed_batch([t for _, t in batches[0]], input_type)]
+        else:
+            results = list(
+                self._pool.map(
+                    lambda b: self._embed_batch([t for _, t in b], input_type), batches
+                )
+            )
+        return self._merge(keys, vectors, batches, results)
+
+    async def _aembed(self, texts: List[str], input_type: str) -> List[List[float]]:
+        keys, vectors, batches = self._plan(texts, input_type)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(batch):
+            async with semaphore:
+                return await self._aembed_batch([t for _, t in batch], input_type)
+
+        results = await asyncio.gather(*(run(b) for b in batches))
+        return self._merge(keys, vectors, batches, results)
+
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         return self._embed(texts, "passage")
 
     def embed_query(self, text: str) -> List[float]:
         return self._embed([text], "query")[0]
 
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed(texts, "passage")
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self._aembed([text], "query"))[0]
 
-# Rough chars-per-token estimate, used to decide whether documents fit the
-# model's context window before falling back to retrieval.
+
+# Rough chars-per-token estimate, used when the model's tokenizer is unavailable.
 CHARS_PER_TOKEN = 4
 # Tokens reserved for the system prompt, question, and the model's answer.
 CONTEXT_RESERVE_TOKENS = 4000
@@ -95,39 +235,173 @@ Context:
 """
 
 
-def make_reranker(
-    url: str, model: str, api_key: Optional[str] = None
-) -> Callable[[str, List[Document], int], List[Document]]:
-    """Build a reranker that calls a NeMo Retriever Reranking NIM (/v1/ranking)
-    and returns the passages reordered by relevance. On any error it falls back
-    to the original retrieval order so a reranker outage never breaks answers."""
+class NimReranker:
+    """Client of a NeMo Retriever Reranking NIM (/v1/ranking).
 
-    headers = {"Content-Type": "application/json", "accept": "application/json"}
-    if api_key:
-        headers["Authorization"] = f"Bearer {api_key}"
+    Returns the passages reordered by relevance. On any error it falls back to
+    the original retrieval order so a reranker outage never breaks answers.
+
+    Requests share pooled connections and at most `max_concurrency` of them run
+    at a time. Rankings are memoized (LRU of `cache_size` entries) by the hash
+    of the query and of each passage. `metrics()` reports calls, cache hits,
+    errors and latencies.
+    """
 
-    def rerank(query: str, docs: List[Document], top_n: int = TOP_K) -> List[Document]:
+    def __init__(
+        self,
+        url: str,
+        model: str,
+        api_key: Optional[str] = None,
+        max_concurrency: int = 4,
+        cache_size: int = 1024,
+        timeout: float = 30,
+    ):
+        self.url = url.rstrip("/")
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", "accept": "application/json"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        limits = httpx.Limits(max_connections=self.max_concurrency)
+        self._client = httpx.Client(timeout=timeout, limits=limits)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        # The async client and its semaphore are bound to the event loop they
+        # were created in
+        self._aclient: Optional[httpx.AsyncClient] = None
+        self._asemaphore: Optional[asyncio.Semaphore] = None
+        self._aclient_loop = None
+        self._stats = {
+            "calls": 0,
+            "cache_hits": 0,
+            "requests": 0,
+            "errors": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+        }
+
+    def _key(self, query: str, docs: List[Document]) -> str:
+        h = hashlib.sha256(query.encode("utf-8"))
+        for d in docs:
+            h.update(b"\0" + hashlib.sha256(d.page_content.encode("utf-8")).digest())
+        return h.hexdigest()
+
+    def _cached(self, key: str) -> Optional[List[int]]:
+        with self._lock:
+            self._stats["calls"] += 1
+            order = self._cache.get(key)
+            if order is not None:
+                self._cache.move_to_end(key)
+                self._stats["cache_hits"] += 1
+            return order
+
+    def _record(self, key: str, order: Optional[List[int]], latency: float):
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["latency_total"] += latency
+            self._stats["latency_max"] = max(self._stats["latency_max"], latency)
+            if order is None:
+                self._stats["errors"] += 1
+            elif self.cache_size > 0:
+                self._cache[key] = order
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+    def _body(self, query: str, docs: List[Document]) -> dict:
+        return {
+            "model": self.model,
+            "query": {"text": query},
+            "passages": [{"text": d.page_content} for d in docs],
+            "truncate": "END",
+        }
+
+    @staticmethod
+    def _order(resp: httpx.Response) -> List[int]:
+        resp.raise_for_status()
+        return [r["index"] for r in resp.json()["rankings"]]
+
+    def _get_aclient(self):
+        loop = asyncio.get_running_loop()
+        if self._aclient is None or self._aclient_loop is not loop:
+            limits = httpx.Limits(max_connections=self.max_concurrency)
+            self._aclient = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+            self._asemaphore = asyncio.Semaphore(self.max_concurrency)
+            self._aclient_loop = loop
+        return self._aclient, self._asemaphore
+
+    async def arerank(
+        self, query: str, docs: List[Document], top_n: int = TOP_K
+    ) -> List[Document]:
         if not docs:
             return docs
-        try:
-            resp = httpx.post(
-                f"{url}/v1/ranking",
-                json={
-                    "model": model,
-                    "query": {"text": query},
-                    "passages": [{"text": d.page_content} for d in docs],
-                    "truncate": "END",
-                },
-                headers=headers,
-                timeout=30,
-            )
-            resp.raise_for_status()
-            rankings = resp.json()["rankings"]
-            return [docs[r["index"]] for r in rankings[:top_n]]
-        except Exception:
-            return docs[:top_n]
+        key = self._key(query, docs)
+        order = self._cached(key)
+        if order is None:
+            client, semaphore = self._get_aclient()
+            async with semaphore:
+                started = time.monotonic()
+                try:
+                    resp = await client.post(
+                        f"{self.url}/v1/ranking",
+                        json=self._body(query, docs),
+                        headers=self.headers,
+                    )
+                    order = self._order(resp)
+                except Exception:
+                    order = None
+                self._record(key, order, time.monotonic() - started)
+            if order is None:
+                return docs[:top_n]
+        return [docs[i] for i in order[:top_n]]
+
+    def rerank(self, query: str, docs: List[Document], top_n: int = TOP_K) -> List[Document]:
+        """Blocking variant of arerank, for synchronous callers."""
+        if not docs:
+            return docs
+        key = self._key(query, docs)
+        order = self._cached(key)
+        if order is None:
+            with self._slots:
+                started = time.monotonic()
+                try:
+                    resp = self._client.post(
+                        f"{self.url}/v1/ranking",
+                        json=self._body(query, docs),
+                        headers=self.headers,
+                    )
+                    order = self._order(resp)
+                except Exception:
+                    order = None
+                self._record(key, order, time.monotonic() - started)
+            if order is None:
+                return docs[:top_n]
+        return [docs[i] for i in order[:top_n]]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        requests = stats["requests"]
+        stats["latency_avg"] = stats["latency_total"] / requests if requests else 0.0
+        stats["hit_rate"] = stats["cache_hits"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
+
 
-    return rerank
+def make_reranker(
+    url: str, model: str, api_key: Optional[str] = None
+) -> Callable[[str, List[Document], int], List[Document]]:
+    """Build a blocking rerank function (query, docs, top_n) -> docs, backed by
+    a NimReranker."""
+    return NimReranker(url, model, api_key).rerank
+
+
+def make_async_reranker(
+    url: str, model: str, api_key: Optional[str] = None
+) -> Callable[[str, List[Document], int], Awaitable[List[Document]]]:
+    """Async variant of make_reranker."""
+    return NimReranker(url, model, api_key).arerank
 
 
 # Questions that need breadth across the whole document(s) rather than a few
@@ -175,26 +449,253 @@ def _format_context(candidates: List[Document], doc_label: dict) -> str:
     return "\n\n".join(parts)
 
 
+# Length of the summaries computed when a document is indexed: the whole
+# document, and each piece of the text.
+SUMMARY_TOKENS = 2000
+PIECE_SUMMARY_WORDS = 300
+
+MAP_PROMPT = """Summarize the following part of a document for a reader who
+will compare it with other documents. Keep its topics, findings, methods,
+names and numbers. Use at most {words} words.
+
+{text}
+"""
+
+
+def _fair_shares(sizes: List[int], budget: int) -> List[int]:
+    """Split budget between documents of the given sizes: each gets an equal
+    share, and what a small document doesn't use goes to the larger ones."""
+    shares = [0] * len(sizes)
+    remaining = budget
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    for pos, i in enumerate(order):
+        shares[i] = min(sizes[i], remaining // (len(sizes) - pos))
+        remaining -= shares[i]
+    return shares
+
+
+class ContextPacker:
+    """Fits the full text of several documents into a token budget.
+
+    Tokens are counted with the chat model's tokenizer (falling back to
+    CHARS_PER_TOKEN). Each document gets a fair share of the budget; documents
+    over their share are replaced by the summaries stored when they were
+    indexed (reduced further if needed), summarized by map-reduce when there
+    are none, or cut to their share when `summarize` is False. Packed contexts
+    are cached per (asset set, budget, model).
+    """
+
+    def __init__(self, cache_size: int = 64, map_concurrency: int = 4, max_rounds: int = 2):
+        self.cache_size = cache_size
+        self.map_concurrency = map_concurrency
+        self.max_rounds = max_rounds
+        self._cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def count_tokens(llm, text: str) -> int:
+        try:
+            return llm.get_num_tokens(text)
+        except Exception:
+            return len(text) // CHARS_PER_TOKEN + 1
+
+    def truncate(self, llm, text: str, max_tokens: int) -> str:
+        """The longest prefix of text within max_tokens (cut at a paragraph or
+        line break when there is one nearby)."""
+        tokens = self.count_tokens(llm, text)
+        while tokens > max_tokens and text:
+            text = text[: max(0, int(len(text) * max_tokens / tokens * 0.95))]
+            cut = max(text.rfind("\n\n"), text.rfind("\n"))
+            if cut > len(text) * 0.8:
+                text = text[:cut]
+            tokens = self.count_tokens(llm, text)
+        return text
+
+    def _pieces(self, llm, text: str, piece_tokens: int) -> List[str]:
+        """Consecutive paragraphs of text, grouped in pieces of ~piece_tokens."""
+        pieces, current, size = [], [], 0
+        for para in text.split("\n\n"):
+            n = self.count_tokens(llm, para)
+            if n > piece_tokens:
+                para = self.truncate(llm, para, piece_tokens)
+                n = piece_tokens
+            if current and size + n > piece_tokens:
+                pieces.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(para)
+            size += n
+        if current:
+            pieces.append("\n\n".join(current))
+        return pieces
+
+    @staticmethod
+    def piece_tokens(context_window: int) -> int:
+        """Size of the pieces sent to the model for summarization."""
+        return max(1000, min(context_window - CONTEXT_RESERVE_TOKENS, 8000))
+
+    async def _map(self, llm, pieces: List[str], words: int) -> List[str]:
+        """Summaries of the pieces, in at most `words` words each."""
+        chain = ChatPromptTemplate.from_messages([("human", MAP_PROMPT)]) | llm | StrOutputParser()
+        semaphore = asyncio.Semaphore(self.map_concurrency)
+
+        async def summarize(piece: str) -> str:
+            async with semaphore:
+                return await chain.ainvoke({"text": piece, "words": words})
+
+        return list(await asyncio.gather(*(summarize(p) for p in pieces)))
+
+    async def _summarize(self, llm, text: str, max_tokens: int, piece_tokens: int) -> str:
+        """Map-reduce: summarize pieces concurrently and join them, again on the
+        summaries while over max_tokens, then cut what is still over."""
+        for _ in range(self.max_rounds):
+            if self.count_tokens(llm, text) <= max_tokens:
+                break
+            pieces = self._pieces(llm, text, piece_tokens)
+            # ~0.75 words per token
+            words = max(50, int(max_tokens / len(pieces) * 0.75))
+            text = "\n\n".join(await self._map(llm, pieces, words))
+        return self.truncate(llm, text, max_tokens)
+
+    async def summarize_document(
+        self, llm, text: str, context_window: int, max_tokens: int = SUMMARY_TOKENS
+    ) -> tuple:
+        """
+        Summaries of a document, computed once when it is indexed.
+
+        Returns:
+          tuple: (document summary, piece summaries); ("", []) for a document
+          short enough to be used as is.
+        """
+        if self.count_tokens(llm, text) <= max_tokens:
+            return "", []
+        pieces = self._pieces(llm, text, self.piece_tokens(context_window))
+        summaries = await self._map(llm, pieces, PIECE_SUMMARY_WORDS)
+        summary = await self._summarize(
+            llm, "\n\n".join(summaries), max_tokens, self.piece_tokens(context_window)
+        )
+        return summary, summaries
+
+    async def pack(
+        self,
+        llm,
+        documents: List[tuple],
+        budget_tokens: int,
+        context_window: int,
+        summarize: bool = True,
+        summaries: Optional[dict] = None,
+    ) -> str:
+        """
+        Args:
+          llm: the chat model, for counting tokens and summarizing.
+          documents: (asset id, label, full text) of each document, in order.
+          budget_tokens (int): tokens available for the context.
+          context_window (int): the model context window, bounding map inputs.
+          summarize (bool): condense documents over their share instead of
+            keeping only their start.
+          summaries (dict): asset id -> (document summary, piece summaries)
+            computed at indexing, used before summarizing anything.
+        """
+        summaries = summaries or {}
+        digest = hashlib.sha256()
+        for aid, _, text in documents:
+            digest.update(hashlib.sha256(text.encode("utf-8")).digest())
+            if aid in summaries:
+                digest.update(repr(summaries[aid]).encode("utf-8"))
+        key = (
+            tuple(aid for aid, _, _ in documents),
+            budget_tokens,
+            getattr(llm, "model_name", None) or type(llm).__name__,
+            summarize,
+            digest.hexdigest(),
+        )
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        headers = [f"# {label}\n\n" for _, label, _ in documents]
+        sizes = [self.count_tokens(llm, text) for _, _, text in documents]
+        available = max(0, budget_tokens - sum(self.count_tokens(llm, h) for h in headers))
+        shares = _fair_shares(sizes, available)
+        piece_tokens = self.piece_tokens(context_window)
+
+        async def fit(aid: str, text: str, size: int, share: int) -> str:
+            if size <= share:
+                return text
+            if not summarize or share <= 0:
+                return self.truncate(llm, text, share)
+            summary, pieces = summaries.get(aid) or ("", [])
+            if summary:
+                # the most detailed stored summary that fits, else reduce it
+                for candidate in ("\n\n".join(pieces), summary):
+                    if candidate and self.count_tokens(llm, candidate) <= share:
+                        return candidate
+                text = summary
+            return await self._summarize(llm, text, share, piece_tokens)
+
+        bodies = await asyncio.gather(
+            *(
+                fit(aid, text, size, share)
+                for (aid, _, text), size, share in zip(documents, sizes, shares)
+            )
+        )
+        context = "\n\n".join(h + b for h, b in zip(headers, bodies) if b)
+
+        with self._lock:
+            self._cache[key] = context
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return context
+
+
+_packer = ContextPacker()
+
+
+async def summarize_document(llm, text: str, context_window: int = 32768) -> tuple:
+    """(document summary, piece summaries) of a document, see
+    ContextPacker.summarize_document."""
+    return await _packer.summarize_document(llm, text, context_window)
+
+
 async def generate_answer(
     qq: PDFQuery,
     llm: ChatOpenAI | AzureChatOpenAI,
     retrieve: Callable[[str], Awaitable[List[Document]]],
-    get_full_text: Optional[Callable[[], str]] = None,
+    get_documents: Optional[Callable[[], List[tuple]]] = None,
     get_head: Optional[Callable[[], List[Document]]] = None,
     context_window: int = 32768,
+    get_summaries: Optional[Callable[[], Awaitable[dict]]] = None,
 ) -> str:
     """Answer a question over the indexed PDFs.
 
     Routing:
       - title/author/metadata questions -> the document head (first chunks),
         bypassing similarity (which misfires on the bibliography);
-      - broad questions (summaries, comparisons, "common topics") -> stuff the
-        labeled full text;
+      - broad questions (summaries, comparisons, "common topics") -> the
+        labeled full texts, packed into the context window (see ContextPacker);
       - everything else -> per-document retrieve + rerank, labeled by source.
+
+    `get_documents` returns (asset id, full text) for each document, and
+    `get_summaries` the summaries computed when they were indexed.
     """
-    budget_chars = max(0, context_window - CONTEXT_RESERVE_TOKENS) * CHARS_PER_TOKEN
+    budget_tokens = max(0, context_window - CONTEXT_RESERVE_TOKENS)
     doc_label = {aid: f"Document {i + 1}" for i, aid in enumerate(qq.assetids)}
 
+    async def full_text(summarize: bool) -> str:
+        documents = [
+            (aid, doc_label.get(aid, "Document"), text)
+            for aid, text in (get_documents() or [])
+        ]
+        summaries = await get_summaries() if summarize and get_summaries else None
+        return await _packer.pack(
+            llm,
+            documents,
+            budget_tokens,
+            context_window,
+            summarize=summarize,
+            summaries=summaries,
+        )
+
     # Prior turns of this conversation, so follow-up questions ("expand on that",
     # "what about its limitations?") have the context they refer to.
     history = []
@@ -205,18 +706,19 @@ async def generate_answer(
     if _is_head(qq.q) and get_head:
         # Title/authors/venue live at the document start — serve it directly.
         context = _format_context(get_head(), doc_label)
-    elif _is_broad(qq.q) and get_full_text:
-        # Breadth matters more than precision — stuff the labeled document(s).
-        context = (get_full_text() or "")[:budget_chars]
+    elif _is_broad(qq.q) and get_documents:
+        # Breadth matters more than precision — stuff the labeled document(s),
+        # summarizing those that don't fit.
+        context = await full_text(summarize=True)
     else:
         # Specific question — per-document retrieve + rerank (done by `retrieve`),
         # then label each chunk by source document.
         candidates = await retrieve(qq.q)
         if candidates:
             context = _format_context(candidates, doc_label)
-        elif get_full_text:
+        elif get_documents:
             # Nothing retrieved — fall back to the start of the document(s).
-            context = (get_full_text() or "")[:budget_chars]
+            context = await full_text(summarize=False)
         else:
             context = ""
 
@@ -22,6 +22,7 @@ from zoneinfo import ZoneInfo
 import pymupdf4llm
 import pymupdf
 from io import BytesIO
+from libs.pdf.md_cache import get_md_cache, content_hash
 
 
 class DotDict(dict):
@@ -151,16 +152,8 @@ APP_CONTENT_FIELDS = {
 
 
 def getApp(ps3, app_id):
-    """Fetch a single app document by id from the SAGE3 server, or None."""
-    url = (
-        ps3.s3_comm.conf[ps3.s3_comm.prod_type]["web_server"] + "/api/apps/" + app_id
-    )
-    headers = ps3.s3_comm._SageCommunication__headers
-    r = ps3.s3_comm.httpx_client.get(url, headers=headers)
-    if r.is_success:
-        data = r.json().get("data") or []
-        return data[0] if data else None
-    return None
+    """Fetch a single app document by id (from the live mirror when synchronized), or None."""
+    return ps3.get_app(app_id)
 
 
 def getAppContent(ps3, app_id):
@@ -263,7 +256,7 @@ def getAssets(ps3, room_id=None):
     Retrieve a list of assets from the given ps3 object, optionally filtered by room_id.
 
     Args:
-      ps3 (object): An object that contains the s3_comm attribute with a method get_assets().
+      ps3 (object): SAGE3 API handle. Served from its live mirror when synchronized.
       room_id (str, optional): The ID of the room to filter assets by. Defaults to None.
 
     Returns:
@@ -304,9 +297,16 @@ def getAssets(ps3, room_id=None):
             "metadata": "126bf2b1-24b5-477a-82a0-e36b82574ef7.jpg.json",
         }
     """
-    assets = ps3.s3_comm.get_assets()
-    if room_id is not None:
-        assets = [x for x in assets if x["data"]["room"] == room_id]
+    if ps3.mirror_synchronized():
+        assets = (
+            ps3.store.get_assets_by_room(room_id)
+            if room_id is not None
+            else list(ps3.assets.values())
+        )
+    else:
+        assets = ps3.s3_comm.get_assets()
+        if room_id is not None:
+            assets = [x for x in assets if x["data"]["room"] == room_id]
     assets_info = []
     for asset in assets:
         assets_info.append(DotDict(asset))
@@ -338,26 +338,9 @@ def getUsers(ps3):
     return None
 
 
-def mdCachePath(asset_id):
-    """
-    Build the /tmp/{id}.md cache path for a PDF asset, rejecting ids that
-    would escape /tmp (path injection). Asset ids come from client requests,
-    so they must be treated as untrusted.
-    """
-    name = str(asset_id)
-    if not re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9._-]*", name):
-        raise ValueError(f"Invalid asset id: {asset_id!r}")
-    # /tmp may itself be a symlink (e.g. /private/tmp on macOS)
-    base = os.path.realpath("/tmp")
-    path = os.path.realpath(os.path.join(base, name + ".md"))
-    if not path.startswith(base + os.sep):
-        raise ValueError(f"Invalid asset id: {asset_id!r}")
-    return path
-
-
 def getMDfromPDF(id, content):
     """
-    Converts a PDF content to Markdown format and caches the result in a temporary file.
+    Converts a PDF content to Markdown format and caches the result.
 
     Args:
       id (str): A unique identifier for the PDF content.
@@ -366,14 +349,13 @@ def getMDfromPDF(id, content):
     Returns:
       str: The Markdown representation of the PDF content.
 
-    If the Markdown file already exists in the temporary directory, it reads and returns the content from the file.
-    Otherwise, it converts the PDF content to Markdown, writes it to a temporary file, and returns the Markdown content.
+    The conversion is looked up in the shared Markdown cache (libs/pdf/md_cache.py),
+    keyed by the content hash, and stored there after converting it.
     """
-    file_path = mdCachePath(id)
-    if os.path.exists(file_path):
-        with open(file_path, "r") as file:
-            return file.read()
-    else:
+    cache = get_md_cache()
+    digest = content_hash(content)
+    md = cache.get(digest, "pymupdf4llm")
+    if md is None:
         md = pymupdf4llm.to_markdown(
             pymupdf.open(stream=BytesIO(content), filetype="pdf"),
             write_images=False,
@@ -382,9 +364,8 @@ def getMDfromPDF(id, content):
             graphics_limit=500,
             show_progress=True,
         )
-        with open(file_path, "w") as file:
-            file.write(md)
-        return md
+        cache.put(digest, "pymupdf4llm", md)
+    return md
 
 
 def getPDFFile(ps3, assetid):
@@ -399,24 +380,22 @@ def getPDFFile(ps3, assetid):
       bytes: The content of the PDF file if found and successfully downloaded.
       None: If the asset is not found or the download fails.
     """
-    # Get all the assets
-    assets = ps3.s3_comm.get_assets()
-    # Find the asset
-    for f in assets:
-        if f["_id"] == assetid:
-            asset = f["data"]
-            # Build the URL
-            url = (
-                ps3.s3_comm.conf[ps3.s3_comm.prod_type]["files_server"]
-                + ps3.s3_comm.routes["get_static_content"]
-                + asset["file"]
-            )
-            # Get the authorization headers
-            headers = ps3.s3_comm._SageCommunication__headers
-            # Download the PDF
-            r = ps3.s3_comm.httpx_client.get(url, headers=headers)
-            if r.is_success:
-                return r.content
+    # Find the asset (local mirror, or a single-document REST lookup)
+    f = ps3.get_asset(assetid)
+    if f:
+        asset = f["data"]
+        # Build the URL
+        url = (
+            ps3.s3_comm.conf[ps3.s3_comm.prod_type]["files_server"]
+            + ps3.s3_comm.routes["get_static_content"]
+            + asset["file"]
+        )
+        # Get the authorization headers
+        headers = ps3.s3_comm._SageCommunication__headers
+        # Download the PDF
+        r = ps3.s3_comm.httpx_client.get(url, headers=headers)
+        if r.is_success:
+            return r.content
     return None
 
 
@@ -440,18 +419,28 @@ def isValidPDFDocument(document):
         return False
 
 
-def convertPDFToImages(doc):
-    """Convert PDF pages to Base64-encoded images."""
-    images = []
+def iterPDFPageImages(doc, pages=None, dpi=150):
+    """
+    Lazily render PDF pages to Base64-encoded JPEG images.
+
+    Args:
+      doc (pymupdf.Document): The opened PDF.
+      pages (list): Page numbers to render, all pages by default.
+      dpi (int): Rendering resolution.
 
-    for page_num in range(len(doc)):
+    Yields:
+      tuple: (page number, Base64 image), one page rendered at a time.
+    """
+    for page_num in range(len(doc)) if pages is None else pages:
         page = doc[page_num]
-        pixmap = page.get_pixmap(dpi=150)  # Adjust DPI for quality
+        pixmap = page.get_pixmap(dpi=dpi)  # Adjust DPI for quality
         image_bytes = pixmap.tobytes("jpeg")  # Save as JPEG
-        image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-        images.append(image_base64)
+        yield page_num, base64.b64encode(image_bytes).decode("utf-8")
+
 
-    return images
+def convertPDFToImages(doc):
+    """Convert PDF pages to Base64-encoded images."""
+    return [image for _, image in iterPDFPageImages(doc)]
 
 
 def isDataURL(string):
@@ -590,21 +579,19 @@ def getImageFile(ps3, assetid):
       bytes: The content of the image file if found and successfully downloaded.
       None: If the asset is not found or the download fails.
     """
-    # Get all the assets
-    assets = ps3.s3_comm.get_assets()
-    # Find the asset in question
-    for f in assets:
-        if f["_id"] == assetid:
-            asset = f["data"]
-            url = (
-                ps3.s3_comm.conf[ps3.s3_comm.prod_type]["files_server"]
-                + ps3.s3_comm.routes["get_static_content"]
-                + asset["file"]
-            )
-            headers = ps3.s3_comm._SageCommunication__headers
-            r = ps3.s3_comm.httpx_client.get(url, headers=headers)
-            if r.is_success:
-                return r.content
+    # Find the asset in question (local mirror, or a single-document REST lookup)
+    f = ps3.get_asset(assetid)
+    if f:
+        asset = f["data"]
+        url = (
+            ps3.s3_comm.conf[ps3.s3_comm.prod_type]["files_server"]
+            + ps3.s3_comm.routes["get_static_content"]
+            + asset["file"]
+        )
+        headers = ps3.s3_comm._SageCommunication__headers
+        r = ps3.s3_comm.httpx_client.get(url, headers=headers)
+        if r.is_success:
+            return r.content
     return None
 
 
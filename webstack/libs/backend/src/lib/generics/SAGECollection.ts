@@ -159,6 +159,39 @@ export class SAGE3Collection<T extends SBJSON> {
     }
   }
 
+  /**
+   * Query the collection on several fields, one page at a time
+   * @param filters The property fields and the values they must match
+   * @param options since: only docs updated after this timestamp, offset/limit: the page window
+   * @returns The page of documents and the total number of matches if successful. Otherwise undefined
+   */
+  public async search(
+    filters: { [key: string]: string | number },
+    options?: { since?: number; offset?: number; limit?: number }
+  ): Promise<{ docs: SBDocument<T>[]; total: number } | undefined> {
+    try {
+      const res = await this._collection.search(filters, options);
+      return res;
+    } catch (error) {
+      this.printError(error);
+      return undefined;
+    }
+  }
+
+  /**
+   * The ids of the documents deleted since a time
+   * @param since Deletion time (ms) to start from
+   * @returns The ids and whether they are all the deletions since then if successful. Otherwise undefined
+   */
+  public async deletedSince(since: number): Promise<{ ids: string[]; complete: boolean } | undefined> {
+    try {
+      return await this._collection.deletedSince(since);
+    } catch (error) {
+      this.printError(error);
+      return undefined;
+    }
+  }
+
   /**
    * Update a document in the collection
    * @param id The id of the document to update
@@ -14,6 +14,11 @@ import { SAGE3Collection } from './SAGECollection';
 
 import { checkPermissionsREST, AuthSubject } from './permissions';
 
+// Query parameters that control paging instead of filtering on a field
+const PAGING_PARAMS = ['_since', '_offset', '_limit'];
+// Page size of a search without _limit, the client follows `next` for the rest
+const DEFAULT_PAGE_SIZE = 5000;
+
 export function sageRouter<T extends SBJSON>(collection: SAGE3Collection<T>): express.Router {
   const router = express.Router();
 
@@ -36,22 +41,55 @@ export function sageRouter<T extends SBJSON>(collection: SAGE3Collection<T>): ex
     }
   });
 
-  // GET: Get all the docs, multiple docs by id, or query
+  // GET: Get all the docs, multiple docs by id, query (one field, or several fields with paging), or the ids deleted since a time
   router.get('/', async ({ query, body }, res) => {
     let docs = null;
     // If body has property 'batch', this is a batch request
     if (body && body.batch) {
       docs = await collection.getBatch(body.batch);
     }
+    // Ids deleted since a time, for the clients catching up after a disconnection
+    else if ('_deletedSince' in query) {
+      const since = Number(query._deletedSince);
+      const deleted = isNaN(since) ? undefined : await collection.deletedSince(since);
+      if (deleted) {
+        res.status(200).send({ success: true, message: 'Successfully retrieved deleted ids.', data: deleted.ids, complete: deleted.complete });
+      } else {
+        res.status(500).send({ success: false, message: 'Failed to retrieve deleted ids.', data: undefined });
+      }
+      return;
+    }
+    // Several fields or paging parameters: filtered, paged search
+    else if (Object.keys(query).length > 1 || PAGING_PARAMS.some((p) => p in query)) {
+      const filters = {} as { [key: string]: string };
+      Object.keys(query)
+        .filter((field) => !PAGING_PARAMS.includes(field))
+        .forEach((field) => (filters[field] = query[field] as string));
+      const since = query._since !== undefined ? Number(query._since) : undefined;
+      const offset = query._offset !== undefined ? Number(query._offset) : 0;
+      const limit = query._limit !== undefined ? Number(query._limit) : DEFAULT_PAGE_SIZE;
+      if ([since, offset, limit].some((v) => v !== undefined && isNaN(v))) {
+        res.status(500).send({ success: false, message: 'Invalid paging parameters.', data: undefined });
+        return;
+      }
+      const page = await collection.search(filters, { since, offset, limit });
+      if (page) {
+        // Offset of the next page, when there is one
+        const end = offset + limit;
+        const next = end < page.total ? end : undefined;
+        res.status(200).send({ success: true, message: 'Successfully retrieved documents.', data: page.docs, total: page.total, next });
+      } else {
+        res.status(500).send({ success: false, message: 'Failed to retrieve documents.', data: undefined });
+      }
+      return;
+    }
     // Check for a query, if not query get all the docs
     else if (Object.keys(query).length === 0) {
       docs = await collection.getAll();
-    } else if (Object.keys(query).length === 1) {
+    } else {
       const field = Object.keys(query)[0];
       const q = query[field] as string | number;
       docs = await collection.query(field, q);
-    } else {
-      res.status(500).send({ success: false, message: 'Too many query parameters. Only one query parameter allowed.', data: undefined });
     }
     if (docs) res.status(200).send({ success: true, message: 'Successfully retrieved documents.', data: docs });
     else res.status(500).send({ success: false, message: 'Failed to retrieve documents.', data: undefined });
@@ -18,6 +18,8 @@ import {
   SBDocumentUpdateMessage,
   SBDocWriteResult,
   SBJSON,
+  TOMBSTONE_TTL,
+  tombstonesKey,
 } from './SBDocument';
 
 /**
@@ -330,6 +332,63 @@ export class SBCollectionRef<Type extends SBJSON> {
     }
   }
 
+  /**
+   * Query the collection on several fields at once, one page at a time.
+   * Fields are exact matches combined with AND, like `query`.
+   * @param {object} filters Indexed property names and the value each must equal
+   * @param {object} options `since`: only documents with a larger _updatedAt, `offset`/`limit`: the page window
+   * @returns {Promise<{ docs: SBDocument<Type>[]; total: number }>} The documents of the page and the total number of matches.
+   * @throws The RediSearch error when the search fails
+   */
+  public async search(
+    filters: { [key: string]: string | number },
+    options: { since?: number; offset?: number; limit?: number } = {}
+  ): Promise<{ docs: SBDocument<Type>[]; total: number }> {
+    try {
+      const terms = Object.keys(filters).map((propertyName) => {
+        let query = filters[propertyName];
+        if (typeof query === 'string') query = `{${query.replace(/[#-.@]/g, '\\$&')}}`;
+        if (typeof query === 'number') query = `[${query} ${query}]`;
+        return `@${propertyName}:${query}`;
+      });
+      if (options.since !== undefined) terms.push(`@_updatedAt:[(${options.since} +inf]`);
+      const response = await this._redisClient.ft.search(this._indexName, terms.length > 0 ? terms.join(' ') : '*', {
+        LIMIT: { from: options.offset ?? 0, size: options.limit ?? 5000 },
+      });
+      const docRefPromises = response.documents.map((el) =>
+        new SBDocumentRef<Type>(el.value['_id'] as string, this._name, el.id, this._redisClient).read()
+      );
+      const docs = await Promise.all([...docRefPromises]);
+      const a = [] as SBDocument<Type>[];
+      docs.forEach((el) => {
+        if (el !== undefined && el !== null) a.push(el);
+      });
+      return { docs: a, total: response.total };
+    } catch (error) {
+      this.ERRORLOG(error);
+      // an index or query error must not pass for "no match"
+      throw error;
+    }
+  }
+
+  /**
+   * The ids of the documents deleted since a time, for a client catching up after a
+   * disconnection. Ids deleted then created again are left out.
+   * @param {number} since Deletion time (ms) to start from
+   * @returns {Promise<{ ids: string[]; complete: boolean }>} The ids, and false for `complete` when
+   * the log doesn't go back to `since`: the deletions then have to be found from a full listing.
+   */
+  public async deletedSince(since: number): Promise<{ ids: string[]; complete: boolean }> {
+    const key = tombstonesKey(this._path);
+    // start the log if no deletion did yet, it covers everything from now on
+    await this._redisClient.set(`${key}:start`, Date.now(), { NX: true });
+    const start = Number(await this._redisClient.get(`${key}:start`));
+    const complete = since >= Math.max(start, Date.now() - TOMBSTONE_TTL);
+    const deleted = await this._redisClient.zRangeByScore(key, `(${since}`, '+inf');
+    const exists = await Promise.all(deleted.map((id) => this._redisClient.exists(`${this._path}:${id}`)));
+    return { ids: deleted.filter((_, i) => exists[i] === 0), complete };
+  }
+
   // publish the delete action to the subscribers
   private async publishCreateAction(docs: SBDocument<Type>[]): Promise<void> {
     const action = {
@@ -59,6 +59,18 @@ export type SBDocumentMessage<Type extends SBJSON> =
   | SBDocumentUpdateMessage<Type>
   | SBDocumentDeleteMessage<Type>;
 
+// How long (ms) the ids of deleted documents are kept for the clients catching up
+export const TOMBSTONE_TTL = 7 * 24 * 3600 * 1000;
+
+/**
+ * Key of the sorted set of the ids deleted from a collection, scored by deletion time.
+ * Kept outside the collection prefix so it is neither indexed nor listed with the documents.
+ * @param {string} collectionPath The REDIS path of the collection
+ */
+export function tombstonesKey(collectionPath: string): string {
+  return `DELETED:${collectionPath}`;
+}
+
 /**
  * A database reference to the SAGEBase Document.
  */
@@ -258,6 +270,9 @@ export class SBDocumentRef<Type extends SBJSON> {
       }
       const redisRes = await this._redisClient.json.del(`${this.path}`);
       const res = redisRes === undefined || redisRes === 0 ? false : true;
+      if (res === true) {
+        await this.recordTombstone();
+      }
       if (res === true && publish) {
         await this.publishDeleteAction(oldValue);
       }
@@ -284,6 +299,16 @@ export class SBDocumentRef<Type extends SBJSON> {
     };
   }
 
+  // Records the deletion for the clients that were disconnected, see SBCollectionRef.deletedSince
+  private async recordTombstone(): Promise<void> {
+    const key = tombstonesKey(this._path.slice(0, -(this._id.length + 1)));
+    const now = Date.now();
+    // the log holds every deletion after its start
+    await this._redisClient.set(`${key}:start`, now, { NX: true });
+    await this._redisClient.zAdd(key, { score: now, value: this._id });
+    await this._redisClient.zRemRangeByScore(key, '-inf', now - TOMBSTONE_TTL);
+  }
+
   private async publishCreateAction(doc: SBDocument<Type>): Promise<void> {
     const action = {
       type: 'CREATE',